@@ -0,0 +1,90 @@
+"""Benchmark file size and I/O time of raw photodetector traces stored as float64 vs quantized integers.
+
+Run from the repository root with ``python benchmarks/benchmark_quantization.py``.
+"""
+
+import os
+import tempfile
+import time
+
+import numpy as np
+from hdmf.backends.hdf5 import H5DataIO
+from pynwb import NWBHDF5IO
+from pynwb.testing.mock.file import mock_NWBFile
+
+from ndx_fiber_photometry import FiberPhotometryResponseSeries, quantize_data
+
+RATE = 1000.0
+DURATION_IN_S = 600.0
+NUM_FIBERS = 4
+ADC_BITS = 16
+ADC_FULL_SCALE_IN_VOLTS = 10.0
+
+
+def make_raw_trace(seed=0):
+    """Return a bleaching, noisy, transient-bearing trace digitized by a 16-bit +/-10 V ADC."""
+    rng = np.random.default_rng(seed)
+    num_samples = int(RATE * DURATION_IN_S)
+    time_in_s = np.arange(num_samples) / RATE
+    bleaching = 1.5 + 0.5 * np.exp(-time_in_s / 200.0)
+    transients = np.zeros((num_samples, NUM_FIBERS))
+    onsets = rng.integers(0, num_samples, (200, NUM_FIBERS))
+    for fiber in range(NUM_FIBERS):
+        transients[onsets[:, fiber], fiber] = rng.uniform(0.05, 0.2, 200)
+    kernel = np.exp(-np.arange(int(2 * RATE)) / (0.4 * RATE))
+    transients = np.stack([np.convolve(transients[:, i], kernel)[:num_samples] for i in range(NUM_FIBERS)], axis=1)
+    analog = bleaching[:, np.newaxis] + transients + rng.normal(0.0, 0.005, (num_samples, NUM_FIBERS))
+    step = 2 * ADC_FULL_SCALE_IN_VOLTS / 2**ADC_BITS
+    return np.round(analog / step) * step
+
+
+def write(path, data, compression, **kwargs):
+    nwbfile = mock_NWBFile()
+    chunks = (min(len(data), 10_000), NUM_FIBERS)
+    nwbfile.add_acquisition(
+        FiberPhotometryResponseSeries(
+            name="raw",
+            description="raw photodetector output",
+            data=H5DataIO(data, compression=compression, chunks=chunks),
+            unit="volts",
+            rate=RATE,
+            **kwargs,
+        )
+    )
+    start = time.perf_counter()
+    with NWBHDF5IO(path, mode="w") as io:
+        io.write(nwbfile)
+    return time.perf_counter() - start
+
+
+def read(path):
+    with NWBHDF5IO(path, mode="r") as io:
+        series = io.read().acquisition["raw"]
+        start = time.perf_counter()
+        series.get_data_in_units()
+        return time.perf_counter() - start
+
+
+def main():
+    raw = make_raw_trace()
+    quantized = quantize_data(raw)
+    print("%d samples x %d fibers, quantized to %s" % (raw.shape[0], raw.shape[1], quantized.data.dtype))
+    print("%-10s  %-11s  %10s  %10s  %9s" % ("layout", "compression", "size (MB)", "write (s)", "read (s)"))
+    with tempfile.TemporaryDirectory() as tmpdir:
+        for compression in (None, "gzip"):
+            for layout in ("float64", "quantized"):
+                path = os.path.join(tmpdir, "%s_%s.nwb" % (layout, compression))
+                if layout == "float64":
+                    write_time = write(path, raw, compression)
+                else:
+                    write_time = write(
+                        path, quantized.data, compression, conversion=quantized.conversion, offset=quantized.offset
+                    )
+                print(
+                    "%-10s  %-11s  %10.1f  %10.3f  %9.3f"
+                    % (layout, compression, os.path.getsize(path) / 1e6, write_time, read(path))
+                )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""Benchmark reading the reference columns of a FiberPhotometryTable, standard vs dictionary-encoded layout.
+
+Run from the repository root with ``python benchmarks/benchmark_reference_columns.py``.
+"""
+
+import os
+import tempfile
+import time
+import warnings
+
+from pynwb import NWBHDF5IO
+from pynwb.testing.mock.file import mock_NWBFile
+from ndx_ophys_devices import (
+    Indicator,
+    OpticalFiberModel,
+    FiberInsertion,
+    OpticalFiber,
+    ExcitationSourceModel,
+    ExcitationSource,
+    PhotodetectorModel,
+    Photodetector,
+    DichroicMirrorModel,
+    DichroicMirror,
+)
+from ndx_fiber_photometry import (
+    FiberPhotometry,
+    FiberPhotometryIndicators,
+    FiberPhotometryTable,
+    create_encoded_fiber_photometry_table,
+)
+from ndx_fiber_photometry.fiber_photometry import REQUIRED_REFERENCE_COLUMNS
+
+NUM_ROWS = (100, 1_000, 10_000)
+NUM_FIBERS = 96
+REPEATS = 3
+
+
+def make_nwbfile(num_rows, encoded):
+    nwbfile = mock_NWBFile()
+    indicator = Indicator(name="indicator", label="GCaMP6f")
+    models = [
+        OpticalFiberModel(name="optical_fiber_model", manufacturer="manufacturer", numerical_aperture=0.39),
+        ExcitationSourceModel(
+            name="excitation_source_model", manufacturer="manufacturer", source_type="LED", excitation_mode="one-photon"
+        ),
+        PhotodetectorModel(name="photodetector_model", manufacturer="manufacturer", detector_type="photodiode"),
+        DichroicMirrorModel(name="dichroic_mirror_model", manufacturer="manufacturer"),
+    ]
+    for model in models:
+        nwbfile.add_device_model(model)
+    fibers = [
+        OpticalFiber(
+            name="optical_fiber_%d" % i, model=models[0], fiber_insertion=FiberInsertion(name="fiber_insertion")
+        )
+        for i in range(NUM_FIBERS)
+    ]
+    excitation_source = ExcitationSource(name="excitation_source", model=models[1])
+    photodetector = Photodetector(name="photodetector", model=models[2])
+    dichroic_mirror = DichroicMirror(name="dichroic_mirror", model=models[3])
+    for device in fibers + [excitation_source, photodetector, dichroic_mirror]:
+        nwbfile.add_device(device)
+
+    if encoded:
+        table = create_encoded_fiber_photometry_table(description="benchmark")
+    else:
+        table = FiberPhotometryTable(name="fiber_photometry_table", description="benchmark")
+    for row in range(num_rows):
+        table.add_row(
+            location="VTA",
+            excitation_wavelength_in_nm=470.0,
+            emission_wavelength_in_nm=525.0,
+            indicator=indicator,
+            optical_fiber=fibers[row % NUM_FIBERS],
+            excitation_source=excitation_source,
+            photodetector=photodetector,
+            dichroic_mirror=dichroic_mirror,
+            check_ragged=False,
+        )
+    table_slot = "encoded_fiber_photometry_table" if encoded else "fiber_photometry_table"
+    nwbfile.add_lab_meta_data(
+        FiberPhotometry(
+            name="fiber_photometry",
+            **{table_slot: table},
+            fiber_photometry_indicators=FiberPhotometryIndicators(indicators=[indicator]),
+        )
+    )
+    return nwbfile
+
+
+def time_read(path):
+    """Return the best time to construct the table and read all its reference columns, excluding file opening."""
+    best = float("inf")
+    for _ in range(REPEATS):
+        with NWBHDF5IO(path, mode="r") as io:
+            start = time.perf_counter()
+            table = io.read().lab_meta_data["fiber_photometry"].get_fiber_photometry_table()
+            for column_name in REQUIRED_REFERENCE_COLUMNS:
+                table[column_name][:]
+            best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    warnings.simplefilter("ignore")
+    with tempfile.TemporaryDirectory() as tmpdir:
+        print("%8s  %12s  %12s  %8s" % ("rows", "standard (s)", "encoded (s)", "speedup"))
+        for num_rows in NUM_ROWS:
+            timings = []
+            for encoded in (False, True):
+                path = os.path.join(tmpdir, "table_%d_%d.nwb" % (num_rows, encoded))
+                with NWBHDF5IO(path, mode="w") as io:
+                    io.write(make_nwbfile(num_rows, encoded))
+                timings.append(time_read(path))
+            print("%8d  %12.3f  %12.3f  %7.1fx" % (num_rows, timings[0], timings[1], timings[0] / timings[1]))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,217 @@
+"""Benchmark the number of HTTP range requests and the latency of reading fiber photometry metadata remotely.
+
+A local HTTP server with an artificial round-trip latency stands in for an object store. Each configuration reads the
+``FiberPhotometry`` metadata as a dataframe and a few seconds of one fiber.
+
+Run from the repository root with ``python benchmarks/benchmark_remote.py``.
+"""
+
+import io
+import os
+import tempfile
+import threading
+import time
+import urllib.request
+from functools import partial
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+import h5py
+import numpy as np
+from pynwb import NWBHDF5IO
+from pynwb.testing.mock.file import mock_NWBFile
+from ndx_ophys_devices import (
+    Indicator,
+    OpticalFiberModel,
+    FiberInsertion,
+    OpticalFiber,
+    ExcitationSourceModel,
+    ExcitationSource,
+    PhotodetectorModel,
+    Photodetector,
+    DichroicMirrorModel,
+    DichroicMirror,
+)
+from ndx_fiber_photometry import (
+    FiberPhotometry,
+    FiberPhotometryIndicators,
+    FiberPhotometryTable,
+    FiberPhotometryResponseSeries,
+    open_remote_nwbfile,
+)
+
+LATENCY_IN_S = 0.02
+NUM_FIBERS = 16
+NUM_SAMPLES = 600_000
+RATE = 1000.0
+
+
+class LatencyRangeRequestHandler(SimpleHTTPRequestHandler):
+    """Serve single byte range requests after sleeping for ``LATENCY_IN_S``."""
+
+    def do_GET(self):
+        time.sleep(LATENCY_IN_S)
+        start, stop = (int(value) for value in self.headers["Range"].split("=")[1].split("-"))
+        with open(self.translate_path(self.path), "rb") as f:
+            f.seek(start)
+            body = f.read(stop - start + 1)
+        self.send_response(206)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class HTTPRangeFetcher:
+
+    def __init__(self, url, size):
+        self.url = url
+        self.size = size
+
+    def fetch(self, start, stop):
+        request = urllib.request.Request(self.url, headers={"Range": "bytes=%d-%d" % (start, stop - 1)})
+        with urllib.request.urlopen(request) as response:
+            return response.read()
+
+
+class UncachedRangeFile(io.RawIOBase):
+    """Send one range request per read, as a plain remote file object without a cache does."""
+
+    def __init__(self, fetcher):
+        super().__init__()
+        self.fetcher = fetcher
+        self.num_requests = 0
+        self.bytes_fetched = 0
+        self._position = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._position
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        self._position = {io.SEEK_SET: 0, io.SEEK_CUR: self._position, io.SEEK_END: self.fetcher.size}[whence] + offset
+        return self._position
+
+    def readinto(self, buffer):
+        stop = min(self._position + len(buffer), self.fetcher.size)
+        if stop <= self._position:
+            return 0
+        data = self.fetcher.fetch(self._position, stop)
+        self.num_requests += 1
+        self.bytes_fetched += len(data)
+        memoryview(buffer).cast("B")[: len(data)] = data
+        self._position += len(data)
+        return len(data)
+
+
+def make_nwbfile():
+    nwbfile = mock_NWBFile()
+    indicator = Indicator(name="indicator", label="GCaMP6f")
+    optical_fiber_model = OpticalFiberModel(
+        name="optical_fiber_model", manufacturer="Fiber Manufacturer", numerical_aperture=0.39
+    )
+    excitation_source_model = ExcitationSourceModel(
+        name="excitation_source_model", manufacturer="LED Manufacturer", source_type="LED", excitation_mode="one-photon"
+    )
+    photodetector_model = PhotodetectorModel(
+        name="photodetector_model", manufacturer="Detector Manufacturer", detector_type="photodiode"
+    )
+    dichroic_mirror_model = DichroicMirrorModel(name="dichroic_mirror_model", manufacturer="Mirror Manufacturer")
+    excitation_source = ExcitationSource(name="excitation_source", model=excitation_source_model)
+    photodetector = Photodetector(name="photodetector", model=photodetector_model)
+    dichroic_mirror = DichroicMirror(name="dichroic_mirror", model=dichroic_mirror_model)
+    for model in (optical_fiber_model, excitation_source_model, photodetector_model, dichroic_mirror_model):
+        nwbfile.add_device_model(model)
+    for device in (excitation_source, photodetector, dichroic_mirror):
+        nwbfile.add_device(device)
+    table = FiberPhotometryTable(name="fiber_photometry_table", description="fiber photometry table")
+    for index in range(NUM_FIBERS):
+        optical_fiber = OpticalFiber(
+            name="optical_fiber_%d" % index,
+            model=optical_fiber_model,
+            fiber_insertion=FiberInsertion(name="fiber_insertion", insertion_position_ml_in_mm=0.1 * index),
+        )
+        nwbfile.add_device(optical_fiber)
+        table.add_row(
+            location="VTA",
+            excitation_wavelength_in_nm=470.0,
+            emission_wavelength_in_nm=525.0,
+            indicator=indicator,
+            optical_fiber=optical_fiber,
+            excitation_source=excitation_source,
+            photodetector=photodetector,
+            dichroic_mirror=dichroic_mirror,
+        )
+    nwbfile.add_lab_meta_data(
+        FiberPhotometry(
+            name="fiber_photometry",
+            fiber_photometry_table=table,
+            fiber_photometry_indicators=FiberPhotometryIndicators(indicators=[indicator]),
+        )
+    )
+    nwbfile.add_acquisition(
+        FiberPhotometryResponseSeries(
+            name="signal",
+            description="raw fluorescence",
+            data=np.random.default_rng(0).standard_normal((NUM_SAMPLES, NUM_FIBERS)),
+            unit="n.a.",
+            rate=RATE,
+            fiber_photometry_table_region=table.create_fiber_photometry_table_region(
+                region=range(NUM_FIBERS), description="all fibers"
+            ),
+        )
+    )
+    return nwbfile
+
+
+def read(nwb_io):
+    nwbfile = nwb_io.read()
+    nwbfile.lab_meta_data["fiber_photometry"].get_fiber_photometry_table().to_dataframe()
+    nwbfile.acquisition["signal"].data[: int(5 * RATE), 0]
+
+
+def main():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        path = os.path.join(tmpdir, "remote.nwb")
+        with NWBHDF5IO(path, mode="w") as nwb_io:
+            nwb_io.write(make_nwbfile())
+        size = os.path.getsize(path)
+        server = ThreadingHTTPServer(("127.0.0.1", 0), partial(LatencyRangeRequestHandler, directory=tmpdir))
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        url = "http://127.0.0.1:%d/remote.nwb" % server.server_address[1]
+        print("%.1f MB file, %.0f ms per request" % (size / 1e6, LATENCY_IN_S * 1e3))
+        print("%-30s  %8s  %10s  %8s" % ("configuration", "requests", "fetched MB", "time (s)"))
+
+        configurations = [
+            ("uncached", None),
+            ("block cache", dict(prefetch_metadata=False)),
+            ("block cache + prefetch", dict()),
+            ("block cache + prefetch, reopen", dict()),
+        ]
+        try:
+            for name, kwargs in configurations:
+                start = time.perf_counter()
+                if kwargs is None:
+                    remote_file = UncachedRangeFile(HTTPRangeFetcher(url, size))
+                    nwb_io = NWBHDF5IO(file=h5py.File(remote_file, mode="r"), mode="r", load_namespaces=True)
+                else:
+                    nwb_io, remote_file = open_remote_nwbfile(HTTPRangeFetcher(url, size), **kwargs)
+                with nwb_io:
+                    read(nwb_io)
+                print(
+                    "%-30s  %8d  %10.2f  %8.2f"
+                    % (name, remote_file.num_requests, remote_file.bytes_fetched / 1e6, time.perf_counter() - start)
+                )
+        finally:
+            server.shutdown()
+            server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+"""Benchmark transient detection time against recording duration, up to 24 hours.
+
+Run from the repository root with ``python benchmarks/benchmark_transients.py``.
+"""
+
+import time
+
+import numpy as np
+from hdmf.common import DynamicTableRegion
+
+from ndx_fiber_photometry import FiberPhotometryResponseSeries, FiberPhotometryTable, detect_transients
+
+RATE = 20.0
+NUM_FIBERS = 8
+DURATIONS_IN_H = (1, 6, 24)
+TRANSIENTS_PER_MINUTE = 5
+
+
+def make_series(duration_in_h, seed=0):
+    rng = np.random.default_rng(seed)
+    num_samples = int(duration_in_h * 3600 * RATE)
+    time_in_s = np.arange(num_samples) / RATE
+    data = (1.0 + 0.5 * np.exp(-time_in_s / 3600.0))[:, np.newaxis] + rng.normal(0.0, 0.005, (num_samples, NUM_FIBERS))
+    kernel = 0.1 * np.exp(-np.arange(int(2 * RATE)) / (0.3 * RATE))
+    num_transients = int(duration_in_h * 60 * TRANSIENTS_PER_MINUTE)
+    for fiber in range(NUM_FIBERS):
+        impulses = np.zeros(num_samples)
+        impulses[rng.integers(0, num_samples, num_transients)] = 1.0
+        data[:, fiber] += np.convolve(impulses, kernel)[:num_samples]
+    # the detection only needs the row indices of the region, not a populated table
+    region = DynamicTableRegion(
+        name="fiber_photometry_table_region",
+        data=list(range(NUM_FIBERS)),
+        description="all fibers",
+        table=FiberPhotometryTable(name="fiber_photometry_table", description="fiber photometry table"),
+    )
+    return FiberPhotometryResponseSeries(
+        name="fluorescence",
+        description="simulated fluorescence",
+        data=data,
+        unit="n.a.",
+        rate=RATE,
+        fiber_photometry_table_region=region,
+    )
+
+
+def main():
+    print("%d fibers at %g Hz" % (NUM_FIBERS, RATE))
+    print("%-14s  %12s  %10s  %10s  %12s" % ("duration (h)", "samples", "transients", "time (s)", "s per hour"))
+    for duration_in_h in DURATIONS_IN_H:
+        series = make_series(duration_in_h)
+        start = time.perf_counter()
+        transients = detect_transients(series, threshold=5.0)
+        elapsed = time.perf_counter() - start
+        print(
+            "%-14g  %12d  %10d  %10.2f  %12.3f"
+            % (duration_in_h, len(series.data), len(transients), elapsed, elapsed / duration_in_h)
+        )
+
+
+if __name__ == "__main__":
+    main()
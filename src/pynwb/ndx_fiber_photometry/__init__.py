@@ -29,11 +29,26 @@ load_namespaces(str(__spec_path))
 FiberPhotometryViruses = get_class("FiberPhotometryViruses", "ndx-fiber-photometry")
 FiberPhotometryVirusInjections = get_class("FiberPhotometryVirusInjections", "ndx-fiber-photometry")
 FiberPhotometryIndicators = get_class("FiberPhotometryIndicators", "ndx-fiber-photometry")
-FiberPhotometry = get_class("FiberPhotometry", "ndx-fiber-photometry")
-from .fiber_photometry import FiberPhotometryTable
-
-FiberPhotometryResponseSeries = get_class("FiberPhotometryResponseSeries", "ndx-fiber-photometry")
-CommandedVoltageSeries = get_class("CommandedVoltageSeries", "ndx-fiber-photometry")
+from .fiber_photometry import (
+    FiberPhotometry,
+    FiberPhotometryTable,
+    EncodedFiberPhotometryTable,
+    FiberPhotometryResponseSeries,
+    CommandedVoltageSeries,
+    create_encoded_fiber_photometry_table,
+)
+
+from .alignment import AlignedSeries, align_series
+from .concatenation import ConcatenatedSeries, concatenate_series
+from .profiling import Profiler, profile
+from .qc import QCMetricsAccumulator, compute_qc_metrics
+from .quantization import QuantizedData, quantize_data
+from .remote import CachedRangeFile, FsspecRangeFetcher, open_remote_nwbfile
+from .rig import add_rig_to_nwbfile, clear_rig_cache, load_rig, open_session_file, write_rig_file, write_session_file
+from .simulation import FiberPhotometrySimulation, SimulatedDataIterator
+from .spectral import CrossSpectra, compute_cross_spectra
+from .timestamps import SharedTimestampsMap, load_timestamps
+from .transients import detect_transients
 
 # Remove these functions from the package
 del load_namespaces, get_class
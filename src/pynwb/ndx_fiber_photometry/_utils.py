@@ -0,0 +1,79 @@
+"""Helpers shared by the analysis modules to read and write series chunk by chunk."""
+
+import numpy as np
+
+# Irregular timestamps are searched with a coarse in-memory index holding every ``COARSE_STRIDE``-th timestamp
+COARSE_STRIDE = 4096
+
+
+class Timebase:
+    """Map times to fractional sample positions of a series without loading its ``timestamps``."""
+
+    def __init__(self, series):
+        self.num_samples = len(series.data)
+        self.timestamps = series.timestamps
+        if self.timestamps is None:
+            self.rate = float(series.rate)
+            self.starting_time = float(series.starting_time or 0.0)
+        else:
+            self.rate = None
+            self.starting_time = float(self.timestamps[0])
+            self._coarse = np.asarray(self.timestamps[::COARSE_STRIDE], dtype=float)
+
+    @property
+    def is_regular(self):
+        return self.rate is not None
+
+    @property
+    def stop_time(self):
+        if self.is_regular:
+            return self.starting_time + (self.num_samples - 1) / self.rate
+        return float(self.timestamps[self.num_samples - 1])
+
+    def time_slice(self, start, stop):
+        """Return the timestamps of samples ``start:stop``."""
+        if self.is_regular:
+            return self.starting_time + np.arange(start, stop) / self.rate
+        return np.asarray(self.timestamps[start:stop], dtype=float)
+
+    def window(self, t_min, t_max):
+        """Return the ``(start, stop)`` sample range whose timestamps enclose ``[t_min, t_max]``."""
+        if self.is_regular:
+            start = int(np.floor((t_min - self.starting_time) * self.rate))
+            stop = int(np.ceil((t_max - self.starting_time) * self.rate)) + 1
+        else:
+            start = (int(np.searchsorted(self._coarse, t_min, side="right")) - 1) * COARSE_STRIDE
+            stop = int(np.searchsorted(self._coarse, t_max, side="left")) * COARSE_STRIDE + 1
+        return max(start, 0), min(max(stop, 0), self.num_samples)
+
+
+def get_num_columns(series):
+    """Return the number of columns of ``series.data`` as read by :func:`read_scaled`, one per element of a sample."""
+    shape = np.shape(series.data[:1])[1:]
+    return int(np.prod(shape)) if shape else 1
+
+
+def read_scaled(series, start, stop):
+    """Read samples ``start:stop`` of ``series.data`` in physical units, as a 2D float array.
+
+    Data with more than two dimensions are flattened to one column per element of a sample.
+    """
+    data = np.asarray(series.data[start:stop], dtype=float)
+    data = data.reshape(len(data), -1) if data.ndim != 2 else data
+    data = data * float(getattr(series, "conversion", 1.0))
+    offset = float(getattr(series, "offset", 0.0) or 0.0)
+    if offset:
+        data += offset
+    return data
+
+
+def iterator_shapes(maxshape, chunk_size, buffer_size):
+    """Return the ``(buffer_shape, chunk_shape)`` of a ``GenericDataChunkIterator`` over ``maxshape``, chunked and
+    buffered along its first dimension.
+
+    The buffer holds a whole number of chunks, so that every write of a buffer fills complete chunks.
+    """
+    num_samples = max(maxshape[0], 1)
+    chunk_size = max(min(int(chunk_size), num_samples), 1)
+    buffer_size = min(-(-int(buffer_size) // chunk_size) * chunk_size, num_samples)
+    return (buffer_size,) + tuple(maxshape[1:]), (chunk_size,) + tuple(maxshape[1:])
@@ -0,0 +1,210 @@
+"""Lazy alignment of several response and voltage series onto a common timebase.
+
+Inputs are never loaded in full: every output chunk reads only the slice of each input series (and of its
+``timestamps``, when irregular) that the chunk needs, so h5py- and zarr-backed series stream straight from disk.
+"""
+
+import numpy as np
+
+from ._utils import Timebase, get_num_columns, read_scaled
+
+DEFAULT_CHUNK_SIZE = 10_000
+DEFAULT_HALF_WIDTH = 16
+KAISER_BETA = 8.6
+
+
+def _kaiser(x, half_width):
+    """Evaluate a Kaiser window of half-width ``half_width`` at (fractional) offsets ``x``."""
+    r = np.clip(1.0 - (x / half_width) ** 2, 0.0, None)
+    return np.i0(KAISER_BETA * np.sqrt(r)) / np.i0(KAISER_BETA)
+
+
+class AlignedSeries:
+    """A lazily evaluated view of several ``TimeSeries`` resampled onto one target timebase.
+
+    Use :func:`align_series` to construct this object. Data are computed on access, one chunk at a time, either by
+    slicing (``aligned[start:stop]``) or by iterating over :meth:`iter_chunks`.
+
+    Series sampled at a regular ``rate`` are resampled with a Kaiser-windowed sinc filter evaluated at the target
+    sample positions. For rational rate ratios this is exactly a polyphase resampler, except where the filter is
+    truncated by the edges of a series: there its taps are renormalized to keep unity DC gain. The filter cutoff is
+    lowered to the target Nyquist frequency when downsampling, so the output is anti-aliased. Series with irregular
+    ``timestamps`` are linearly interpolated. Target samples that fall outside the span of a series are NaN.
+    """
+
+    def __init__(self, series, target, method, chunk_size, half_width):
+        self.series = list(series)
+        self.names = [s.name for s in self.series]
+        self.chunk_size = int(chunk_size)
+        self.half_width = int(half_width)
+        self._target = target
+        self._timebases = [Timebase(s) for s in self.series]
+        self._num_columns = {s.name: get_num_columns(s) for s in self.series}
+        self._methods = []
+        for timebase in self._timebases:
+            if method == "auto":
+                self._methods.append("sinc" if timebase.is_regular and target.is_regular else "linear")
+            elif method == "sinc" and not (timebase.is_regular and target.is_regular):
+                raise ValueError("method='sinc' requires the target and every input series to have a regular 'rate'.")
+            else:
+                self._methods.append(method)
+
+    def __len__(self):
+        return self._target.num_samples
+
+    @property
+    def rate(self):
+        """Sampling rate of the target timebase, or None if it is irregular."""
+        return self._target.rate
+
+    @property
+    def shapes(self):
+        """Shape of each aligned series, keyed by series name."""
+        return {name: (len(self), num_columns) for name, num_columns in self._num_columns.items()}
+
+    def timestamps(self, start=0, stop=None):
+        """Return the target timestamps of samples ``start:stop``."""
+        stop = len(self) if stop is None else stop
+        return self._target.time_slice(start, stop)
+
+    def __getitem__(self, item):
+        if not isinstance(item, slice) or item.step not in (None, 1):
+            raise TypeError("AlignedSeries only supports contiguous slicing over time, e.g. aligned[start:stop].")
+        start, stop, _ = item.indices(len(self))
+        return self.read(start, stop)
+
+    def read(self, start, stop):
+        """Return the aligned data of target samples ``start:stop`` as a dict of 2D arrays keyed by series name."""
+        times = self.timestamps(start, max(start, stop))
+        return {
+            series.name: self._resample(series, timebase, method, times)
+            for series, timebase, method in zip(self.series, self._timebases, self._methods)
+        }
+
+    def iter_chunks(self, chunk_size=None):
+        """Yield ``(timestamps, data)`` tuples for consecutive chunks of the target timebase.
+
+        ``data`` is a dict of 2D arrays keyed by series name, as returned by :meth:`read`.
+        """
+        chunk_size = chunk_size or self.chunk_size
+        for start in range(0, len(self), chunk_size):
+            stop = min(start + chunk_size, len(self))
+            yield self.timestamps(start, stop), self.read(start, stop)
+
+    def _resample(self, series, timebase, method, times):
+        out = np.full((len(times), self._num_columns[series.name]), np.nan)
+        inside = (times >= timebase.starting_time) & (times <= timebase.stop_time)
+        if not inside.any():
+            return out
+        t = times[inside]
+        if method == "sinc":
+            out[inside] = self._resample_sinc(series, timebase, t)
+        else:
+            out[inside] = self._resample_linear(series, timebase, t)
+        return out
+
+    def _resample_sinc(self, series, timebase, t):
+        cutoff = min(1.0, self._target.rate / timebase.rate)
+        half_width = int(np.ceil(self.half_width / cutoff))
+        position = (t - timebase.starting_time) * timebase.rate
+        base = np.floor(position).astype(int)
+        start = max(int(base[0]) - half_width + 1, 0)
+        stop = min(int(base[-1]) + half_width + 1, timebase.num_samples)
+        data = read_scaled(series, start, stop)
+
+        out = np.zeros((len(t), data.shape[1]))
+        norm = np.zeros(len(t))
+        truncated = np.zeros(len(t), dtype=bool)
+        for tap in range(-half_width + 1, half_width + 1):
+            index = base + tap
+            valid = (index >= 0) & (index < timebase.num_samples)
+            truncated |= ~valid
+            x = position - index
+            weight = np.where(valid, cutoff * np.sinc(cutoff * x) * _kaiser(x, half_width), 0.0)
+            out += weight[:, np.newaxis] * data[np.clip(index, start, stop - 1) - start]
+            norm += weight
+        # Renormalizing keeps the filter at unity DC gain where it is truncated at the edges of the series; elsewhere
+        # the full filter is applied as is
+        out[truncated] /= norm[truncated, np.newaxis]
+        return out
+
+    def _resample_linear(self, series, timebase, t):
+        start, stop = timebase.window(t[0], t[-1])
+        source_times = timebase.time_slice(start, stop)
+        data = read_scaled(series, start, stop)
+        return np.column_stack([np.interp(t, source_times, data[:, i]) for i in range(data.shape[1])])
+
+
+def align_series(
+    series,
+    rate=None,
+    timestamps=None,
+    starting_time=None,
+    stop_time=None,
+    reference=None,
+    method="auto",
+    chunk_size=DEFAULT_CHUNK_SIZE,
+    half_width=DEFAULT_HALF_WIDTH,
+):
+    """Align several ``FiberPhotometryResponseSeries``/``CommandedVoltageSeries`` onto one target timebase.
+
+    Parameters
+    ----------
+    series : list of TimeSeries
+        The series to align. Names must be unique. ``data`` may be an in-memory array or a lazily read dataset.
+    rate : float, optional
+        Sampling rate of the target timebase, in Hz.
+    timestamps : array-like, optional
+        Explicit target timestamps, in seconds. Mutually exclusive with ``rate``.
+    starting_time, stop_time : float, optional
+        Span of a target timebase defined by ``rate``. Default to the span covered by all input series.
+    reference : TimeSeries, optional
+        Use the timebase of this series as the target. Defaults to the first series in ``series`` when neither
+        ``rate`` nor ``timestamps`` is given.
+    method : {"auto", "sinc", "linear"}
+        Resampling method. "auto" uses windowed-sinc (polyphase) resampling when both the input and the target are
+        regularly sampled, and linear interpolation otherwise.
+    chunk_size : int
+        Number of target samples computed per chunk by :meth:`AlignedSeries.iter_chunks`.
+    half_width : int
+        Half-width of the windowed-sinc filter, in input samples at the target rate.
+
+    Returns
+    -------
+    AlignedSeries
+    """
+    series = list(series)
+    if not series:
+        raise ValueError("At least one series is required.")
+    names = [s.name for s in series]
+    if len(set(names)) != len(names):
+        raise ValueError("Series names must be unique, got %s." % names)
+    if method not in ("auto", "sinc", "linear"):
+        raise ValueError("Unknown method '%s'; expected 'auto', 'sinc' or 'linear'." % method)
+    if rate is not None and timestamps is not None:
+        raise ValueError("Specify either 'rate' or 'timestamps' for the target timebase, not both.")
+    if reference is not None and (rate is not None or timestamps is not None):
+        raise ValueError("'reference' cannot be combined with 'rate' or 'timestamps'.")
+
+    if timestamps is not None:
+        target = Timebase(_TargetTimebase(timestamps=timestamps))
+    elif rate is not None:
+        timebases = [Timebase(s) for s in series]
+        starting_time = min(tb.starting_time for tb in timebases) if starting_time is None else starting_time
+        stop_time = max(tb.stop_time for tb in timebases) if stop_time is None else stop_time
+        num_samples = int(np.floor((stop_time - starting_time) * rate + 1e-9)) + 1
+        target = Timebase(_TargetTimebase(rate=rate, starting_time=starting_time, num_samples=num_samples))
+    else:
+        target = Timebase(reference if reference is not None else series[0])
+
+    return AlignedSeries(series, target=target, method=method, chunk_size=chunk_size, half_width=half_width)
+
+
+class _TargetTimebase:
+    """Minimal stand-in exposing the ``TimeSeries`` timing attributes used by :class:`Timebase`."""
+
+    def __init__(self, rate=None, starting_time=None, num_samples=None, timestamps=None):
+        self.rate = rate
+        self.starting_time = starting_time
+        self.timestamps = None if timestamps is None else np.asarray(timestamps, dtype=float)
+        self.data = range(num_samples if timestamps is None else len(self.timestamps))
@@ -0,0 +1,365 @@
+"""Lazy concatenation of the response series of several sessions into one continuous series.
+
+:func:`concatenate_series` stitches one ``FiberPhotometryResponseSeries`` per session end to end. Fibers are matched
+across sessions by their ``FiberPhotometryTable`` attributes (by default the location, optical fiber name, indicator
+label and excitation and emission wavelengths) rather than by row or column index, and the timestamps of each session
+are offset by its ``session_start_time``, so that the concatenation has one timebase.
+
+Nothing is loaded up front: :class:`ConcatenatedSeries` keeps an index of the samples of each session, and reading
+samples ``start:stop`` only reads the matching sample range of the sessions it spans, i.e. only the HDF5 chunks
+holding them. :meth:`ConcatenatedSeries.export` writes a time slice to a new file the same way, chunk by chunk, and
+links the fiber photometry metadata of the new file to the file of the first session instead of copying it.
+"""
+
+import uuid
+
+import numpy as np
+from hdmf.container import AbstractContainer
+from hdmf.data_utils import GenericDataChunkIterator
+from pynwb import NWBFile
+
+from ._utils import Timebase, iterator_shapes, read_scaled
+from .fiber_photometry import FiberPhotometryResponseSeries
+from .rig import _scoped_rig, add_rig_to_nwbfile, load_rig, write_session_file
+
+DEFAULT_CHUNK_SIZE = 10_000
+DEFAULT_BUFFER_SIZE = 100_000
+
+# Table columns matching the fibers of different sessions by default; referenced devices are matched by name and
+# indicators by label
+FIBER_KEY_COLUMNS = (
+    "location",
+    "optical_fiber",
+    "indicator",
+    "excitation_wavelength_in_nm",
+    "emission_wavelength_in_nm",
+)
+
+
+def _key_value(value):
+    """Return a hashable value of a table cell, equal for the same fiber attribute in different sessions."""
+    if isinstance(value, AbstractContainer):
+        return getattr(value, "label", None) or value.name
+    if isinstance(value, (bytes, np.bytes_)):
+        return value.decode("utf-8")
+    if isinstance(value, str):
+        return str(value)
+    if np.ndim(value):
+        return tuple(np.asarray(value, dtype=float).tolist())
+    return value.item() if isinstance(value, np.generic) else value
+
+
+def _fiber_keys(series, key_columns):
+    """Return the FiberPhotometryTable rows of the columns of ``series`` and the key matching each across sessions."""
+    region = getattr(series, "fiber_photometry_table_region", None)
+    if region is None:
+        raise ValueError("'%s' has no fiber_photometry_table_region to match its fibers by." % series.name)
+    rows = np.asarray(region.data[:], dtype=int)
+    table = region.table
+    for name in key_columns:
+        if name not in table.colnames:
+            raise ValueError("'%s' is not a column of the FiberPhotometryTable of '%s'." % (name, series.name))
+    values = [table[name][:] for name in key_columns]
+    keys = [tuple(_key_value(column[row]) for column in values) for row in rows]
+    return rows, keys
+
+
+def _session_offset(series, reference):
+    """Seconds between the session start of ``reference`` and that of ``series``, or 0 without an NWBFile."""
+    nwbfile, reference_nwbfile = series.get_ancestor("NWBFile"), reference.get_ancestor("NWBFile")
+    if nwbfile is None or reference_nwbfile is None:
+        return 0.0
+    return (nwbfile.session_start_time - reference_nwbfile.session_start_time).total_seconds()
+
+
+def _first_sample_at(timebase, time):
+    """Return the index of the first sample of ``timebase`` at or after ``time``."""
+    if timebase.is_regular:
+        index = int(np.ceil((time - timebase.starting_time) * timebase.rate - 1e-9))
+    else:
+        start, stop = timebase.window(time, time)
+        index = start + int(np.searchsorted(timebase.time_slice(start, stop), time, side="left"))
+    return min(max(index, 0), timebase.num_samples)
+
+
+class ConcatenatedSeries:
+    """A lazily read view of several response series, one per session, stitched end to end.
+
+    Use :func:`concatenate_series` to construct this object. Samples are read in physical units by slicing
+    (``concatenated[start:stop]``) or by iterating over :meth:`iter_chunks`, and their times, offset to the session
+    start of the first series, by :meth:`timestamps`.
+
+    Attributes
+    ----------
+    series : list of FiberPhotometryResponseSeries
+        The concatenated series, in order.
+    columns : list of numpy.ndarray
+        For each series, the column of its data holding each fiber of the concatenation.
+    time_offsets : numpy.ndarray
+        For each series, the offset added to its timestamps, in seconds.
+    fiber_photometry_table_rows : numpy.ndarray
+        The row of each fiber in the ``FiberPhotometryTable`` of the first series.
+    """
+
+    def __init__(
+        self, series, columns, time_offsets, fiber_photometry_table_rows, fiber_keys, key_columns=FIBER_KEY_COLUMNS
+    ):
+        self.series = series
+        self.columns = columns
+        self.time_offsets = np.asarray(time_offsets, dtype=float)
+        self.fiber_photometry_table_rows = fiber_photometry_table_rows
+        self._fiber_keys = fiber_keys
+        self._key_columns = tuple(key_columns)
+        self._timebases = [Timebase(s) for s in series]
+        # first sample of each series in the concatenation, and the total number of samples
+        self._starts = np.cumsum([0] + [timebase.num_samples for timebase in self._timebases])
+
+    def __len__(self):
+        return int(self._starts[-1])
+
+    @property
+    def shape(self):
+        return (len(self), len(self.fiber_photometry_table_rows))
+
+    @property
+    def rate(self):
+        """Sampling rate shared by all series, or None. Samples are not evenly spaced across sessions."""
+        rates = {timebase.rate for timebase in self._timebases}
+        return rates.pop() if len(rates) == 1 else None
+
+    @property
+    def fibers(self):
+        """The matched attributes of each fiber, as a pandas.DataFrame."""
+        import pandas as pd
+
+        return pd.DataFrame(self._fiber_keys, columns=list(self._key_columns))
+
+    def _pieces(self, start, stop):
+        """Yield ``(index, series_start, series_stop)`` for each series holding samples of ``start:stop``."""
+        first = max(int(np.searchsorted(self._starts, start, side="right")) - 1, 0)
+        for index in range(first, len(self.series)):
+            offset = self._starts[index]
+            if offset >= stop:
+                break
+            yield index, max(start - offset, 0), min(stop, self._starts[index + 1]) - offset
+
+    def timestamps(self, start=0, stop=None):
+        """Return the times of samples ``start:stop``, in seconds from the session start of the first series."""
+        stop = len(self) if stop is None else stop
+        pieces = [
+            self._timebases[index].time_slice(piece_start, piece_stop) + self.time_offsets[index]
+            for index, piece_start, piece_stop in self._pieces(start, stop)
+        ]
+        return np.concatenate(pieces) if pieces else np.empty(0)
+
+    def __getitem__(self, item):
+        if not isinstance(item, slice) or item.step not in (None, 1):
+            raise TypeError(
+                "ConcatenatedSeries only supports contiguous slicing over time, e.g. concatenated[start:stop]."
+            )
+        start, stop, _ = item.indices(len(self))
+        return self.read(start, stop)
+
+    def read(self, start, stop, scaled=True):
+        """Return samples ``start:stop`` of the matched fibers as a 2D array.
+
+        With ``scaled=False`` the stored values are returned, without applying the ``conversion`` and ``offset`` of
+        the series.
+        """
+        pieces = []
+        for index, piece_start, piece_stop in self._pieces(start, stop):
+            series = self.series[index]
+            if scaled:
+                data = read_scaled(series, piece_start, piece_stop)
+            else:
+                data = np.asarray(series.data[piece_start:piece_stop])
+                data = data[:, np.newaxis] if data.ndim == 1 else data
+            # the whole sample range is read, as h5py only supports increasing column selections
+            pieces.append(data[:, self.columns[index]])
+        if not pieces:
+            return np.empty((0, self.shape[1]))
+        return np.concatenate(pieces)
+
+    def iter_chunks(self, chunk_size=DEFAULT_CHUNK_SIZE):
+        """Yield ``(timestamps, data)`` tuples for consecutive chunks of the concatenation."""
+        for start in range(0, len(self), chunk_size):
+            stop = min(start + chunk_size, len(self))
+            yield self.timestamps(start, stop), self.read(start, stop)
+
+    def time_range(self, start_time=None, stop_time=None):
+        """Return the ``(start, stop)`` range of the samples with times in ``[start_time, stop_time)``."""
+
+        def first_sample_at(time):
+            for index, timebase in enumerate(self._timebases):
+                sample = _first_sample_at(timebase, time - self.time_offsets[index])
+                if sample < timebase.num_samples:
+                    return int(self._starts[index]) + sample
+            return len(self)
+
+        start = 0 if start_time is None else first_sample_at(start_time)
+        stop = len(self) if stop_time is None else first_sample_at(stop_time)
+        return start, max(start, stop)
+
+    def _stores_raw_values(self):
+        """Whether all series store values of one dtype with one conversion and offset."""
+        scalings = {
+            (np.dtype(getattr(s.data, "dtype", np.asarray(s.data[:1]).dtype)), s.conversion, s.offset)
+            for s in self.series
+        }
+        return len(scalings) == 1
+
+    def export(self, path, start_time=None, stop_time=None, name=None, buffer_size=DEFAULT_BUFFER_SIZE):
+        """Write the samples with times in ``[start_time, stop_time)`` to a new file as one response series.
+
+        Only the samples of the slice are read, one buffer at a time. They keep the dtype, ``conversion`` and
+        ``offset`` of the series when all series share them, and are written in physical units otherwise. The file
+        starts at the session start of the first series, whose devices and ``FiberPhotometryTable`` are linked from
+        the file of the first series with :func:`~ndx_fiber_photometry.add_rig_to_nwbfile`, so that file must be
+        kept next to the export.
+
+        Parameters
+        ----------
+        path : str
+            Path of the new file.
+        start_time, stop_time : float, optional
+            Time slice to export, in seconds from the session start of the first series. Default to all samples.
+        name : str, optional
+            Name of the exported series. Defaults to the name of the first series.
+        buffer_size : int
+            Number of samples read at a time.
+        """
+        source = self.series[0].container_source
+        if source is None:
+            raise ValueError("Exporting requires series read from a file; '%s' is in memory." % self.series[0].name)
+        start, stop = self.time_range(start_time, stop_time)
+        if start == stop:
+            raise ValueError("No samples between %s and %s s." % (start_time, stop_time))
+
+        # the first file is read as a rig for the export only, and closed once the export is written
+        with _scoped_rig(source):
+            first = self.series[0]
+            nwbfile = NWBFile(
+                session_description="Samples %d to %d of %d concatenated sessions" % (start, stop, len(self.series)),
+                identifier=str(uuid.uuid4()),
+                session_start_time=load_rig(source).session_start_time,
+            )
+            table = add_rig_to_nwbfile(nwbfile, source)
+
+            raw = self._stores_raw_values()
+            # the export is chunked like the first series
+            chunks = getattr(first.data, "chunks", None)
+            iterator_kwargs = dict(chunk_size=chunks[0] if chunks else DEFAULT_CHUNK_SIZE, buffer_size=buffer_size)
+            data = _ConcatenatedDataIterator(self, start, stop, raw=raw, **iterator_kwargs)
+            timing = {}
+            pieces = list(self._pieces(start, stop))
+            if len(pieces) == 1 and self._timebases[pieces[0][0]].is_regular:
+                timing["rate"] = self._timebases[pieces[0][0]].rate
+                timing["starting_time"] = float(self.timestamps(start, start + 1)[0])
+            else:
+                timing["timestamps"] = _ConcatenatedDataIterator(self, start, stop, timestamps=True, **iterator_kwargs)
+            nwbfile.add_acquisition(
+                FiberPhotometryResponseSeries(
+                    name=name or first.name,
+                    description=first.description,
+                    data=data,
+                    unit=first.unit,
+                    conversion=first.conversion if raw else 1.0,
+                    offset=first.offset if raw else 0.0,
+                    fiber_photometry_table_region=table.create_fiber_photometry_table_region(
+                        region=self.fiber_photometry_table_rows, description="fibers matched across sessions"
+                    ),
+                    **timing,
+                )
+            )
+            write_session_file(nwbfile, path, source)
+
+
+class _ConcatenatedDataIterator(GenericDataChunkIterator):
+    """Stream samples ``start:stop`` of a :class:`ConcatenatedSeries`, or their timestamps, a buffer at a time."""
+
+    def __init__(
+        self,
+        concatenated,
+        start,
+        stop,
+        timestamps=False,
+        raw=False,
+        chunk_size=DEFAULT_CHUNK_SIZE,
+        buffer_size=DEFAULT_BUFFER_SIZE,
+    ):
+        self.concatenated = concatenated
+        self.start = start
+        self.timestamps = timestamps
+        self.raw = raw
+        maxshape = (stop - start,) if timestamps else (stop - start, concatenated.shape[1])
+        buffer_shape, chunk_shape = iterator_shapes(maxshape, chunk_size, buffer_size)
+        self._maxshape = maxshape
+        super().__init__(buffer_shape=buffer_shape, chunk_shape=chunk_shape)
+
+    def _get_data(self, selection):
+        start, stop = self.start + selection[0].start, self.start + selection[0].stop
+        if self.timestamps:
+            return self.concatenated.timestamps(start, stop)
+        data = self.concatenated.read(start, stop, scaled=not self.raw)
+        return data[(slice(None),) + tuple(selection[1:])]
+
+    def _get_maxshape(self):
+        return self._maxshape
+
+    def _get_dtype(self):
+        if self.raw and not self.timestamps:
+            return np.dtype(self.concatenated.series[0].data.dtype)
+        return np.dtype("float64")
+
+
+def concatenate_series(series, time_offsets=None, key_columns=FIBER_KEY_COLUMNS):
+    """Concatenate one ``FiberPhotometryResponseSeries`` per session into one lazily read series.
+
+    Parameters
+    ----------
+    series : list of FiberPhotometryResponseSeries
+        The series, in chronological order. Each must have a ``fiber_photometry_table_region``.
+    time_offsets : list of float, optional
+        The offset added to the timestamps of each series, in seconds. Defaults to the ``session_start_time`` of
+        the file of each series relative to that of the first series.
+    key_columns : tuple of str
+        The ``FiberPhotometryTable`` columns whose values match the fibers of different series, e.g. add
+        ``"coordinates"`` or leave out ``"optical_fiber"`` if the devices are named differently in each session.
+        Referenced devices are matched by name and indicators by label.
+
+    Returns
+    -------
+    ConcatenatedSeries
+        The fibers recorded by every series, matched by the values of ``key_columns``, in the order of the first
+        series.
+    """
+    series = list(series)
+    if not series:
+        raise ValueError("At least one series is required.")
+    rows_and_keys = [_fiber_keys(s, key_columns) for s in series]
+    common = set.intersection(*(set(keys) for _, keys in rows_and_keys))
+    # fibers sharing a key are ambiguous only if that key is matched in every series
+    for s, (_, keys) in zip(series, rows_and_keys):
+        if any(keys.count(key) > 1 for key in common):
+            raise ValueError(
+                "'%s' records several fibers with the same %s; pass key_columns that tell them apart."
+                % (s.name, ", ".join(key_columns))
+            )
+    first_rows, first_keys = rows_and_keys[0]
+    fiber_keys = [key for key in first_keys if key in common]
+    if not fiber_keys:
+        raise ValueError("No fiber is recorded by every series.")
+    columns = [np.array([keys.index(key) for key in fiber_keys]) for _, keys in rows_and_keys]
+    rows = first_rows[columns[0]]
+
+    if time_offsets is None:
+        time_offsets = [_session_offset(s, series[0]) for s in series]
+    if len(time_offsets) != len(series):
+        raise ValueError("Expected %d time offsets, got %d." % (len(series), len(time_offsets)))
+    previous_stop = -np.inf
+    for s, offset in zip(series, time_offsets):
+        timebase = Timebase(s)
+        if timebase.starting_time + offset <= previous_stop:
+            raise ValueError("'%s' starts before the end of the previous series." % s.name)
+        previous_stop = timebase.stop_time + offset
+    return ConcatenatedSeries(series, columns, time_offsets, rows, fiber_keys, key_columns)
@@ -1,17 +1,296 @@
-from hdmf.utils import docval, popargs
-from pynwb import get_class
+import numpy as np
+from hdmf.build import ObjectMapper
+from hdmf.common import DynamicTableRegion, EnumData
+from hdmf.common.io.table import DynamicTableMap
+from hdmf.utils import docval, get_docval, getargs, popargs
+from pynwb import get_class, register_class, register_map
 
 FiberPhotometryTable = get_class("FiberPhotometryTable", "ndx-fiber-photometry")
+FiberPhotometryResponseSeries = get_class("FiberPhotometryResponseSeries", "ndx-fiber-photometry")
+CommandedVoltageSeries = get_class("CommandedVoltageSeries", "ndx-fiber-photometry")
+
+# Columns of FiberPhotometryTable that hold object references to devices, indicators and series
+REFERENCE_COLUMNS = (
+    "indicator",
+    "optical_fiber",
+    "excitation_source",
+    "commanded_voltage_series",
+    "photodetector",
+    "dichroic_mirror",
+    "emission_filter",
+    "excitation_filter",
+)
+REQUIRED_REFERENCE_COLUMNS = tuple(
+    column["name"]
+    for column in FiberPhotometryTable.__columns__
+    if column["name"] in REFERENCE_COLUMNS and column.get("required", False)
+)
+
+
+@register_class("EncodedFiberPhotometryTable", "ndx-fiber-photometry")
+class EncodedFiberPhotometryTable(FiberPhotometryTable):
+    """FiberPhotometryTable whose reference columns are dictionary-encoded ``EnumData`` columns.
+
+    In the schema, EncodedFiberPhotometryTable is a DynamicTable with the columns of FiberPhotometryTable, as its
+    reference columns have another dtype. It is a FiberPhotometryTable here so that rows are added and read the same
+    way. Create it with :func:`create_encoded_fiber_photometry_table` and pass it to ``FiberPhotometry`` as
+    ``encoded_fiber_photometry_table``.
+    """
+
+
+# The metaclass prepends the columns of FiberPhotometryTable to those of a subclass, so the predefined columns are
+# replaced here: reference columns are EnumData, which create and track their own ``<column>_elements`` column
+EncodedFiberPhotometryTable.__columns__ = tuple(
+    dict(column, **{"class": EnumData}) if column["name"] in REFERENCE_COLUMNS else column
+    for column in FiberPhotometryTable.__columns__
+)
+
+# Generated after EncodedFiberPhotometryTable is registered, so that its encoded table slot takes that class
+FiberPhotometry = get_class("FiberPhotometry", "ndx-fiber-photometry")
+_fiber_photometry_init = FiberPhotometry.__init__
+
+
+@docval(*get_docval(FiberPhotometry.__init__))
+def _init_fiber_photometry(self, **kwargs):
+    """Check that exactly one of the fiber photometry table slots is set before initializing FiberPhotometry."""
+    table, encoded_table = getargs("fiber_photometry_table", "encoded_fiber_photometry_table", kwargs)
+    if (table is None) == (encoded_table is None):
+        raise ValueError(
+            "FiberPhotometry '%s' requires exactly one of 'fiber_photometry_table' and "
+            "'encoded_fiber_photometry_table'." % kwargs["name"]
+        )
+    if isinstance(table, EncodedFiberPhotometryTable):
+        raise ValueError(
+            "EncodedFiberPhotometryTable '%s' must be passed to FiberPhotometry '%s' as "
+            "'encoded_fiber_photometry_table'." % (table.name, kwargs["name"])
+        )
+    _fiber_photometry_init(self, **kwargs)
+
+
+@docval(
+    returns="the FiberPhotometryTable or EncodedFiberPhotometryTable of this FiberPhotometry",
+    rtype=FiberPhotometryTable,
+)
+def get_fiber_photometry_table(self):
+    """Return the table of this FiberPhotometry, whichever of ``fiber_photometry_table`` and
+    ``encoded_fiber_photometry_table`` is set."""
+    if self.encoded_fiber_photometry_table is not None:
+        return self.encoded_fiber_photometry_table
+    return self.fiber_photometry_table
+
+
+FiberPhotometry.__init__ = _init_fiber_photometry
+FiberPhotometry.get_fiber_photometry_table = get_fiber_photometry_table
+
+
+def _region_indices(table, region):
+    """Normalize a list, range, slice, integer array or boolean mask over ``table`` to an array of row indices."""
+    num_rows = len(table)
+    if isinstance(region, slice):
+        if (region.start is not None and region.start < 0) or (region.stop is not None and region.stop > num_rows):
+            raise IndexError("region slice %s is out of range for this DynamicTable of length %d" % (region, num_rows))
+        return np.arange(*region.indices(num_rows))
+    indices = np.asarray(region)
+    if indices.dtype == bool:
+        if indices.shape != (num_rows,):
+            raise IndexError(
+                "boolean region of shape %s does not match this DynamicTable of length %d" % (indices.shape, num_rows)
+            )
+        return np.flatnonzero(indices)
+    if indices.size == 0:
+        return indices.astype(int)
+    if indices.ndim != 1 or not np.issubdtype(indices.dtype, np.integer):
+        raise TypeError("region must be a 1D sequence of integer indices or a boolean mask, got %r" % region)
+    out_of_range = (indices < 0) | (indices >= num_rows)
+    if out_of_range.any():
+        raise IndexError(
+            "The index %d is out of range for this DynamicTable of length %d" % (indices[out_of_range][0], num_rows)
+        )
+    return indices
+
+
+_region_doc = (
+    "the indices of the FiberPhotometryTable, as a list, range or integer array of row indices, a slice, or a "
+    "boolean mask over the rows"
+)
 
 
 @docval(
-    {"name": "region", "type": list, "doc": "the indices of the FiberPhotometryTable"},
+    {"name": "region", "type": ("array_data", slice, range), "doc": _region_doc},
     {"name": "description", "type": str, "doc": "a brief description of what these table entries represent"},
 )
 def create_fiber_photometry_table_region(self, **kwargs):
     region, description = popargs("region", "description", kwargs)
     name = "fiber_photometry_table_region"
-    return super(FiberPhotometryTable, self).create_region(name=name, region=region, description=description)
+    indices = _region_indices(self, region)
+    return DynamicTableRegion(name=name, data=indices.tolist(), description=description, table=self)
+
+
+@docval(
+    {"name": "region", "type": ("array_data", slice, range), "doc": _region_doc},
+    {"name": "description", "type": str, "doc": "a brief description of what these table entries represent"},
+    returns="a region shared by all series referencing the same rows",
+    rtype=DynamicTableRegion,
+)
+def get_fiber_photometry_table_region(self, **kwargs):
+    """Return the region over the given rows, reusing the one returned by a previous call for the same rows and
+    description.
+
+    Series given the same region object store it once: HDMF writes the region dataset under the first series and a
+    link to it under every other series.
+    """
+    region, description = popargs("region", "description", kwargs)
+    indices = _region_indices(self, region)
+    regions = self.__dict__.setdefault("_fiber_photometry_table_regions", {})
+    key = (tuple(indices.tolist()), description)
+    if key not in regions:
+        regions[key] = self.create_fiber_photometry_table_region(region=indices, description=description)
+    return regions[key]
 
 
 FiberPhotometryTable.create_fiber_photometry_table_region = create_fiber_photometry_table_region
+FiberPhotometryTable.get_fiber_photometry_table_region = get_fiber_photometry_table_region
+
+
+def _depth(value):
+    """Return the number of nested list, tuple or array dimensions of ``value``, 0 for scalars and objects."""
+    if isinstance(value, np.ndarray):
+        return value.ndim
+    if isinstance(value, (list, tuple)):
+        return 1 + (_depth(value[0]) if len(value) else 0)
+    return 0
+
+
+def _match(values, expected):
+    """Return a boolean mask of the ``values`` equal to ``expected`` or, if it is a collection of values, in it.
+
+    Whether a list, tuple or array is one value or a collection of values is decided by the cells of the column: it is
+    one value if it has as many dimensions as a cell, e.g. ``[0.0, 1.0, 2.0]`` for a ``coordinates`` cell, and a
+    collection of values otherwise. A set is always a collection of values.
+    """
+    cell_depth = _depth(values[0]) if len(values) else 0
+    if isinstance(expected, (set, frozenset)) or _depth(expected) > cell_depth:
+        candidates = expected
+    else:
+        candidates = [expected]
+    mask = np.zeros(len(values), dtype=bool)
+    for candidate in candidates:
+        if cell_depth > 0:
+            matches = [np.array_equal(value, candidate) for value in values]
+        elif isinstance(candidate, str) or np.isscalar(candidate):
+            matches = [value == candidate or getattr(value, "name", None) == candidate for value in values]
+        else:
+            matches = [value is candidate for value in values]
+        mask |= np.array(matches, dtype=bool)
+    return mask
+
+
+@docval(
+    *[
+        {
+            "name": column["name"],
+            "type": None,
+            "doc": "the value, or list, tuple or set of values, of the %s column of the fibers to select"
+            % column["name"],
+            "default": None,
+        }
+        for column in FiberPhotometryTable.__columns__
+    ],
+    allow_extra=True,
+    returns="the indices along the second dimension of data of the matching fibers",
+    rtype=np.ndarray,
+)
+def get_data_column_indices(self, **kwargs):
+    """Return the indices along the second dimension of ``data`` of the fibers whose FiberPhotometryTable rows match
+    all given column values.
+
+    Keyword arguments are FiberPhotometryTable column names. A value selects rows whose entry equals it; a list, tuple
+    or set selects rows whose entry is any of its elements. For columns whose entries are arrays, such as
+    ``coordinates`` or ragged columns, a list or array of the shape of an entry is one value, e.g.
+    ``coordinates=[0.0, 1.0, 2.0]``, and a list of such values selects any of them. Reference columns match either the
+    referenced object itself or its name, e.g.
+    ``series.get_data_column_indices(location="VTA", indicator="indicator_green")``.
+    Columns added to the table with ``add_column`` are matched the same way. Each matched column of the table is read
+    once, so the lookup is fast even for series read from a file.
+    """
+    kwargs = {column_name: expected for column_name, expected in kwargs.items() if expected is not None}
+    region = self.fiber_photometry_table_region
+    if region is None:
+        raise ValueError("FiberPhotometryResponseSeries '%s' has no fiber_photometry_table_region." % self.name)
+    rows = np.asarray(region.data[:], dtype=int)
+    mask = np.ones(len(rows), dtype=bool)
+    for column_name, expected in kwargs.items():
+        if column_name not in region.table.colnames:
+            raise ValueError("'%s' is not a column of FiberPhotometryTable '%s'." % (column_name, region.table.name))
+        values = region.table[column_name][:]
+        mask &= _match([values[row] for row in rows], expected)
+    return np.flatnonzero(mask)
+
+
+FiberPhotometryResponseSeries.get_data_column_indices = get_data_column_indices
+
+
+@docval(
+    {"name": "description", "type": str, "doc": "description of this FiberPhotometryTable"},
+    {"name": "name", "type": str, "doc": "name of this FiberPhotometryTable", "default": "fiber_photometry_table"},
+    {
+        "name": "encoded_columns",
+        "type": (list, tuple),
+        "doc": (
+            "the optional reference columns to add dictionary-encoded, e.g. 'commanded_voltage_series' or "
+            "'emission_filter', which must then be provided for every row. The required reference columns are always "
+            "encoded."
+        ),
+        "default": (),
+    },
+    returns="an empty EncodedFiberPhotometryTable",
+    rtype=EncodedFiberPhotometryTable,
+    is_method=False,
+)
+def create_encoded_fiber_photometry_table(**kwargs):
+    """Create an EncodedFiberPhotometryTable, a FiberPhotometryTable whose reference columns are stored as
+    ``EnumData``.
+
+    Each encoded column stores one small integer code per row plus a lookup dataset (``<column>_elements``) with one
+    object reference per unique device. Tables where most rows share a handful of devices are then read back with one
+    dereference per unique device instead of one per row. Rows are added and read exactly as for a regular
+    FiberPhotometryTable.
+
+    The encoded layout only pays off on large tables, of thousands of rows: for a table of a hundred rows, reading the
+    table is dominated by other costs and the encoded layout can even be slower. See
+    ``benchmarks/benchmark_reference_columns.py``.
+    """
+    name, description, encoded_columns = getargs("name", "description", "encoded_columns", kwargs)
+    unknown = set(encoded_columns) - set(REFERENCE_COLUMNS)
+    if unknown:
+        raise ValueError("Only reference columns can be encoded, got %s." % sorted(unknown))
+    descriptions = {column["name"]: column["description"] for column in FiberPhotometryTable.__columns__}
+    columns = []
+    for column_name in REFERENCE_COLUMNS:
+        if column_name in REQUIRED_REFERENCE_COLUMNS or column_name in encoded_columns:
+            column = EnumData(name=column_name, description=descriptions[column_name])
+            columns.extend([column, column.elements])
+    return EncodedFiberPhotometryTable(name=name, description=description, columns=columns)
+
+
+@register_map(FiberPhotometryTable)
+class FiberPhotometryTableMap(DynamicTableMap):
+    """Map the elements of dictionary-encoded reference columns, and dereference them once on read."""
+
+    @docval(*get_docval(DynamicTableMap.get_attr_value), returns="the value of the attribute")
+    def get_attr_value(self, **kwargs):
+        spec, container = getargs("spec", "container", kwargs)
+        # The elements of an optional encoded column, e.g. commanded_voltage_series_elements, are only a column of an
+        # EncodedFiberPhotometryTable that has the encoded column
+        if spec.name is not None and spec.name.endswith("_elements") and not hasattr(container, spec.name):
+            return None
+        return super().get_attr_value(**kwargs)
+
+    @docval(*get_docval(ObjectMapper.construct), returns="the constructed FiberPhotometryTable")
+    def construct(self, **kwargs):
+        table = super().construct(**kwargs)
+        # Dereference each unique element once on read so that row lookups only index the in-memory elements
+        for column in table.columns:
+            if isinstance(column, EnumData) and column.name in REFERENCE_COLUMNS:
+                column.elements.transform(lambda data: list(data[:]))
+        return table
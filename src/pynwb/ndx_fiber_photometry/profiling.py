@@ -0,0 +1,313 @@
+"""Opt-in timing and byte counters for building, writing and reading the extension's types.
+
+Instrumentation is installed only for the duration of a :func:`profile` block, by temporarily wrapping the relevant
+HDMF/h5py methods, and is removed again on exit. Outside of a ``profile`` block no wrapper is installed, so the
+extension runs with no overhead at all.
+
+Example
+-------
+>>> with profile() as profiler:
+...     with NWBHDF5IO(path, mode="w") as io:
+...         io.write(nwbfile)
+>>> profiler.summary()
+>>> profiler.to_chrome_trace("write_trace.json")
+"""
+
+import json
+import os
+import threading
+import time
+from collections import namedtuple
+from contextlib import contextmanager
+
+import h5py
+from hdmf.backends.hdf5 import HDF5IO
+from hdmf.build import ObjectMapper
+
+from .fiber_photometry import FiberPhotometryTable
+
+DEFAULT_NAMESPACES = ("ndx-fiber-photometry",)
+
+ProfileEvent = namedtuple("ProfileEvent", ["name", "category", "start", "duration", "nbytes", "args"])
+ProfileEvent.__doc__ = """A single timed operation.
+
+``start`` and ``duration`` are in seconds, ``start`` being relative to the start of the profiling session. ``nbytes``
+is the number of bytes moved by the operation, or 0 if not applicable.
+"""
+
+_MISSING = object()
+_active_profiler = None
+
+
+class Profiler:
+    """Collects :class:`ProfileEvent` records and counters during a :func:`profile` block."""
+
+    def __init__(self, namespaces=DEFAULT_NAMESPACES):
+        self.namespaces = None if namespaces is None else frozenset(namespaces)
+        self.events = []
+        self.counters = {}
+        self._origin = time.perf_counter()
+        self._patches = []
+        self._group_stack = []
+        self._tracked_paths = set()
+
+    def record(self, name, category, start, nbytes=0, **args):
+        """Record an operation that started at ``start`` (a ``time.perf_counter()`` value) and ends now."""
+        end = time.perf_counter()
+        self.events.append(ProfileEvent(name, category, start - self._origin, end - start, int(nbytes), args))
+
+    def count(self, name, value=1):
+        """Increment the counter ``name`` by ``value``."""
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    def summary(self):
+        """Return the number of calls, total time and total bytes of each operation, keyed by ``category/name``."""
+        summary = {}
+        for event in self.events:
+            entry = summary.setdefault(
+                "%s/%s" % (event.category, event.name), {"count": 0, "total_time_in_s": 0.0, "nbytes": 0}
+            )
+            entry["count"] += 1
+            entry["total_time_in_s"] += event.duration
+            entry["nbytes"] += event.nbytes
+        return summary
+
+    def to_dict(self):
+        """Return all events, counters and the summary as a JSON-serializable dict."""
+        return {
+            "events": [event._asdict() for event in self.events],
+            "counters": dict(self.counters),
+            "summary": self.summary(),
+        }
+
+    def to_json(self, path=None):
+        """Return the profile as a JSON string, and write it to ``path`` if given."""
+        text = json.dumps(self.to_dict(), indent=2, default=str)
+        if path is not None:
+            with open(path, "w") as f:
+                f.write(text)
+        return text
+
+    def to_chrome_trace(self, path=None):
+        """Return the profile in Chrome trace event format, and write it to ``path`` if given.
+
+        The output can be loaded in ``chrome://tracing`` or https://ui.perfetto.dev.
+        """
+        pid = os.getpid()
+        trace_events = [
+            {
+                "name": event.name,
+                "cat": event.category,
+                "ph": "X",
+                "ts": event.start * 1e6,
+                "dur": event.duration * 1e6,
+                "pid": pid,
+                "tid": 0,
+                "args": dict(event.args, nbytes=event.nbytes),
+            }
+            for event in self.events
+        ]
+        trace_events.extend(
+            {"name": name, "ph": "C", "ts": 0, "pid": pid, "tid": 0, "args": {name: value}}
+            for name, value in self.counters.items()
+        )
+        trace = {"traceEvents": trace_events, "displayTimeUnit": "ms"}
+        if path is not None:
+            with open(path, "w") as f:
+                json.dump(trace, f, default=str)
+        return trace
+
+    def is_tracked(self, namespace):
+        return self.namespaces is None or namespace in self.namespaces
+
+    def _patch(self, owner, attr, make_wrapper):
+        original = owner.__dict__.get(attr, _MISSING)
+        self._patches.append((owner, attr, original))
+        setattr(owner, attr, make_wrapper(getattr(owner, attr)))
+
+    def _install(self):
+        self._patch(FiberPhotometryTable, "add_row", self._wrap_add_row)
+        self._patch(ObjectMapper, "build", self._wrap_build)
+        self._patch(ObjectMapper, "construct", self._wrap_construct)
+        self._patch(HDF5IO, "write_group", self._wrap_write_group)
+        self._patch(HDF5IO, "write_dataset", self._wrap_write_dataset)
+        # Private in HDMF; only instrumented when present under the expected mangled names
+        if "_HDF5IO__add_refs" in HDF5IO.__dict__:
+            self._patch(HDF5IO, "_HDF5IO__add_refs", self._wrap_add_refs)
+        if "_HDF5IO__get_ref" in HDF5IO.__dict__:
+            self._patch(HDF5IO, "_HDF5IO__get_ref", self._wrap_get_ref)
+        self._patch(h5py.Dataset, "__getitem__", self._wrap_dataset_getitem)
+
+    def _uninstall(self):
+        for owner, attr, original in reversed(self._patches):
+            if original is _MISSING:
+                delattr(owner, attr)
+            else:
+                setattr(owner, attr, original)
+        self._patches = []
+
+    def _wrap_add_row(self, add_row):
+        profiler = self
+
+        def wrapper(table, *args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return add_row(table, *args, **kwargs)
+            finally:
+                profiler.record("add_row", "table", start, table=table.name)
+
+        return wrapper
+
+    def _wrap_build(self, build):
+        profiler = self
+
+        def wrapper(mapper, *args, **kwargs):
+            container = args[0] if args else kwargs.get("container")
+            if not profiler.is_tracked(getattr(container, "namespace", None)):
+                return build(mapper, *args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return build(mapper, *args, **kwargs)
+            finally:
+                profiler.record("build", "build", start, object=container.name, neurodata_type=container.neurodata_type)
+
+        return wrapper
+
+    def _wrap_construct(self, construct):
+        profiler = self
+
+        def wrapper(mapper, *args, **kwargs):
+            builder = args[0] if args else kwargs.get("builder")
+            attributes = getattr(builder, "attributes", {})
+            if not profiler.is_tracked(attributes.get("namespace")):
+                return construct(mapper, *args, **kwargs)
+            profiler._tracked_paths.add(_builder_path(builder))
+            start = time.perf_counter()
+            try:
+                return construct(mapper, *args, **kwargs)
+            finally:
+                profiler.record(
+                    "construct",
+                    "read",
+                    start,
+                    object=builder.name,
+                    neurodata_type=attributes.get("neurodata_type"),
+                )
+
+        return wrapper
+
+    def _wrap_write_group(self, write_group):
+        profiler = self
+
+        def wrapper(io, *args, **kwargs):
+            builder = args[1] if len(args) > 1 else kwargs.get("builder")
+            profiler._group_stack.append(profiler.is_tracked(builder.attributes.get("namespace")))
+            try:
+                return write_group(io, *args, **kwargs)
+            finally:
+                profiler._group_stack.pop()
+
+        return wrapper
+
+    def _wrap_write_dataset(self, write_dataset):
+        profiler = self
+
+        def wrapper(io, *args, **kwargs):
+            parent = args[0] if args else kwargs.get("parent")
+            builder = args[1] if len(args) > 1 else kwargs.get("builder")
+            if not (any(profiler._group_stack) or profiler.is_tracked(builder.attributes.get("namespace"))):
+                return write_dataset(io, *args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return write_dataset(io, *args, **kwargs)
+            finally:
+                dataset = parent.get(builder.name, getlink=False)
+                nbytes, stored_nbytes, compression = 0, 0, None
+                if isinstance(dataset, h5py.Dataset):
+                    nbytes = dataset.size * dataset.dtype.itemsize
+                    stored_nbytes = dataset.id.get_storage_size()
+                    compression = dataset.compression
+                profiler.record(
+                    "write_dataset",
+                    "write",
+                    start,
+                    nbytes=nbytes,
+                    path="%s/%s" % (parent.name.rstrip("/"), builder.name),
+                    stored_nbytes=stored_nbytes,
+                    compression=compression,
+                )
+
+        return wrapper
+
+    def _wrap_add_refs(self, add_refs):
+        profiler = self
+
+        def wrapper(io, *args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return add_refs(io, *args, **kwargs)
+            finally:
+                profiler.record("resolve_references", "write", start)
+
+        return wrapper
+
+    def _wrap_get_ref(self, get_ref):
+        profiler = self
+
+        def wrapper(io, *args, **kwargs):
+            profiler.count("references_resolved")
+            return get_ref(io, *args, **kwargs)
+
+        return wrapper
+
+    def _wrap_dataset_getitem(self, getitem):
+        profiler = self
+
+        def wrapper(dataset, *args, **kwargs):
+            name = dataset.name or ""
+            if not any(name.startswith(path) for path in profiler._tracked_paths):
+                return getitem(dataset, *args, **kwargs)
+            start = time.perf_counter()
+            result = getitem(dataset, *args, **kwargs)
+            profiler.record("read_dataset", "read", start, nbytes=getattr(result, "nbytes", 0), path=name)
+            return result
+
+        return wrapper
+
+
+def _builder_path(builder):
+    location = getattr(builder, "location", None) or ""
+    return "%s/%s/" % (location.rstrip("/"), builder.name)
+
+
+_profile_lock = threading.Lock()
+
+
+@contextmanager
+def profile(namespaces=DEFAULT_NAMESPACES):
+    """Profile table construction, object mapping and HDF5 I/O of the extension's types within a ``with`` block.
+
+    Parameters
+    ----------
+    namespaces : iterable of str or None
+        Only objects of neurodata types in these namespaces (and datasets inside their groups) are recorded.
+        Pass None to record all objects.
+
+    Yields
+    ------
+    Profiler
+        The profiler collecting the events. It remains usable after the block exits.
+    """
+    global _active_profiler
+    with _profile_lock:
+        if _active_profiler is not None:
+            raise RuntimeError("A profiling session is already active; nested profile() blocks are not supported.")
+        profiler = Profiler(namespaces=namespaces)
+        _active_profiler = profiler
+        profiler._install()
+    try:
+        yield profiler
+    finally:
+        with _profile_lock:
+            profiler._uninstall()
+            _active_profiler = None
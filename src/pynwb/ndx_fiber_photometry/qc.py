@@ -0,0 +1,352 @@
+"""Single-pass quality-control metrics of response series, for every fiber at once.
+
+:func:`compute_qc_metrics` streams a ``FiberPhotometryResponseSeries`` (and optionally its isosbestic control) chunk
+by chunk through a :class:`QCMetricsAccumulator`, which keeps per-fiber running moments merged with the parallel
+algorithm of Chan et al., so the result does not depend on the chunk size and the series is read exactly once. The
+metrics are returned as a ``pandas.DataFrame`` indexed by the ``FiberPhotometryTable`` rows of the series'
+``fiber_photometry_table_region``, and can be cached in a JSON sidecar file next to the NWB file.
+
+Metrics
+-------
+saturation_fraction
+    Fraction of samples at or beyond the detector's saturation range. Without a known range, the fraction of samples
+    equal to the observed minimum or maximum: a clipped trace sits at its extreme values for many samples, while an
+    unclipped one reaches them only once or twice.
+num_gaps, num_dropped_samples
+    Intervals between consecutive ``timestamps`` longer than ``gap_factor`` times the nominal sampling interval (the
+    median interval of the first chunk), and the number of samples missing in them. Always 0 for series with a
+    regular ``rate``.
+snr
+    Mean divided by the noise level, the noise being estimated from first differences as ``std(diff(x)) / sqrt(2)``,
+    which is insensitive to slow drifts such as bleaching.
+bleaching_rate_per_s
+    Least-squares slope of the trace over time divided by its mean, sign-flipped so that decay is positive.
+isosbestic_correlation
+    Pearson correlation between the signal and the isosbestic control of the same ``FiberPhotometryTable`` row.
+"""
+
+import json
+import os
+
+import numpy as np
+
+from ._utils import Timebase, get_num_columns, read_scaled
+
+DEFAULT_CHUNK_SIZE = 100_000
+DEFAULT_GAP_FACTOR = 1.5
+
+QC_COLUMNS = (
+    "column",
+    "saturation_fraction",
+    "num_gaps",
+    "num_dropped_samples",
+    "snr",
+    "bleaching_rate_per_s",
+    "isosbestic_correlation",
+)
+
+
+class _Comoments:
+    """Running means, second moments and co-moment of two column-wise paired variables."""
+
+    def __init__(self, num_columns):
+        self.count = 0
+        self.mean_x = np.zeros(num_columns)
+        self.mean_y = np.zeros(num_columns)
+        self.m2_x = np.zeros(num_columns)
+        self.m2_y = np.zeros(num_columns)
+        self.c_xy = np.zeros(num_columns)
+
+    def update(self, x, y):
+        x, y = np.broadcast_arrays(x, y)
+        count = len(x)
+        if count == 0:
+            return
+        mean_x, mean_y = x.mean(axis=0), y.mean(axis=0)
+        dx, dy = x - mean_x, y - mean_y
+        total = self.count + count
+        delta_x, delta_y = mean_x - self.mean_x, mean_y - self.mean_y
+        weight = self.count * count / total
+        self.m2_x += (dx * dx).sum(axis=0) + delta_x * delta_x * weight
+        self.m2_y += (dy * dy).sum(axis=0) + delta_y * delta_y * weight
+        self.c_xy += (dx * dy).sum(axis=0) + delta_x * delta_y * weight
+        self.mean_x += delta_x * count / total
+        self.mean_y += delta_y * count / total
+        self.count = total
+
+    @property
+    def slope(self):
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return self.c_xy / self.m2_x
+
+    @property
+    def correlation(self):
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return self.c_xy / np.sqrt(self.m2_x * self.m2_y)
+
+
+class QCMetricsAccumulator:
+    """Accumulate the QC metrics of ``num_columns`` fibers from consecutive chunks of samples.
+
+    Parameters
+    ----------
+    num_columns : int
+        Number of fibers (data columns).
+    saturation_range : tuple of (float, float), optional
+        Lowest and highest values, in physical units, that the detector reports without clipping. If not given,
+        samples at the observed extremes are counted as saturated.
+    gap_factor : float
+        Intervals between timestamps longer than ``gap_factor`` nominal sampling intervals are counted as gaps.
+    """
+
+    def __init__(self, num_columns, saturation_range=None, gap_factor=DEFAULT_GAP_FACTOR):
+        self.num_columns = int(num_columns)
+        self.saturation_range = saturation_range
+        self.gap_factor = float(gap_factor)
+        self.num_samples = 0
+        self.num_gaps = 0
+        self.num_dropped_samples = 0
+        self.nominal_interval = None
+        self._num_saturated = np.zeros(self.num_columns, dtype=np.int64)
+        self._maximum = np.full(self.num_columns, -np.inf)
+        self._minimum = np.full(self.num_columns, np.inf)
+        self._num_at_maximum = np.zeros(self.num_columns, dtype=np.int64)
+        self._num_at_minimum = np.zeros(self.num_columns, dtype=np.int64)
+        self._time_and_data = _Comoments(self.num_columns)
+        self._differences = _Comoments(self.num_columns)
+        self._isosbestic = _Comoments(self.num_columns)
+        self._last_sample = None
+        self._last_timestamp = None
+
+    def update(self, data, timestamps, isosbestic=None):
+        """Add a chunk of samples.
+
+        Parameters
+        ----------
+        data : array-like of shape (num_samples, num_columns)
+            The samples, in physical units.
+        timestamps : array-like of shape (num_samples,)
+            The time of each sample, in seconds.
+        isosbestic : array-like of shape (num_samples, num_columns), optional
+            The isosbestic control samples of the same fibers. Columns of NaN give a NaN correlation.
+        """
+        data = np.asarray(data, dtype=float).reshape(len(data), -1)
+        timestamps = np.asarray(timestamps, dtype=float)
+        if len(data) == 0:
+            return
+        self.num_samples += len(data)
+
+        if self.saturation_range is not None:
+            low, high = self.saturation_range
+            self._num_saturated += ((data <= low) | (data >= high)).sum(axis=0)
+        self._update_extreme(data.max(axis=0), (data == data.max(axis=0)).sum(axis=0), self._maximum, 1)
+        self._update_extreme(data.min(axis=0), (data == data.min(axis=0)).sum(axis=0), self._minimum, -1)
+
+        if self._last_sample is not None:
+            differences = np.diff(np.concatenate([self._last_sample, data]), axis=0)
+        else:
+            differences = np.diff(data, axis=0)
+        self._differences.update(differences, differences)
+        self._last_sample = data[-1:]
+
+        self._time_and_data.update(timestamps[:, np.newaxis], data)
+        if isosbestic is not None:
+            self._isosbestic.update(data, np.asarray(isosbestic, dtype=float).reshape(len(data), -1))
+        self._update_gaps(timestamps)
+
+    def _update_extreme(self, chunk_extreme, chunk_count, extreme, sign):
+        counts = self._num_at_maximum if sign > 0 else self._num_at_minimum
+        beyond = sign * chunk_extreme > sign * extreme
+        equal = chunk_extreme == extreme
+        counts[beyond] = chunk_count[beyond]
+        counts[equal] += chunk_count[equal]
+        extreme[beyond] = chunk_extreme[beyond]
+
+    def _update_gaps(self, timestamps):
+        if self._last_timestamp is not None:
+            timestamps = np.concatenate([[self._last_timestamp], timestamps])
+        self._last_timestamp = timestamps[-1]
+        intervals = np.diff(timestamps)
+        if len(intervals) == 0:
+            return
+        if self.nominal_interval is None:
+            self.nominal_interval = float(np.median(intervals))
+        gaps = intervals[intervals > self.gap_factor * self.nominal_interval]
+        self.num_gaps += len(gaps)
+        self.num_dropped_samples += int(np.rint(gaps / self.nominal_interval).sum()) - len(gaps)
+
+    def result(self):
+        """Return the metrics accumulated so far as a dict of arrays with one value per column."""
+        num_samples = max(self.num_samples, 1)
+        if self.saturation_range is not None:
+            saturation_fraction = self._num_saturated / num_samples
+        else:
+            num_extreme = self._num_at_maximum + np.where(self._maximum == self._minimum, 0, self._num_at_minimum)
+            saturation_fraction = num_extreme / num_samples
+        with np.errstate(divide="ignore", invalid="ignore"):
+            noise = np.sqrt(self._differences.m2_x / max(self._differences.count - 1, 1) / 2.0)
+            mean = self._time_and_data.mean_y
+            snr = mean / noise
+            bleaching_rate = -self._time_and_data.slope / mean
+        if self._isosbestic.count:
+            isosbestic_correlation = self._isosbestic.correlation
+        else:
+            isosbestic_correlation = np.full(self.num_columns, np.nan)
+        return {
+            "column": np.arange(self.num_columns),
+            "saturation_fraction": saturation_fraction,
+            "num_gaps": np.full(self.num_columns, self.num_gaps),
+            "num_dropped_samples": np.full(self.num_columns, self.num_dropped_samples),
+            "snr": snr,
+            "bleaching_rate_per_s": bleaching_rate,
+            "isosbestic_correlation": isosbestic_correlation,
+        }
+
+
+def _table_rows(series, num_columns):
+    region = getattr(series, "fiber_photometry_table_region", None)
+    if region is None:
+        return None
+    rows = np.asarray(region.data[:], dtype=int)
+    if len(rows) != num_columns:
+        raise ValueError(
+            "'%s' has %d data columns but its fiber_photometry_table_region has %d rows."
+            % (series.name, num_columns, len(rows))
+        )
+    return rows
+
+
+def _isosbestic_columns(series, isosbestic, num_columns):
+    """Return, for each column of ``series``, the matching column of ``isosbestic`` or -1, matched by table row."""
+    num_isosbestic_columns = get_num_columns(isosbestic)
+    rows, isosbestic_rows = _table_rows(series, num_columns), _table_rows(isosbestic, num_isosbestic_columns)
+    if rows is None or isosbestic_rows is None:
+        if num_isosbestic_columns != num_columns:
+            raise ValueError(
+                "'%s' and '%s' have different numbers of columns and cannot be matched by "
+                "fiber_photometry_table_region." % (series.name, isosbestic.name)
+            )
+        return np.arange(num_columns)
+    lookup = {row: column for column, row in enumerate(isosbestic_rows.tolist())}
+    return np.array([lookup.get(row, -1) for row in rows.tolist()])
+
+
+def _cache_entry_key(series):
+    """Return ``(file path, key, fingerprint)`` identifying the stored data of ``series``, or None if in memory."""
+    dataset = series.data
+    filename = getattr(getattr(dataset, "file", None), "filename", None)
+    if filename is None or not os.path.exists(filename):
+        return None
+    stat = os.stat(filename)
+    fingerprint = [stat.st_size, stat.st_mtime_ns, list(dataset.shape), str(dataset.dtype)]
+    return filename, dataset.name, fingerprint
+
+
+def default_cache_path(series):
+    """Return the path of the QC sidecar file of the NWB file that ``series`` was read from."""
+    entry = _cache_entry_key(series)
+    if entry is None:
+        raise ValueError("'%s' is not read from a file; its QC metrics cannot be cached." % series.name)
+    return entry[0] + ".qc.json"
+
+
+def compute_qc_metrics(
+    series,
+    isosbestic=None,
+    saturation_range=None,
+    gap_factor=DEFAULT_GAP_FACTOR,
+    chunk_size=DEFAULT_CHUNK_SIZE,
+    cache=None,
+):
+    """Compute the QC metrics of every fiber of a response series in one pass over its data.
+
+    Parameters
+    ----------
+    series : FiberPhotometryResponseSeries
+        The series to check. Its data are read ``chunk_size`` samples at a time and scaled to physical units.
+    isosbestic : FiberPhotometryResponseSeries, optional
+        The isosbestic control recorded on the same timebase. Its columns are matched to those of ``series`` by
+        ``FiberPhotometryTable`` row when both series have a ``fiber_photometry_table_region``, else by position.
+    saturation_range : tuple of (float, float), optional
+        Lowest and highest values, in physical units, that the detector reports without clipping.
+    gap_factor : float
+        Intervals between timestamps longer than ``gap_factor`` nominal sampling intervals are counted as gaps.
+    chunk_size : int
+        Number of samples read at a time.
+    cache : bool or str, optional
+        If True, results are stored in and reused from ``<nwb file>.qc.json``; a string gives the path of the
+        sidecar file to use instead. Cached results are reused only while the NWB file is unchanged and the
+        parameters are the same. Ignored for series that are not read from a file.
+
+    Returns
+    -------
+    pandas.DataFrame
+        One row per fiber, indexed by ``FiberPhotometryTable`` row (``fiber_photometry_table_row``) if the series has
+        a ``fiber_photometry_table_region``. The ``column`` column is the data column of each fiber.
+    """
+    import pandas as pd
+
+    num_columns = get_num_columns(series)
+    rows = _table_rows(series, num_columns)
+    isosbestic_columns = None
+    if isosbestic is not None:
+        if len(isosbestic.data) != len(series.data):
+            raise ValueError("'%s' and '%s' have different numbers of samples." % (series.name, isosbestic.name))
+        isosbestic_columns = _isosbestic_columns(series, isosbestic, num_columns)
+
+    parameters = {
+        "isosbestic": None if isosbestic is None else getattr(isosbestic.data, "name", isosbestic.name),
+        "saturation_range": None if saturation_range is None else [float(value) for value in saturation_range],
+        "gap_factor": float(gap_factor),
+    }
+    entry = _cache_entry_key(series) if cache else None
+    cache_path = None
+    if entry is not None:
+        cache_path = default_cache_path(series) if cache is True else cache
+        cached = _read_cache(cache_path).get(entry[1])
+        if cached is not None and cached["fingerprint"] == entry[2] and cached["parameters"] == parameters:
+            metrics = {name: np.asarray(values, dtype=float) for name, values in cached["metrics"].items()}
+            return _to_dataframe(pd, metrics, rows)
+
+    accumulator = QCMetricsAccumulator(num_columns, saturation_range=saturation_range, gap_factor=gap_factor)
+    timebase = Timebase(series)
+    for start in range(0, len(series.data), int(chunk_size)):
+        stop = min(start + int(chunk_size), len(series.data))
+        data = read_scaled(series, start, stop)
+        isosbestic_data = None
+        if isosbestic is not None:
+            isosbestic_data = np.full_like(data, np.nan)
+            matched = isosbestic_columns >= 0
+            isosbestic_data[:, matched] = read_scaled(isosbestic, start, stop)[:, isosbestic_columns[matched]]
+        accumulator.update(data, timebase.time_slice(start, stop), isosbestic_data)
+    metrics = accumulator.result()
+
+    if cache_path is not None:
+        contents = _read_cache(cache_path)
+        contents[entry[1]] = {
+            "fingerprint": entry[2],
+            "parameters": parameters,
+            "metrics": {
+                name: [None if np.isnan(v) else v for v in values.tolist()] for name, values in metrics.items()
+            },
+        }
+        with open(cache_path, "w") as f:
+            json.dump(contents, f, indent=2)
+    return _to_dataframe(pd, metrics, rows)
+
+
+def _read_cache(path):
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def _to_dataframe(pd, metrics, rows):
+    dataframe = pd.DataFrame({name: metrics[name] for name in QC_COLUMNS})
+    dataframe["column"] = dataframe["column"].astype(int)
+    for name in ("num_gaps", "num_dropped_samples"):
+        dataframe[name] = dataframe[name].astype(int)
+    if rows is not None:
+        dataframe.index = pd.Index(rows, name="fiber_photometry_table_row")
+    return dataframe
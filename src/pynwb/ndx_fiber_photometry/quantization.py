@@ -0,0 +1,108 @@
+"""Lossless integer storage of raw photodetector traces.
+
+Raw photodetector output is digitized by an ADC, so every sample is ``code * step + offset`` for some integer
+``code``. :func:`quantize_data` recovers the integer codes together with the ``conversion`` (``step``) and ``offset``
+that ``TimeSeries`` applies on read, so that the data can be stored as int16/int32 instead of float64.
+
+Example
+-------
+>>> quantized = quantize_data(raw_volts)
+>>> series = FiberPhotometryResponseSeries(
+...     name="raw", description="raw photodetector output", unit="volts", rate=1000.0,
+...     data=quantized.data, conversion=quantized.conversion, offset=quantized.offset,
+... )
+>>> np.array_equal(series.get_data_in_units(), raw_volts)  # up to floating point rounding
+"""
+
+from collections import namedtuple
+
+import numpy as np
+
+QuantizedData = namedtuple("QuantizedData", ["data", "conversion", "offset"])
+QuantizedData.__doc__ = """Integer codes with the scaling that maps them back to physical units.
+
+Values in physical units are ``data * conversion + offset``.
+"""
+
+INTEGER_DTYPES = (np.int16, np.int32)
+
+# Largest deviation from the integer grid, in units of the quantization step, accepted as a lossless round trip
+DEFAULT_TOLERANCE = 1e-6
+
+
+def estimate_quantization_step(data):
+    """Estimate the quantization step (ADC resolution) of ``data`` as the smallest gap between distinct values.
+
+    Returns 1.0 for integer data and for constant data.
+    """
+    data = np.asarray(data)
+    if np.issubdtype(data.dtype, np.integer):
+        return 1.0
+    values = np.unique(data[np.isfinite(data)])
+    if len(values) < 2:
+        return 1.0
+    return float(np.diff(values).min())
+
+
+def select_integer_dtype(num_levels):
+    """Return the narrowest of int16 and int32 that can hold ``num_levels`` distinct codes."""
+    for dtype in INTEGER_DTYPES:
+        if num_levels <= 2 ** (8 * np.dtype(dtype).itemsize):
+            return np.dtype(dtype)
+    raise ValueError("%d quantization levels do not fit in an int32." % num_levels)
+
+
+def quantize_data(data, conversion=None, offset=None, dtype=None, verify=True, tolerance=DEFAULT_TOLERANCE):
+    """Convert ADC-origin floating point data to integer codes with a ``conversion`` and ``offset``.
+
+    Parameters
+    ----------
+    data : array-like
+        The samples, in physical units. Must be finite.
+    conversion : float, optional
+        The quantization step (e.g. the ADC resolution in volts). Estimated from the data if not given.
+    offset : float, optional
+        The value of code 0. Defaults to a value on the quantization grid near the middle of the data range, so
+        that the codes use the signed integer range symmetrically.
+    dtype : numpy dtype, optional
+        The integer dtype of the codes. Defaults to the narrowest of int16 and int32 holding the data range.
+    verify : bool
+        If True, raise ValueError unless the codes reproduce ``data`` to within ``tolerance`` quantization steps.
+    tolerance : float
+        Largest deviation from the integer grid, in quantization steps, accepted when ``verify`` is True.
+
+    Returns
+    -------
+    QuantizedData
+    """
+    data = np.asarray(data)
+    if data.size == 0:
+        raise ValueError("Cannot quantize empty data.")
+    if not np.isfinite(data).all():
+        raise ValueError("Cannot quantize data with NaN or infinite values.")
+    if conversion is None:
+        conversion = estimate_quantization_step(data)
+    conversion = float(conversion)
+    if conversion <= 0:
+        raise ValueError("conversion must be positive, got %s." % conversion)
+
+    minimum, maximum = float(data.min()), float(data.max())
+    num_levels = int(np.rint((maximum - minimum) / conversion)) + 1
+    if offset is None:
+        offset = minimum + (num_levels // 2) * conversion
+    offset = float(offset)
+    dtype = select_integer_dtype(num_levels) if dtype is None else np.dtype(dtype)
+
+    scaled = (data - offset) / conversion
+    codes = np.rint(scaled)
+    info = np.iinfo(dtype)
+    if codes.min() < info.min or codes.max() > info.max:
+        raise ValueError("The quantized data do not fit in %s with the given conversion and offset." % dtype)
+    if verify:
+        error = np.abs(scaled - codes).max()
+        if error > tolerance:
+            raise ValueError(
+                "Data are not on a uniform quantization grid with step %g (largest deviation %.3g steps); "
+                "pass the ADC resolution as 'conversion' or store the data as floating point." % (conversion, error)
+            )
+    return QuantizedData(data=codes.astype(dtype), conversion=conversion, offset=offset)
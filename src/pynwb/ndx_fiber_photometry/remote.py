@@ -0,0 +1,248 @@
+"""Read fiber photometry files from object stores through a block cache with coalesced range requests.
+
+HDF5 reads metadata in many small pieces, which over HTTP turns into hundreds of tiny range requests. Here files are
+read through :class:`CachedRangeFile`, which fetches whole blocks, merges adjacent missing blocks into one request
+and keeps recently used blocks in memory. :func:`open_remote_nwbfile` additionally prefetches the ``FiberPhotometry``
+metadata groups (the fiber photometry table, indicators, viruses and virus injections) and the devices they
+reference in as few coalesced requests as possible, before PyNWB reads them. Their byte ranges are only known once
+their object headers have been read, so on the first open of a file in a process the headers outside the head of the
+file are still read block by block, and only the raw data of their datasets is prefetched.
+
+Byte ranges are fetched by a fetcher: any object with a ``size`` attribute and a ``fetch(start, stop)`` method
+returning ``bytes``. :class:`FsspecRangeFetcher` reads any URL supported by fsspec (``s3://``, ``gs://``,
+``https://``, ...); fsspec is only required when it is used, and is installed with its HTTP backend by the
+``remote`` extra (``pip install ndx-fiber-photometry[remote]``).
+"""
+
+import io
+from collections import OrderedDict
+
+import h5py
+
+DEFAULT_BLOCK_SIZE = 256 * 1024
+DEFAULT_MAX_BLOCKS = 512
+DEFAULT_HEAD_SIZE = 1024 * 1024
+# Missing blocks separated by at most this many cached or unneeded blocks are fetched in a single request
+DEFAULT_MAX_GAP_BLOCKS = 16
+
+# Groups prefetched by open_remote_nwbfile: the FiberPhotometry metadata and the devices its table references
+METADATA_PATHS = ("/general/fiber_photometry", "/general/devices")
+
+# Byte ranges of the metadata of files opened in this process, keyed by source and file size
+_metadata_ranges_cache = {}
+
+
+class FsspecRangeFetcher:
+    """Fetch byte ranges of a file through fsspec."""
+
+    def __init__(self, url, **storage_options):
+        try:
+            import fsspec
+        except ImportError as e:
+            raise ImportError("Reading remote files requires fsspec: pip install ndx-fiber-photometry[remote]") from e
+        self.fs, self.path = fsspec.core.url_to_fs(url, **storage_options)
+        self.size = int(self.fs.size(self.path))
+
+    def fetch(self, start, stop):
+        return self.fs.cat_file(self.path, start=start, end=stop)
+
+
+class CachedRangeFile(io.RawIOBase):
+    """A read-only, seekable file object over a range fetcher, with an LRU cache of fixed-size blocks.
+
+    Attributes
+    ----------
+    num_requests : int
+        Number of range requests sent to the fetcher.
+    bytes_fetched : int
+        Number of bytes received from the fetcher.
+    """
+
+    def __init__(self, fetcher, block_size=DEFAULT_BLOCK_SIZE, max_blocks=DEFAULT_MAX_BLOCKS):
+        super().__init__()
+        self.fetcher = fetcher
+        self.size = int(fetcher.size)
+        self.block_size = int(block_size)
+        self.max_blocks = int(max_blocks)
+        self.num_requests = 0
+        self.bytes_fetched = 0
+        self._blocks = OrderedDict()
+        self._position = 0
+
+    @property
+    def num_blocks(self):
+        return -(-self.size // self.block_size)
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._position
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_SET:
+            self._position = offset
+        elif whence == io.SEEK_CUR:
+            self._position += offset
+        elif whence == io.SEEK_END:
+            self._position = self.size + offset
+        else:
+            raise ValueError("invalid whence (%r)" % whence)
+        return self._position
+
+    def readinto(self, buffer):
+        view = memoryview(buffer).cast("B")
+        start = min(self._position, self.size)
+        stop = min(start + len(view), self.size)
+        if stop <= start:
+            return 0
+        self._ensure_blocks(range(start // self.block_size, (stop - 1) // self.block_size + 1))
+        written = 0
+        position = start
+        while position < stop:
+            index, block_offset = divmod(position, self.block_size)
+            block = self._blocks[index]
+            self._blocks.move_to_end(index)
+            count = min(len(block) - block_offset, stop - position)
+            view[written : written + count] = block[block_offset : block_offset + count]
+            written += count
+            position += count
+        self._position = stop
+        # evicting only once the read is copied keeps every block of a read larger than the cache available to it
+        self._evict()
+        return written
+
+    def prefetch(self, ranges, max_gap_blocks=DEFAULT_MAX_GAP_BLOCKS):
+        """Fetch the blocks covering the given ``(start, stop)`` byte ranges, coalescing nearby blocks into one request.
+
+        Returns the number of requests sent.
+        """
+        indices = set()
+        for start, stop in ranges:
+            start, stop = max(int(start), 0), min(int(stop), self.size)
+            if stop > start:
+                indices.update(range(start // self.block_size, (stop - 1) // self.block_size + 1))
+        requests = self._ensure_blocks(sorted(indices), max_gap_blocks=max_gap_blocks)
+        self._evict()
+        return requests
+
+    def _ensure_blocks(self, indices, max_gap_blocks=0):
+        missing = [index for index in indices if index not in self._blocks]
+        requests = 0
+        run_start = None
+        previous = None
+        for index in missing + [None]:
+            if run_start is not None and (index is None or index - previous > max_gap_blocks + 1):
+                self._fetch_blocks(run_start, previous + 1)
+                requests += 1
+                run_start = None
+            if index is not None and run_start is None:
+                run_start = index
+            previous = index
+        return requests
+
+    def _fetch_blocks(self, first, stop):
+        start = first * self.block_size
+        data = self.fetcher.fetch(start, min(stop * self.block_size, self.size))
+        self.num_requests += 1
+        self.bytes_fetched += len(data)
+        for index in range(first, stop):
+            offset = (index - first) * self.block_size
+            self._blocks[index] = bytes(data[offset : offset + self.block_size])
+            self._blocks.move_to_end(index)
+
+    def _evict(self):
+        """Drop the least recently used blocks beyond ``max_blocks``."""
+        while len(self._blocks) > self.max_blocks:
+            self._blocks.popitem(last=False)
+
+
+def _object_ranges(obj):
+    """Return the ``(start, stop)`` byte ranges of the object header of an HDF5 object and of its raw data."""
+    info = h5py.h5o.get_info(obj.id)
+    ranges = [(info.addr, info.addr + info.hdr.space.total)]
+    if isinstance(obj, h5py.Dataset):
+        if obj.chunks is None:
+            offset = obj.id.get_offset()
+            if offset is not None:
+                ranges.append((offset, offset + obj.id.get_storage_size()))
+        else:
+            for index in range(obj.id.get_num_chunks()):
+                chunk = obj.id.get_chunk_info(index)
+                ranges.append((chunk.byte_offset, chunk.byte_offset + chunk.size))
+    return ranges
+
+
+def metadata_ranges(h5file, paths=METADATA_PATHS):
+    """Return the byte ranges of the headers and raw data of all objects under ``paths`` in an open ``h5py.File``."""
+    ranges = []
+
+    def visit(name, obj):
+        ranges.extend(_object_ranges(obj))
+
+    for path in paths:
+        if path in h5file:
+            ranges.extend(_object_ranges(h5file[path]))
+            h5file[path].visititems(visit)
+    return ranges
+
+
+def _source_key(source, fetcher):
+    key = source if isinstance(source, str) else getattr(fetcher, "url", getattr(fetcher, "path", None))
+    return None if key is None else (key, fetcher.size)
+
+
+def open_remote_nwbfile(
+    source,
+    block_size=DEFAULT_BLOCK_SIZE,
+    max_blocks=DEFAULT_MAX_BLOCKS,
+    head_size=DEFAULT_HEAD_SIZE,
+    prefetch_metadata=True,
+    **storage_options,
+):
+    """Open an NWB file for reading through a :class:`CachedRangeFile`.
+
+    Parameters
+    ----------
+    source : str or fetcher
+        A URL or path understood by fsspec, or a fetcher object with ``size`` and ``fetch(start, stop)``.
+    block_size : int
+        Size of the cached blocks, in bytes. Every request fetches a whole number of blocks.
+    max_blocks : int
+        Maximum number of blocks kept in memory.
+    head_size : int
+        Number of bytes fetched from the start of the file in the first request. The superblock and the root
+        metadata are stored there.
+    prefetch_metadata : bool
+        Whether to prefetch the object headers and datasets of the ``FiberPhotometry`` metadata groups and of the
+        devices they reference before PyNWB reads the file. On the first open of a file in this process, the object
+        headers are found by walking these groups, which reads the headers outside the first ``head_size`` bytes block
+        by block; only the raw data of their datasets is then fetched in coalesced requests. The byte ranges are
+        remembered for the rest of the process, so that reopening the same file fetches all of them together with the
+        head of the file, in coalesced requests, before any HDF5 metadata is parsed.
+    **storage_options
+        Passed to fsspec when ``source`` is a URL.
+
+    Returns
+    -------
+    tuple of (NWBHDF5IO, CachedRangeFile)
+        The IO object, to be closed by the caller, and the cached file, whose ``num_requests`` and
+        ``bytes_fetched`` report the traffic so far.
+    """
+    from pynwb import NWBHDF5IO
+
+    fetcher = FsspecRangeFetcher(source, **storage_options) if isinstance(source, str) else source
+    cached_file = CachedRangeFile(fetcher, block_size=block_size, max_blocks=max_blocks)
+    key = _source_key(source, fetcher)
+    known_ranges = _metadata_ranges_cache.get(key) if prefetch_metadata else None
+    cached_file.prefetch([(0, head_size)] + (known_ranges or []))
+    h5file = h5py.File(cached_file, mode="r")
+    if prefetch_metadata and known_ranges is None:
+        ranges = metadata_ranges(h5file)
+        cached_file.prefetch(ranges)
+        if key is not None:
+            _metadata_ranges_cache[key] = ranges
+    return NWBHDF5IO(file=h5file, mode="r", load_namespaces=True), cached_file
@@ -0,0 +1,220 @@
+"""Share the rig-level fiber photometry metadata of many sessions through one rig file.
+
+Devices, device models, indicators and the static columns of the ``FiberPhotometryTable`` (locations, wavelengths
+and device references) rarely change between the sessions recorded on one rig. :func:`write_rig_file` writes them
+once to a rig file, itself a regular NWB file. :func:`add_rig_to_nwbfile` adds them to a session, where they are
+written as HDF5 external links into the rig file by :func:`write_session_file`:
+
+* ``/general/devices/<device>`` and the groups of the ``FiberPhotometry`` metadata (indicators, viruses, virus
+  injections) link to the groups of the rig file;
+* ``/general/fiber_photometry/fiber_photometry_table`` is a group of the session, so that the
+  ``fiber_photometry_table_region`` of its series can reference it, but its ``id`` and columns link to the datasets
+  of the rig table. Session-specific columns, such as ``commanded_voltage_series``, can be added to it and are
+  stored in the session.
+
+Session files are read with any NWB reader, which follows the links to the rig file. :func:`open_session_file`
+additionally shares the objects of the rig between all sessions opened in the same process: the rig file is read
+once by :func:`load_rig`, and the linked objects of every session are the objects of that one read.
+"""
+
+import os
+from contextlib import contextmanager
+
+from pynwb import NWBHDF5IO, get_manager
+
+from .fiber_photometry import EncodedFiberPhotometryTable, FiberPhotometry
+
+# Columns of FiberPhotometryTable that reference series of a session, and the lookup datasets of their encoded form
+SESSION_COLUMNS = ("commanded_voltage_series",)
+_SESSION_COLUMN_NAMES = SESSION_COLUMNS + tuple("%s_elements" % name for name in SESSION_COLUMNS)
+
+# Rig files read in this process, keyed by absolute path, as (modification time, size, io, nwbfile)
+_rig_cache = {}
+# Readers of rig files that were replaced on disk, kept open for the objects still using them
+_replaced_rig_ios = []
+
+
+def _get_fiber_photometry(nwbfile):
+    """Return the ``FiberPhotometry`` lab metadata of ``nwbfile``, or raise a ValueError."""
+    for lab_meta_data in nwbfile.lab_meta_data.values():
+        if isinstance(lab_meta_data, FiberPhotometry):
+            return lab_meta_data
+    raise ValueError("'%s' has no FiberPhotometry lab metadata." % nwbfile.identifier)
+
+
+def write_rig_file(nwbfile, path):
+    """Write the rig-level metadata held by ``nwbfile`` to a rig file.
+
+    Parameters
+    ----------
+    nwbfile : pynwb.NWBFile
+        A file holding only the metadata of the rig: its devices and device models, and a ``FiberPhotometry`` lab
+        metadata with the ``FiberPhotometryTable`` and the indicators it references.
+    path : str
+        Path of the rig file.
+    """
+    table = _get_fiber_photometry(nwbfile).get_fiber_photometry_table()
+    if nwbfile.acquisition or nwbfile.processing:
+        raise ValueError("A rig file holds metadata only; '%s' has acquired or processed data." % nwbfile.identifier)
+    for name in SESSION_COLUMNS:
+        if name in table.colnames:
+            raise ValueError("'%s' references series of a session; add it to the session table instead." % name)
+    # HDF5 cannot overwrite a file that is open for reading
+    cached = _rig_cache.pop(os.path.abspath(path), None)
+    if cached is not None:
+        cached[2].close()
+    with NWBHDF5IO(path, mode="w") as io:
+        io.write(nwbfile)
+
+
+def load_rig(path):
+    """Read a rig file once per process.
+
+    The rig file stays open and its ``NWBFile`` is returned again by later calls with the same path, until the file
+    is modified on disk or written again with :func:`write_rig_file`. The read of a rig file modified on disk stays
+    open for the objects still using it; :func:`clear_rig_cache` closes it.
+
+    Parameters
+    ----------
+    path : str
+        Path of the rig file.
+
+    Returns
+    -------
+    pynwb.NWBFile
+    """
+    path = os.path.abspath(path)
+    stat = os.stat(path)
+    cached = _rig_cache.get(path)
+    if cached is not None and cached[:2] == (stat.st_mtime_ns, stat.st_size):
+        return cached[3]
+    # a rig replaced on disk is read again; the previous read stays open for the objects still using it
+    if cached is not None:
+        _replaced_rig_ios.append(cached[2])
+    io = NWBHDF5IO(path, mode="r")
+    nwbfile = io.read()
+    _rig_cache[path] = (stat.st_mtime_ns, stat.st_size, io, nwbfile)
+    return nwbfile
+
+
+def clear_rig_cache():
+    """Close the rig files read by :func:`load_rig`, including the reads of rig files since replaced on disk."""
+    while _rig_cache:
+        _, (_, _, io, _) = _rig_cache.popitem()
+        io.close()
+    while _replaced_rig_ios:
+        _replaced_rig_ios.pop().close()
+
+
+@contextmanager
+def _scoped_rig(path):
+    """Close the read of the rig file at ``path`` on exit, unless :func:`load_rig` had already cached it on entry."""
+    path = os.path.abspath(path)
+    cached = _rig_cache.get(path)
+    try:
+        yield
+    finally:
+        if path in _rig_cache and _rig_cache[path] is not cached:
+            _rig_cache.pop(path)[2].close()
+
+
+def add_rig_to_nwbfile(nwbfile, rig_path):
+    """Add the metadata of a rig file to a session.
+
+    Parameters
+    ----------
+    nwbfile : pynwb.NWBFile
+        The session. It must not have devices, device models or a ``FiberPhotometry`` lab metadata of the same
+        names as the rig.
+    rig_path : str
+        Path of the rig file, read with :func:`load_rig`. Any file with a ``FiberPhotometry`` lab metadata can serve
+        as the rig; the columns of its table that reference series of that file (``SESSION_COLUMNS``) are skipped.
+
+    Returns
+    -------
+    FiberPhotometryTable
+        The fiber photometry table of the session, whose rows are the rows of the rig table. Create the
+        ``fiber_photometry_table_region`` of the series of the session from this table.
+    """
+    rig = load_rig(rig_path)
+    for device in rig.devices.values():
+        nwbfile.add_device(device)
+    for device_model in rig.device_models.values():
+        nwbfile.add_device_model(device_model)
+
+    rig_fiber_photometry = _get_fiber_photometry(rig)
+    rig_table = rig_fiber_photometry.get_fiber_photometry_table()
+    # columns read from the rig keep the rig table as their parent, so they are written as links to the rig file
+    columns = [column for column in rig_table.columns if column.name not in _SESSION_COLUMN_NAMES]
+    table = type(rig_table)(name=rig_table.name, description=rig_table.description, id=rig_table.id, columns=columns)
+    encoded = isinstance(rig_table, EncodedFiberPhotometryTable)
+    table_slot = "encoded_fiber_photometry_table" if encoded else "fiber_photometry_table"
+    nwbfile.add_lab_meta_data(
+        FiberPhotometry(
+            name=rig_fiber_photometry.name,
+            **{table_slot: table},
+            fiber_photometry_indicators=rig_fiber_photometry.fiber_photometry_indicators,
+            fiber_photometry_viruses=rig_fiber_photometry.fiber_photometry_viruses,
+            fiber_photometry_virus_injections=rig_fiber_photometry.fiber_photometry_virus_injections,
+        )
+    )
+    return table
+
+
+def write_session_file(nwbfile, path, rig_path):
+    """Write a session that references the metadata of a rig file.
+
+    Parameters
+    ----------
+    nwbfile : pynwb.NWBFile
+        A session to which :func:`add_rig_to_nwbfile` added the rig.
+    path : str
+        Path of the session file. The links to the rig file are relative to the directory of the session file, so
+        the two files can be moved together.
+    rig_path : str
+        Path of the rig file.
+    """
+    rig = load_rig(rig_path)
+    rig_manager = rig.get_read_io().manager
+    # objects known to the manager with the builders read from the rig file are written as links to the rig file; a
+    # new manager per session keeps the sessions out of the manager of the cached rig
+    manager = get_manager()
+    for rig_object in rig.objects.values():
+        manager.prebuilt(rig_object, rig_manager.get_builder(rig_object))
+    with NWBHDF5IO(path, mode="w", manager=manager) as io:
+        io.write(nwbfile)
+
+
+def _link_targets(builder):
+    """Yield the builders that the links under ``builder`` point to, without following the links."""
+    for link in builder.links.values():
+        yield link.builder
+    for group in builder.groups.values():
+        yield from _link_targets(group)
+
+
+def open_session_file(path):
+    """Open a session file whose rig metadata is shared with the other sessions opened in this process.
+
+    Parameters
+    ----------
+    path : str
+        Path of the session file.
+
+    Returns
+    -------
+    pynwb.NWBHDF5IO
+        The reader of the session. The devices, indicators and table columns returned by its ``read()`` are the
+        objects of the rig read by :func:`load_rig`.
+    """
+    io = NWBHDF5IO(path, mode="r")
+    source = os.path.abspath(path)
+    # rig metadata is linked under /general only; links elsewhere, e.g. to raw data, are left to PyNWB
+    for target in _link_targets(io.read_builder()["general"]):
+        if target.source == source:
+            continue
+        rig_object = load_rig(target.source).objects.get(target.attributes.get("object_id"))
+        if rig_object is not None:
+            # the container built for the rig file is returned instead of building the linked object again
+            io.manager.prebuilt(rig_object, target)
+    return io
@@ -0,0 +1,400 @@
+"""Synthetic fiber photometry sessions of any size, generated chunk by chunk.
+
+:class:`FiberPhotometrySimulation` models ``num_fibers`` fibers recorded with a 470 nm (calcium-dependent) and a
+405 nm (isosbestic) LED. Each fiber has
+
+- a bi-exponential photobleaching decay of its baseline fluorescence, different for each LED,
+- calcium transients (difference-of-exponentials kernels at Poisson times) in the 470 nm channel only,
+- motion artifacts (brief multiplicative dips at Poisson times shared by all fibers, with fiber-specific depths) in
+  both channels, so that they can be removed with the isosbestic control,
+- Gaussian detector noise.
+
+By default the simulation produces demodulated ``signal`` and ``isosbestic`` series. With
+``modulation_frequencies_in_hz``, the LEDs are sinusoidally modulated, as recorded by the ``CommandedVoltageSeries``,
+and the simulation produces the ``raw`` photodetector output carrying both channels on their carrier frequencies.
+
+All random draws are keyed by ``seed`` and by fixed-size blocks of samples, so any sample range can be generated
+independently and the output does not depend on how the session is chunked. :meth:`FiberPhotometrySimulation.iterator`
+returns a data chunk iterator that streams a channel into a file without holding it in memory, and
+:meth:`FiberPhotometrySimulation.add_to_nwbfile` adds the complete ``FiberPhotometry`` metadata and all series to an
+``NWBFile``.
+
+Example
+-------
+>>> simulation = FiberPhotometrySimulation(num_fibers=16, duration_in_s=24 * 3600.0, rate=100.0, seed=1)
+>>> nwbfile = simulation.add_to_nwbfile(mock_NWBFile())
+>>> with NWBHDF5IO("simulated.nwb", mode="w") as io:
+...     io.write(nwbfile)
+"""
+
+import numpy as np
+from hdmf.data_utils import GenericDataChunkIterator
+
+from ._utils import iterator_shapes
+from .fiber_photometry import CommandedVoltageSeries, FiberPhotometryResponseSeries, FiberPhotometryTable
+
+DEFAULT_BUFFER_SIZE = 100_000
+# Number of samples per HDF5 chunk of the written series
+CHUNK_SIZE = 10_000
+EXCITATION_WAVELENGTHS_IN_NM = (470.0, 405.0)
+EMISSION_WAVELENGTH_IN_NM = 525.0
+FIBER_SPACING_IN_MM = 0.25
+
+# Random draws are keyed by blocks of this many samples, independently of the chunks that are generated
+_BLOCK_SIZE = 65_536
+# Independent random streams
+_PARAMETERS, _TRANSIENTS, _MOTION, _NOISE_470, _NOISE_405, _NOISE_RAW = range(6)
+
+
+def _difference_of_exponentials(rate, rise_in_s, decay_in_s):
+    time_in_s = np.arange(int(np.ceil(5 * decay_in_s * rate)) + 1) / rate
+    kernel = np.exp(-time_in_s / decay_in_s) - np.exp(-time_in_s / rise_in_s)
+    return kernel / kernel.max()
+
+
+def _gaussian(rate, width_in_s):
+    half_width = int(np.ceil(4 * width_in_s * rate))
+    time_in_s = np.arange(-half_width, half_width + 1) / rate
+    return np.exp(-0.5 * (time_in_s / width_in_s) ** 2), half_width
+
+
+class FiberPhotometrySimulation:
+    """A reproducible synthetic fiber photometry session.
+
+    Parameters
+    ----------
+    num_fibers : int
+        Number of fibers, laid out on a line ``FIBER_SPACING_IN_MM`` apart.
+    duration_in_s : float
+        Duration of the session.
+    rate : float
+        Sampling rate, in Hz. With modulation, it must exceed twice the highest carrier frequency.
+    seed : int
+        Seed of all random draws.
+    modulation_frequencies_in_hz : tuple of (float, float), optional
+        Carrier frequencies of the 470 nm and 405 nm LEDs. If not given, the LEDs are driven with a constant voltage
+        and the simulation produces demodulated series.
+    transient_rate_in_hz : float
+        Mean rate of calcium transients of each fiber.
+    motion_artifact_rate_in_hz : float
+        Mean rate of motion artifacts, shared by all fibers.
+    noise_level : float
+        Standard deviation of the detector noise, relative to the baseline fluorescence.
+    """
+
+    def __init__(
+        self,
+        num_fibers=4,
+        duration_in_s=600.0,
+        rate=1000.0,
+        seed=0,
+        modulation_frequencies_in_hz=None,
+        transient_rate_in_hz=0.2,
+        motion_artifact_rate_in_hz=0.01,
+        noise_level=0.002,
+    ):
+        self.num_fibers = int(num_fibers)
+        self.rate = float(rate)
+        self.num_samples = int(round(duration_in_s * self.rate))
+        self.seed = int(seed)
+        self.modulation_frequencies_in_hz = modulation_frequencies_in_hz
+        if modulation_frequencies_in_hz is not None and 2 * max(modulation_frequencies_in_hz) >= self.rate:
+            raise ValueError("rate must exceed twice the highest modulation frequency.")
+        self.transient_rate_in_hz = float(transient_rate_in_hz)
+        self.motion_artifact_rate_in_hz = float(motion_artifact_rate_in_hz)
+        self.noise_level = float(noise_level)
+
+        rng = np.random.default_rng([self.seed, _PARAMETERS])
+        # baseline fluorescence (volts) and bleaching of each fiber, for the 470 nm and 405 nm LEDs
+        self.baseline = rng.uniform(1.0, 2.0, (2, self.num_fibers)) * np.array([[1.0], [0.6]])
+        self.fast_bleaching_fraction = rng.uniform(0.1, 0.3, (2, self.num_fibers))
+        self.fast_bleaching_time_constant_in_s = rng.uniform(60.0, 300.0, (2, self.num_fibers))
+        self.slow_bleaching_time_constant_in_s = rng.uniform(3600.0, 20_000.0, (2, self.num_fibers))
+        self.motion_coupling = rng.uniform(0.5, 1.5, self.num_fibers)
+        self._transient_kernel = _difference_of_exponentials(self.rate, rise_in_s=0.05, decay_in_s=0.4)
+        self._motion_kernel, self._motion_lead = _gaussian(self.rate, width_in_s=0.15)
+
+    @property
+    def modulated(self):
+        return self.modulation_frequencies_in_hz is not None
+
+    @property
+    def channels(self):
+        """Names of the channels that :meth:`generate` produces."""
+        response = ("raw",) if self.modulated else ("signal", "isosbestic")
+        return response + ("commanded_voltage_470", "commanded_voltage_405")
+
+    def shape(self, channel):
+        """Return the shape of the data of ``channel``."""
+        if channel.startswith("commanded_voltage"):
+            return (self.num_samples,)
+        return (self.num_samples, self.num_fibers)
+
+    def generate(self, channel, start, stop):
+        """Generate samples ``start:stop`` of ``channel``."""
+        if channel not in self.channels:
+            raise ValueError("Unknown channel '%s'; expected one of %s." % (channel, ", ".join(self.channels)))
+        start, stop = max(int(start), 0), min(int(stop), self.num_samples)
+        time_in_s = np.arange(start, stop) / self.rate
+        if channel.startswith("commanded_voltage"):
+            return self._commanded_voltage(0 if channel.endswith("470") else 1, time_in_s)
+        if channel == "signal":
+            return self._fluorescence(0, start, stop, time_in_s) + self._noise(_NOISE_470, start, stop)
+        if channel == "isosbestic":
+            return self._fluorescence(1, start, stop, time_in_s) + self._noise(_NOISE_405, start, stop)
+        drive_470 = self._led_drive(0, time_in_s)[:, np.newaxis]
+        drive_405 = self._led_drive(1, time_in_s)[:, np.newaxis]
+        return (
+            self._fluorescence(0, start, stop, time_in_s) * drive_470
+            + self._fluorescence(1, start, stop, time_in_s) * drive_405
+            + self._noise(_NOISE_RAW, start, stop)
+        )
+
+    def _led_drive(self, led, time_in_s):
+        """Relative LED intensity, between 0 and 1."""
+        if not self.modulated:
+            return np.ones_like(time_in_s)
+        return 0.5 * (1.0 + np.sin(2 * np.pi * self.modulation_frequencies_in_hz[led] * time_in_s))
+
+    def _commanded_voltage(self, led, time_in_s):
+        return 0.5 + 2.0 * self._led_drive(led, time_in_s)
+
+    def _fluorescence(self, led, start, stop, time_in_s):
+        t = time_in_s[:, np.newaxis]
+        fast = self.fast_bleaching_fraction[led]
+        bleaching = fast * np.exp(-t / self.fast_bleaching_time_constant_in_s[led]) + (1 - fast) * np.exp(
+            -t / self.slow_bleaching_time_constant_in_s[led]
+        )
+        motion = self._event_train(
+            _MOTION, start, stop, self.motion_artifact_rate_in_hz, self._motion_kernel, self._motion_lead, 1
+        )
+        fluorescence = self.baseline[led] * bleaching * (1.0 - 0.3 * np.clip(motion * self.motion_coupling, 0, 3))
+        if led == 0:
+            transients = self._event_train(
+                _TRANSIENTS, start, stop, self.transient_rate_in_hz, self._transient_kernel, 0, self.num_fibers
+            )
+            fluorescence *= 1.0 + transients
+        return fluorescence
+
+    def _noise(self, stream, start, stop):
+        noise = np.empty((stop - start, self.num_fibers))
+        if stop <= start:
+            return noise
+        for block in range(start // _BLOCK_SIZE, (stop - 1) // _BLOCK_SIZE + 1):
+            block_start = block * _BLOCK_SIZE
+            samples = np.random.default_rng([self.seed, stream, block]).standard_normal((_BLOCK_SIZE, self.num_fibers))
+            first, last = max(start, block_start), min(stop, block_start + _BLOCK_SIZE)
+            noise[first - start : last - start] = samples[first - block_start : last - block_start]
+        return noise * self.noise_level * self.baseline[0]
+
+    def _block_events(self, stream, block, event_rate_in_hz, num_columns):
+        """Return the sample, column and amplitude of the events drawn in ``block``."""
+        rng = np.random.default_rng([self.seed, stream, block])
+        counts = rng.poisson(event_rate_in_hz * _BLOCK_SIZE / self.rate, num_columns)
+        positions = block * _BLOCK_SIZE + rng.integers(0, _BLOCK_SIZE, counts.sum())
+        amplitudes = rng.lognormal(np.log(0.1), 0.5, counts.sum())
+        return positions, np.repeat(np.arange(num_columns), counts), amplitudes
+
+    def _event_train(self, stream, start, stop, event_rate_in_hz, kernel, lead, num_columns):
+        """Sum of ``kernel`` placed at Poisson events, sample ``lead`` of the kernel being at the event, for
+        samples ``start:stop``."""
+        # events from first to last (exclusive) contribute to start:stop
+        first, last = start - (len(kernel) - lead) + 1, stop + lead
+        impulses = np.zeros((last - first, num_columns))
+        for block in range(max(first, 0) // _BLOCK_SIZE, max(last - 1, 0) // _BLOCK_SIZE + 1):
+            positions, columns, amplitudes = self._block_events(stream, block, event_rate_in_hz, num_columns)
+            keep = (positions >= first) & (positions < last)
+            np.add.at(impulses, (positions[keep] - first, columns[keep]), amplitudes[keep])
+        num_fft = len(impulses) + len(kernel) - 1
+        train = np.fft.irfft(
+            np.fft.rfft(impulses, num_fft, axis=0) * np.fft.rfft(kernel, num_fft)[:, np.newaxis], num_fft, axis=0
+        )
+        return train[start - first + lead : stop - first + lead]
+
+    def iterator(self, channel, buffer_size=DEFAULT_BUFFER_SIZE):
+        """Return a :class:`SimulatedDataIterator` over ``channel``, generating ``buffer_size`` samples at a time."""
+        return SimulatedDataIterator(self, channel, buffer_size=buffer_size)
+
+    def add_to_nwbfile(self, nwbfile, buffer_size=DEFAULT_BUFFER_SIZE):
+        """Add the devices, the ``FiberPhotometry`` metadata and the series of the simulation to ``nwbfile``.
+
+        The series are added to the acquisition as data iterators, so nothing is generated until the file is
+        written. Returns ``nwbfile``.
+        """
+        from ndx_ophys_devices import (
+            BandOpticalFilter,
+            BandOpticalFilterModel,
+            DichroicMirror,
+            DichroicMirrorModel,
+            ExcitationSource,
+            ExcitationSourceModel,
+            FiberInsertion,
+            Indicator,
+            OpticalFiber,
+            OpticalFiberModel,
+            Photodetector,
+            PhotodetectorModel,
+            ViralVector,
+            ViralVectorInjection,
+        )
+
+        from . import FiberPhotometry, FiberPhotometryIndicators, FiberPhotometryViruses, FiberPhotometryVirusInjections
+
+        viral_vector = ViralVector(
+            name="viral_vector",
+            construct_name="AAV1-Syn-GCaMP6f",
+            manufacturer="Simulated",
+            titer_in_vg_per_ml=1.0e12,
+        )
+        viral_vector_injection = ViralVectorInjection(
+            name="viral_vector_injection",
+            location="Nucleus accumbens (NAc)",
+            hemisphere="right",
+            reference="Bregma at the cortical surface",
+            ap_in_mm=1.5,
+            ml_in_mm=1.0,
+            dv_in_mm=-4.5,
+            volume_in_uL=0.5,
+            viral_vector=viral_vector,
+        )
+        indicator = Indicator(
+            name="indicator", label="GCaMP6f", description="Simulated", viral_vector_injection=viral_vector_injection
+        )
+
+        optical_fiber_model = OpticalFiberModel(
+            name="optical_fiber_model",
+            manufacturer="Simulated",
+            numerical_aperture=0.48,
+            core_diameter_in_um=200.0,
+        )
+        excitation_source_model = ExcitationSourceModel(
+            name="excitation_source_model", manufacturer="Simulated", source_type="LED", excitation_mode="one-photon"
+        )
+        photodetector_model = PhotodetectorModel(
+            name="photodetector_model", manufacturer="Simulated", detector_type="photodiode"
+        )
+        dichroic_mirror_model = DichroicMirrorModel(name="dichroic_mirror_model", manufacturer="Simulated")
+        emission_filter_model = BandOpticalFilterModel(
+            name="emission_filter_model",
+            manufacturer="Simulated",
+            filter_type="Bandpass",
+            center_wavelength_in_nm=EMISSION_WAVELENGTH_IN_NM,
+            bandwidth_in_nm=50.0,
+        )
+        excitation_sources = [
+            ExcitationSource(name="excitation_source_%d" % wavelength, model=excitation_source_model)
+            for wavelength in EXCITATION_WAVELENGTHS_IN_NM
+        ]
+        photodetector = Photodetector(name="photodetector", model=photodetector_model)
+        dichroic_mirror = DichroicMirror(name="dichroic_mirror", model=dichroic_mirror_model)
+        emission_filter = BandOpticalFilter(name="emission_filter", model=emission_filter_model)
+        for model in (
+            optical_fiber_model,
+            excitation_source_model,
+            photodetector_model,
+            dichroic_mirror_model,
+            emission_filter_model,
+        ):
+            nwbfile.add_device_model(model)
+        for device in excitation_sources + [photodetector, dichroic_mirror, emission_filter]:
+            nwbfile.add_device(device)
+
+        commanded_voltage_series = [
+            CommandedVoltageSeries(
+                name="commanded_voltage_%d" % wavelength,
+                description="Voltage driving the %d nm LED." % wavelength,
+                data=self.iterator("commanded_voltage_%d" % wavelength, buffer_size),
+                unit="volts",
+                rate=self.rate,
+                frequency=None if not self.modulated else float(frequency),
+            )
+            for wavelength, frequency in zip(EXCITATION_WAVELENGTHS_IN_NM, self.modulation_frequencies_in_hz or (0, 0))
+        ]
+        for series in commanded_voltage_series:
+            nwbfile.add_acquisition(series)
+
+        # one row per fiber and LED: rows 0 to num_fibers - 1 at 470 nm, then the same fibers at 405 nm
+        table = FiberPhotometryTable(name="fiber_photometry_table", description="Simulated fibers.")
+        optical_fibers = []
+        for index in range(self.num_fibers):
+            optical_fiber = OpticalFiber(
+                name="optical_fiber_%d" % index,
+                model=optical_fiber_model,
+                fiber_insertion=FiberInsertion(
+                    name="fiber_insertion",
+                    insertion_position_ap_in_mm=1.5,
+                    insertion_position_ml_in_mm=1.0 + index * FIBER_SPACING_IN_MM,
+                    depth_in_mm=4.5,
+                ),
+            )
+            nwbfile.add_device(optical_fiber)
+            optical_fibers.append(optical_fiber)
+        for led, wavelength in enumerate(EXCITATION_WAVELENGTHS_IN_NM):
+            for index, optical_fiber in enumerate(optical_fibers):
+                table.add_row(
+                    location="NAc",
+                    coordinates=[index * FIBER_SPACING_IN_MM, 0.0, 0.0],
+                    excitation_wavelength_in_nm=wavelength,
+                    emission_wavelength_in_nm=EMISSION_WAVELENGTH_IN_NM,
+                    indicator=indicator,
+                    optical_fiber=optical_fiber,
+                    excitation_source=excitation_sources[led],
+                    commanded_voltage_series=commanded_voltage_series[led],
+                    photodetector=photodetector,
+                    dichroic_mirror=dichroic_mirror,
+                    emission_filter=emission_filter,
+                )
+        nwbfile.add_lab_meta_data(
+            FiberPhotometry(
+                name="fiber_photometry",
+                fiber_photometry_table=table,
+                fiber_photometry_viruses=FiberPhotometryViruses(viral_vectors=[viral_vector]),
+                fiber_photometry_virus_injections=FiberPhotometryVirusInjections(
+                    viral_vector_injections=[viral_vector_injection]
+                ),
+                fiber_photometry_indicators=FiberPhotometryIndicators(indicators=[indicator]),
+            )
+        )
+
+        fibers = np.arange(self.num_fibers)
+        if self.modulated:
+            responses = [("raw", "Photodetector output carrying both modulated LED channels.", fibers)]
+        else:
+            responses = [
+                ("signal", "Demodulated fluorescence under 470 nm excitation.", fibers),
+                ("isosbestic", "Demodulated fluorescence under 405 nm excitation.", fibers + self.num_fibers),
+            ]
+        for name, description, rows in responses:
+            nwbfile.add_acquisition(
+                FiberPhotometryResponseSeries(
+                    name=name,
+                    description=description,
+                    data=self.iterator(name, buffer_size),
+                    unit="volts",
+                    rate=self.rate,
+                    fiber_photometry_table_region=table.create_fiber_photometry_table_region(
+                        region=rows, description=description
+                    ),
+                )
+            )
+        return nwbfile
+
+
+class SimulatedDataIterator(GenericDataChunkIterator):
+    """Stream one channel of a :class:`FiberPhotometrySimulation`, generating ``buffer_size`` samples at a time."""
+
+    def __init__(self, simulation, channel, buffer_size=DEFAULT_BUFFER_SIZE):
+        self.simulation = simulation
+        self.channel = channel
+        buffer_shape, chunk_shape = iterator_shapes(simulation.shape(channel), CHUNK_SIZE, buffer_size)
+        super().__init__(buffer_shape=buffer_shape, chunk_shape=chunk_shape)
+
+    def _get_data(self, selection):
+        data = self.simulation.generate(self.channel, selection[0].start, selection[0].stop)
+        return data[(slice(None),) + tuple(selection[1:])]
+
+    def _get_maxshape(self):
+        return self.simulation.shape(self.channel)
+
+    def _get_dtype(self):
+        return np.dtype("float64")
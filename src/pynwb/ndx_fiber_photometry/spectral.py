@@ -0,0 +1,178 @@
+"""Welch power spectra and fiber-by-fiber coherence of multi-fiber response series.
+
+:func:`compute_cross_spectra` reads a ``FiberPhotometryResponseSeries`` chunk by chunk, cuts it into overlapping,
+windowed segments (segments span chunk boundaries, so the result does not depend on the chunk size), and accumulates
+the cross-spectral density matrix of all fibers from one batched FFT per chunk. The result keeps the
+``FiberPhotometryTable`` rows of the fibers, so that :meth:`CrossSpectra.coherence_by_distance` can bin the coherence
+of every pair of fibers by the distance between their ``coordinates``.
+
+Spectra are scaled like ``scipy.signal.welch`` and ``scipy.signal.csd`` with ``scaling="density"``, a Hann window
+and constant detrending.
+"""
+
+import numpy as np
+
+from ._utils import read_scaled
+
+DEFAULT_SEGMENT_LENGTH = 256
+DEFAULT_OVERLAP = 0.5
+DEFAULT_CHUNK_SIZE = 100_000
+
+
+class CrossSpectra:
+    """The cross-spectral density matrix of the fibers of a response series.
+
+    Attributes
+    ----------
+    frequencies : numpy.ndarray of shape (num_frequencies,)
+        Frequencies, in Hz.
+    cross_spectral_density : numpy.ndarray of shape (num_frequencies, num_fibers, num_fibers)
+        One-sided cross-spectral density of every pair of fibers, in units**2/Hz. Entry ``[f, i, j]`` averages
+        ``conj(X_i) * X_j`` over segments, ``X_i`` being the spectrum of fiber ``i``, as
+        ``scipy.signal.csd(x_i, x_j)``: its phase is positive when fiber ``j`` leads fiber ``i``.
+    num_segments : int
+        Number of segments averaged.
+    fiber_photometry_table_rows : numpy.ndarray or None
+        The ``FiberPhotometryTable`` row of each fiber, if the series has a ``fiber_photometry_table_region``.
+    table : FiberPhotometryTable or None
+        The table the rows refer to.
+    """
+
+    def __init__(self, frequencies, cross_spectral_density, num_segments, fiber_photometry_table_rows=None, table=None):
+        self.frequencies = frequencies
+        self.cross_spectral_density = cross_spectral_density
+        self.num_segments = num_segments
+        self.fiber_photometry_table_rows = fiber_photometry_table_rows
+        self.table = table
+
+    @property
+    def power_spectral_density(self):
+        """Power spectral density of each fiber, of shape (num_frequencies, num_fibers)."""
+        return np.einsum("fii->fi", self.cross_spectral_density).real
+
+    @property
+    def coherence(self):
+        """Magnitude-squared coherence of every pair of fibers, of shape (num_frequencies, num_fibers, num_fibers)."""
+        power = self.power_spectral_density
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return np.abs(self.cross_spectral_density) ** 2 / (power[:, :, np.newaxis] * power[:, np.newaxis, :])
+
+    def coherence_by_distance(self, bins=10, frequency_range=None, coordinates=None):
+        """Average the coherence of every pair of distinct fibers in bins of the distance between them.
+
+        Parameters
+        ----------
+        bins : int or sequence of float
+            Number of equal-width distance bins, or the bin edges in the unit of the coordinates.
+        frequency_range : tuple of (float, float), optional
+            The coherence is averaged over the frequencies in this range, in Hz. Defaults to all frequencies.
+        coordinates : array-like of shape (num_fibers, 3), optional
+            Coordinates of the fibers. Defaults to the ``coordinates`` column of the ``FiberPhotometryTable`` rows of
+            the fibers, in millimeters.
+
+        Returns
+        -------
+        pandas.DataFrame
+            One row per bin, with the columns ``min_distance``, ``max_distance``, ``num_pairs`` and
+            ``mean_coherence``. Empty bins have a NaN ``mean_coherence``.
+        """
+        import pandas as pd
+
+        if coordinates is None:
+            if self.table is None or "coordinates" not in self.table.colnames:
+                raise ValueError("The fibers have no FiberPhotometryTable coordinates; pass 'coordinates' explicitly.")
+            coordinates = self.table["coordinates"].data[:]
+            coordinates = np.asarray(coordinates, dtype=float)[self.fiber_photometry_table_rows]
+        coordinates = np.asarray(coordinates, dtype=float)
+        num_fibers = self.cross_spectral_density.shape[1]
+        if coordinates.shape != (num_fibers, 3):
+            raise ValueError("Expected coordinates of shape (%d, 3), got %s." % (num_fibers, coordinates.shape))
+
+        selected = np.ones(len(self.frequencies), dtype=bool)
+        if frequency_range is not None:
+            selected = (self.frequencies >= frequency_range[0]) & (self.frequencies <= frequency_range[1])
+        coherence = self.coherence[selected].mean(axis=0)
+        first, second = np.triu_indices(num_fibers, k=1)
+        distances = np.linalg.norm(coordinates[first] - coordinates[second], axis=1)
+        pair_coherence = coherence[first, second]
+
+        counts, edges = np.histogram(distances, bins=bins)
+        sums, _ = np.histogram(distances, bins=edges, weights=pair_coherence)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            mean_coherence = sums / counts
+        return pd.DataFrame(
+            {
+                "min_distance": edges[:-1],
+                "max_distance": edges[1:],
+                "num_pairs": counts,
+                "mean_coherence": mean_coherence,
+            }
+        )
+
+
+def compute_cross_spectra(
+    series, segment_length=DEFAULT_SEGMENT_LENGTH, overlap=DEFAULT_OVERLAP, chunk_size=DEFAULT_CHUNK_SIZE
+):
+    """Compute the Welch cross-spectral density matrix of all fibers of a response series in one pass.
+
+    Parameters
+    ----------
+    series : FiberPhotometryResponseSeries
+        A series with a regular ``rate``. Its data are read ``chunk_size`` samples at a time and scaled to physical
+        units.
+    segment_length : int
+        Number of samples per Welch segment.
+    overlap : float
+        Fraction of ``segment_length`` shared by consecutive segments, in [0, 1).
+    chunk_size : int
+        Number of samples read at a time.
+
+    Returns
+    -------
+    CrossSpectra
+    """
+    if series.rate is None:
+        raise ValueError("'%s' has irregular timestamps; Welch spectra require a regular 'rate'." % series.name)
+    segment_length = int(segment_length)
+    step = segment_length - int(round(overlap * segment_length))
+    if not 0 < step <= segment_length:
+        raise ValueError("overlap must be in [0, 1), got %s." % overlap)
+    num_samples = len(series.data)
+    if num_samples < segment_length:
+        raise ValueError("'%s' has fewer samples (%d) than segment_length." % (series.name, num_samples))
+    rate = float(series.rate)
+
+    window = np.hanning(segment_length + 1)[:-1]  # periodic Hann window, as scipy.signal.get_window("hann")
+    scale = 1.0 / (rate * (window**2).sum())
+    frequencies = np.fft.rfftfreq(segment_length, d=1.0 / rate)
+
+    cross_spectral_density = None
+    num_segments = 0
+    # samples read but not yet covered by a complete segment; segments start at multiples of step
+    pending = None
+    for start in range(0, num_samples, int(chunk_size)):
+        chunk = read_scaled(series, start, min(start + int(chunk_size), num_samples))
+        pending = chunk if pending is None else np.concatenate([pending, chunk])
+        num_new = (len(pending) - segment_length) // step + 1 if len(pending) >= segment_length else 0
+        if num_new == 0:
+            continue
+        # (num_new, segment_length, num_fibers) batch of segments
+        segments = pending[np.arange(num_new)[:, np.newaxis] * step + np.arange(segment_length)]
+        segments = (segments - segments.mean(axis=1, keepdims=True)) * window[:, np.newaxis]
+        spectra = np.fft.rfft(segments, axis=1)
+        # batched matrix product over frequencies: (f, fibers, segments) @ (f, segments, fibers)
+        chunk_csd = spectra.conj().transpose(1, 2, 0) @ spectra.transpose(1, 0, 2)
+        cross_spectral_density = chunk_csd if cross_spectral_density is None else cross_spectral_density + chunk_csd
+        num_segments += num_new
+        pending = pending[num_new * step :]
+
+    cross_spectral_density *= scale / num_segments
+    # one-sided spectrum: double every frequency but DC and, for even segment lengths, Nyquist
+    last = -1 if segment_length % 2 == 0 else None
+    cross_spectral_density[1:last] *= 2.0
+
+    rows, table = None, None
+    region = getattr(series, "fiber_photometry_table_region", None)
+    if region is not None:
+        rows, table = np.asarray(region.data[:], dtype=int), region.table
+    return CrossSpectra(frequencies, cross_spectral_density, num_segments, rows, table)
@@ -0,0 +1,97 @@
+"""Store the ``timestamps`` shared by co-acquired series once.
+
+Signal, isosbestic, demodulated and commanded voltage channels recorded on one clock carry identical timestamps.
+When a file is written, :class:`SharedTimestampsMap` compares the timestamps of each ``FiberPhotometryResponseSeries``
+and ``CommandedVoltageSeries`` with those already written and, on an exact match, writes a link to the existing
+dataset instead of a copy, the same layout PyNWB produces for ``TimeSeries(timestamps=other_series)``. On read, linked
+series share one timestamps dataset, and :func:`load_timestamps` loads it into a single cached array.
+"""
+
+import weakref
+
+import numpy as np
+from hdmf.build import LinkBuilder
+from hdmf.data_utils import DataIO
+from pynwb import register_map
+from pynwb.base import TimeSeries
+from pynwb.io.base import TimeSeriesMap
+
+from .fiber_photometry import CommandedVoltageSeries, FiberPhotometryResponseSeries
+
+# Number of timestamps compared at a time when checking two timebases for equality
+COMPARE_CHUNK_SIZE = 1_000_000
+
+# Written series with timestamps of their own, per BuildManager, keyed by a cheap signature of their timestamps
+_written_timestamps = weakref.WeakKeyDictionary()
+# Timestamps loaded by load_timestamps, keyed by file and dataset path, kept while any caller holds the array
+_loaded_timestamps = weakref.WeakValueDictionary()
+
+
+def _unwrap(timestamps):
+    return timestamps.data if isinstance(timestamps, DataIO) else timestamps
+
+
+def _signature(timestamps):
+    """Return a cheap key that identical timebases share, or None if ``timestamps`` cannot be sliced."""
+    if not hasattr(timestamps, "__getitem__") or not hasattr(timestamps, "__len__") or len(timestamps) == 0:
+        return None
+    num_samples = len(timestamps)
+    probes = np.asarray([timestamps[0], timestamps[num_samples // 2], timestamps[num_samples - 1]], dtype=float)
+    return (num_samples,) + tuple(probes.tolist())
+
+
+def _same_timestamps(first, second, chunk_size=COMPARE_CHUNK_SIZE):
+    """Return True if two timestamp arrays of equal length are identical, comparing them chunk by chunk."""
+    if first is second:
+        return True
+    for start in range(0, len(first), chunk_size):
+        stop = start + chunk_size
+        if not np.array_equal(np.asarray(first[start:stop]), np.asarray(second[start:stop])):
+            return False
+    return True
+
+
+@register_map(FiberPhotometryResponseSeries)
+class SharedTimestampsMap(TimeSeriesMap):
+    """Write timestamps identical to those of an already written series as a link to that series' timestamps."""
+
+    @TimeSeriesMap.object_attr("timestamps")
+    def timestamps_attr(self, container, manager):
+        timestamps = container.fields.get("timestamps")
+        if timestamps is None or isinstance(timestamps, TimeSeries):
+            return super().timestamps_attr(container, manager)
+
+        signature = _signature(_unwrap(timestamps))
+        if signature is None:
+            return timestamps
+        candidates = _written_timestamps.setdefault(manager, {}).setdefault(signature, [])
+        for owner in candidates:
+            if owner is container:
+                return timestamps
+            if _same_timestamps(_unwrap(owner.fields["timestamps"]), _unwrap(timestamps)):
+                return LinkBuilder(manager.build(owner)["timestamps"], "timestamps")
+        candidates.append(container)
+        return timestamps
+
+
+register_map(CommandedVoltageSeries, SharedTimestampsMap)
+
+
+def load_timestamps(series):
+    """Return the timestamps of ``series`` as an in-memory array, or None if it is sampled at a regular ``rate``.
+
+    Series read from a file whose timestamps link to the same dataset get the same array object, which is loaded
+    only once for as long as any caller holds a reference to it.
+    """
+    timestamps = series.timestamps
+    if timestamps is None or isinstance(timestamps, np.ndarray):
+        return timestamps
+    file = getattr(timestamps, "file", None)
+    if file is None:
+        return np.asarray(timestamps)
+    key = (file.filename, timestamps.name)
+    array = _loaded_timestamps.get(key)
+    if array is None:
+        array = timestamps[:]
+        _loaded_timestamps[key] = array
+    return array
@@ -0,0 +1,227 @@
+"""Chunked detection of calcium and dopamine transients on every fiber of a response series at once.
+
+Each chunk is read with a margin of samples on both sides, converted to dF/F against a moving-mean baseline, and
+thresholded at ``threshold`` median absolute deviations (MAD) of dF/F above its median. The median and MAD of each
+fiber are estimated over fixed windows of ``noise_window_in_s`` aligned on the first sample of the series, so they
+follow slow changes of the noise level but do not depend on the chunking. Every run of consecutive supra-threshold
+samples of a fiber is one transient, reported at its maximum. A transient belongs to the chunk holding its onset, and
+the margin covers ``max_duration_in_s``, the noise windows these runs fall in and the baseline window of their
+samples, so the transients, including those spanning chunk boundaries, are the same as in one pass over the whole
+series. All fibers of a chunk are processed together with array operations, so the cost grows linearly with the
+duration of the recording.
+"""
+
+import numpy as np
+from hdmf.common import DynamicTable, DynamicTableRegion, VectorData
+
+from ._utils import read_scaled
+
+DEFAULT_THRESHOLD = 3.0
+DEFAULT_BASELINE_WINDOW_IN_S = 30.0
+DEFAULT_MAX_DURATION_IN_S = 10.0
+DEFAULT_NOISE_WINDOW_IN_S = 60.0
+DEFAULT_CHUNK_SIZE = 1_000_000
+
+# Scale factor making the MAD of Gaussian noise equal to its standard deviation
+MAD_TO_STD = 1.4826
+
+
+def _sampling_rate(series):
+    if series.timestamps is None:
+        return float(series.rate)
+    num_samples = min(len(series.timestamps), 1000)
+    return (num_samples - 1) / float(series.timestamps[num_samples - 1] - series.timestamps[0])
+
+
+def _moving_mean(data, half_width):
+    """Mean of each sample's window of ``2 * half_width + 1`` samples along axis 0, truncated at the edges."""
+    cumsum = np.zeros((len(data) + 1,) + data.shape[1:])
+    np.cumsum(data, axis=0, out=cumsum[1:])
+    index = np.arange(len(data))
+    low = np.maximum(index - half_width, 0)
+    high = np.minimum(index + half_width + 1, len(data))
+    return (cumsum[high] - cumsum[low]) / (high - low)[:, np.newaxis]
+
+
+def _segments(above):
+    """Return the fiber, start and stop of every run of True values in the columns of a 2D boolean array."""
+    padded = np.zeros((above.shape[1], above.shape[0] + 2), dtype=np.int8)
+    padded[:, 1:-1] = above.T
+    edges = np.diff(padded, axis=1)
+    fibers, starts = np.nonzero(edges == 1)
+    _, stops = np.nonzero(edges == -1)
+    return fibers, starts, stops
+
+
+def _window_levels(dff, threshold, window_size):
+    """Return the detection level of each sample of ``dff``, of shape (num_samples, num_fibers).
+
+    The level is the median plus ``threshold`` MADs of each fiber over consecutive windows of ``window_size`` samples;
+    the last window is shorter if the number of samples is not a multiple of ``window_size``.
+    """
+    num_full = len(dff) - len(dff) % window_size
+    windows = [dff[:num_full].reshape(-1, window_size, dff.shape[1])]
+    if num_full < len(dff):
+        windows.append(dff[np.newaxis, num_full:])
+    levels = []
+    for window in windows:
+        median = np.median(window, axis=1, keepdims=True)
+        noise = MAD_TO_STD * np.median(np.abs(window - median), axis=1, keepdims=True)
+        levels.append(np.broadcast_to(median + threshold * noise, window.shape).reshape(-1, dff.shape[1]))
+    return np.concatenate(levels)
+
+
+def _detect_chunk(dff, levels, min_length, max_length):
+    """Detect transients in a chunk of dF/F of shape (num_samples, num_fibers), above the detection ``levels`` of
+    the same shape.
+
+    Returns the fiber, onset, peak and offset sample indices (relative to the chunk) and the peak dF/F of each
+    transient, ordered by fiber and onset.
+    """
+    above = dff > levels
+    fibers, starts, stops = _segments(above)
+    lengths = stops - starts
+    keep = (lengths >= min_length) & (lengths <= max_length)
+    fibers, starts, stops, lengths = fibers[keep], starts[keep], stops[keep], lengths[keep]
+    if len(starts) == 0:
+        empty = np.zeros(0, dtype=int)
+        return empty, empty, empty, empty, np.zeros(0)
+
+    # gather the samples of every segment, fiber-major, and find the maximum of each segment
+    segment = np.repeat(np.arange(len(starts)), lengths)
+    offsets = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+    samples = np.repeat(starts, lengths) + offsets
+    values = dff[samples, np.repeat(fibers, lengths)]
+    peak_values = np.maximum.reduceat(values, np.cumsum(lengths) - lengths)
+    is_peak = values == peak_values[segment]
+    _, first_peak = np.unique(segment[is_peak], return_index=True)
+    peaks = samples[is_peak][first_peak]
+    return fibers, starts, peaks, stops, peak_values
+
+
+def detect_transients(
+    series,
+    threshold=DEFAULT_THRESHOLD,
+    baseline_window_in_s=DEFAULT_BASELINE_WINDOW_IN_S,
+    min_duration_in_s=0.0,
+    max_duration_in_s=DEFAULT_MAX_DURATION_IN_S,
+    noise_window_in_s=DEFAULT_NOISE_WINDOW_IN_S,
+    chunk_size=DEFAULT_CHUNK_SIZE,
+    name="transients",
+):
+    """Detect transients on every fiber of a response series and return them as a table.
+
+    Parameters
+    ----------
+    series : FiberPhotometryResponseSeries
+        The fluorescence series. It must have a ``fiber_photometry_table_region``, which the transients reference.
+    threshold : float
+        Detection threshold, in MADs of dF/F above its median. The median and MAD are estimated per fiber and per
+        noise window.
+    baseline_window_in_s : float
+        Width of the moving-mean window that estimates the baseline fluorescence F0.
+    min_duration_in_s : float
+        Supra-threshold runs shorter than this are discarded.
+    max_duration_in_s : float
+        Supra-threshold runs longer than this, such as motion artifacts or saturation, are discarded.
+    noise_window_in_s : float
+        Width of the consecutive windows, starting at the first sample, over which the median and MAD of dF/F are
+        estimated. Shorter windows follow faster changes of the noise level.
+    chunk_size : int
+        Number of samples processed at a time, not counting the margins read on both sides.
+    name : str
+        Name of the returned table.
+
+    Returns
+    -------
+    DynamicTable
+        One row per transient, ordered by onset time, with the columns ``onset_time``, ``peak_time``,
+        ``offset_time`` (the time of the first sample back below threshold), ``peak_dff`` and
+        ``fiber_photometry_table_region``, a region referencing the ``FiberPhotometryTable`` row of the fiber. Add it
+        to a processing module to write it to the file.
+    """
+    region = series.fiber_photometry_table_region
+    if region is None:
+        raise ValueError("'%s' has no fiber_photometry_table_region for the transients to reference." % series.name)
+    rows = np.asarray(region.data[:], dtype=int)
+    rate = _sampling_rate(series)
+    half_width = max(int(round(baseline_window_in_s * rate / 2)), 1)
+    min_length = max(int(np.ceil(min_duration_in_s * rate)), 1)
+    max_length = int(np.floor(max_duration_in_s * rate))
+    window_size = max(int(round(noise_window_in_s * rate)), 1)
+    num_samples = len(series.data)
+    chunk_size = int(chunk_size)
+
+    columns = {key: [] for key in ("onset", "peak", "offset", "fiber", "peak_dff")}
+    for start in range(0, num_samples, chunk_size):
+        stop = min(start + chunk_size, num_samples)
+        # runs with an onset in the chunk are seen whole, with the samples before and after them; levels are
+        # computed over the whole noise windows these samples fall in, and dF/F over the baseline window of each
+        window_start = max(start - max_length - 1, 0) // window_size * window_size
+        window_stop = min(-(-(stop + max_length + 1) // window_size) * window_size, num_samples)
+        read_start, read_stop = max(window_start - half_width, 0), min(window_stop + half_width, num_samples)
+        data = read_scaled(series, read_start, read_stop)
+        if data.shape[1] != len(rows):
+            raise ValueError(
+                "'%s' has %d data columns but its fiber_photometry_table_region has %d rows."
+                % (series.name, data.shape[1], len(rows))
+            )
+        baseline = _moving_mean(data, half_width)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            dff = (data - baseline) / baseline
+        dff = dff[window_start - read_start : window_stop - read_start]
+        levels = _window_levels(dff, threshold, window_size)
+        fibers, onsets, peaks, offsets, peak_dff = _detect_chunk(dff, levels, min_length, max_length)
+        onsets, peaks, offsets = onsets + window_start, peaks + window_start, offsets + window_start
+        # each transient belongs to the chunk holding its onset; runs cut at the end of the margin are longer than
+        # max_length and were discarded
+        keep = (onsets >= start) & (onsets < stop)
+        order = np.lexsort((fibers[keep], onsets[keep]))
+        for key, values in zip(columns, (onsets, peaks, offsets, fibers, peak_dff)):
+            columns[key].append(values[keep][order])
+
+    onsets, peaks, offsets, fibers, peak_dff = (
+        np.concatenate(values) if values else np.zeros(0) for values in columns.values()
+    )
+    onsets, peaks, offsets, fibers = (values.astype(int) for values in (onsets, peaks, offsets, fibers))
+    # offsets at the very end of the series have no sample; report the time of the last sample instead
+    times = _event_times(series, np.concatenate([onsets, peaks, np.minimum(offsets, num_samples - 1)]))
+    num_events = len(onsets)
+    return DynamicTable(
+        name=name,
+        description="Transients detected at %g MADs of dF/F above its median." % threshold,
+        columns=[
+            VectorData(
+                name="onset_time",
+                description="Time of the first supra-threshold sample, in seconds.",
+                data=times[:num_events],
+            ),
+            VectorData(
+                name="peak_time",
+                description="Time of the maximum dF/F, in seconds.",
+                data=times[num_events : 2 * num_events],
+            ),
+            VectorData(
+                name="offset_time",
+                description="Time of the first sample back below threshold, in seconds.",
+                data=times[2 * num_events :],
+            ),
+            VectorData(name="peak_dff", description="Maximum dF/F of the transient.", data=peak_dff),
+            DynamicTableRegion(
+                name="fiber_photometry_table_region",
+                description="The FiberPhotometryTable row of the fiber the transient was detected on.",
+                data=rows[fibers].tolist(),
+                table=region.table,
+            ),
+        ],
+    )
+
+
+def _event_times(series, indices):
+    """Return the times of the samples at ``indices``, reading only the timestamps that are needed."""
+    if series.timestamps is None:
+        return float(series.starting_time or 0.0) + indices / float(series.rate)
+    if len(indices) == 0:
+        return np.zeros(0)
+    unique, inverse = np.unique(indices, return_inverse=True)
+    return np.asarray(series.timestamps[unique.tolist()], dtype=float)[inverse]
@@ -0,0 +1,118 @@
+"""Small in-memory fiber photometry files shared by the unit tests."""
+
+import numpy as np
+
+from pynwb.testing.mock.file import mock_NWBFile
+from ndx_ophys_devices import (
+    Indicator,
+    OpticalFiberModel,
+    FiberInsertion,
+    OpticalFiber,
+    ExcitationSourceModel,
+    ExcitationSource,
+    PhotodetectorModel,
+    Photodetector,
+    DichroicMirrorModel,
+    DichroicMirror,
+)
+from ndx_fiber_photometry import (
+    FiberPhotometryIndicators,
+    FiberPhotometry,
+    FiberPhotometryTable,
+    FiberPhotometryResponseSeries,
+    create_encoded_fiber_photometry_table,
+)
+
+
+def mock_fiber_photometry_nwbfile(
+    num_fibers=2,
+    num_samples=100,
+    rate=30.0,
+    seed=0,
+    encoded=False,
+    coordinates=None,
+    data=None,
+    session_start_time=None,
+):
+    """Return an NWBFile with a FiberPhotometryTable of ``num_fibers`` rows sharing one set of devices, and a
+    FiberPhotometryResponseSeries named "signal" recording all fibers.
+
+    If ``encoded`` is True, the reference columns of the table are dictionary-encoded. ``coordinates`` of shape
+    (num_fibers, 3) fill the optional coordinates column, and ``data`` replaces the random data of "signal".
+    ``session_start_time`` defaults to that of ``mock_NWBFile``."""
+    nwbfile = mock_NWBFile() if session_start_time is None else mock_NWBFile(session_start_time=session_start_time)
+
+    indicator = Indicator(name="indicator", description="Green indicator", label="GCaMP6f")
+    optical_fiber_model = OpticalFiberModel(
+        name="optical_fiber_model", manufacturer="Fiber Manufacturer", numerical_aperture=0.39
+    )
+    excitation_source_model = ExcitationSourceModel(
+        name="excitation_source_model",
+        manufacturer="LED Manufacturer",
+        source_type="LED",
+        excitation_mode="one-photon",
+    )
+    excitation_source = ExcitationSource(name="excitation_source", model=excitation_source_model)
+    photodetector_model = PhotodetectorModel(
+        name="photodetector_model", manufacturer="Detector Manufacturer", detector_type="photodiode"
+    )
+    photodetector = Photodetector(name="photodetector", model=photodetector_model)
+    dichroic_mirror_model = DichroicMirrorModel(name="dichroic_mirror_model", manufacturer="Mirror Manufacturer")
+    dichroic_mirror = DichroicMirror(name="dichroic_mirror", model=dichroic_mirror_model)
+
+    for model in (optical_fiber_model, excitation_source_model, photodetector_model, dichroic_mirror_model):
+        nwbfile.add_device_model(model)
+    for device in (excitation_source, photodetector, dichroic_mirror):
+        nwbfile.add_device(device)
+
+    if encoded:
+        fiber_photometry_table = create_encoded_fiber_photometry_table(description="fiber photometry table")
+    else:
+        fiber_photometry_table = FiberPhotometryTable(
+            name="fiber_photometry_table", description="fiber photometry table"
+        )
+    for index in range(num_fibers):
+        optical_fiber = OpticalFiber(
+            name="optical_fiber_%d" % index,
+            model=optical_fiber_model,
+            fiber_insertion=FiberInsertion(name="fiber_insertion", insertion_position_ml_in_mm=0.1 * index),
+        )
+        nwbfile.add_device(optical_fiber)
+        optional_columns = {} if coordinates is None else {"coordinates": coordinates[index]}
+        fiber_photometry_table.add_row(
+            **optional_columns,
+            location="VTA" if index % 2 == 0 else "NAc",
+            excitation_wavelength_in_nm=470.0,
+            emission_wavelength_in_nm=525.0,
+            indicator=indicator,
+            optical_fiber=optical_fiber,
+            excitation_source=excitation_source,
+            photodetector=photodetector,
+            dichroic_mirror=dichroic_mirror,
+        )
+
+    table_slot = "encoded_fiber_photometry_table" if encoded else "fiber_photometry_table"
+    nwbfile.add_lab_meta_data(
+        FiberPhotometry(
+            name="fiber_photometry",
+            **{table_slot: fiber_photometry_table},
+            fiber_photometry_indicators=FiberPhotometryIndicators(indicators=[indicator]),
+        )
+    )
+
+    region = fiber_photometry_table.create_fiber_photometry_table_region(
+        region=list(range(num_fibers)), description="all fibers"
+    )
+    if data is None:
+        data = np.random.default_rng(seed).standard_normal((num_samples, num_fibers))
+    nwbfile.add_acquisition(
+        FiberPhotometryResponseSeries(
+            name="signal",
+            description="raw fluorescence",
+            data=data,
+            unit="n.a.",
+            rate=rate,
+            fiber_photometry_table_region=region,
+        )
+    )
+    return nwbfile
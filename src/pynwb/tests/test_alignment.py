@@ -0,0 +1,139 @@
+import numpy as np
+
+from pynwb import NWBHDF5IO
+from pynwb.testing import TestCase, remove_test_file
+from pynwb.testing.mock.file import mock_NWBFile
+
+from ndx_fiber_photometry import FiberPhotometryResponseSeries, CommandedVoltageSeries, align_series
+
+
+class TestAlignSeries(TestCase):
+
+    def setUp(self):
+        self.time_100 = np.arange(1000) / 100.0
+        self.signal = FiberPhotometryResponseSeries(
+            name="signal",
+            description="signal channel",
+            data=np.column_stack([np.sin(2 * np.pi * self.time_100), np.cos(2 * np.pi * self.time_100)]),
+            unit="n.a.",
+            rate=100.0,
+        )
+        time_30 = np.arange(300) / 30.0
+        self.voltage = CommandedVoltageSeries(
+            name="commanded_voltage_series",
+            description="commanded voltage",
+            data=2.0 * time_30,
+            unit="volts",
+            rate=30.0,
+        )
+        rng = np.random.default_rng(0)
+        self.jittered_times = np.sort(rng.uniform(0.0, 10.0, 500))
+        self.isosbestic = FiberPhotometryResponseSeries(
+            name="isosbestic",
+            description="isosbestic channel with jittered timestamps",
+            data=3.0 * self.jittered_times,
+            unit="n.a.",
+            timestamps=self.jittered_times,
+        )
+
+    def test_reference_timebase_defaults_to_first_series(self):
+        aligned = align_series([self.signal, self.voltage])
+        self.assertEqual(len(aligned), 1000)
+        self.assertEqual(aligned.rate, 100.0)
+        self.assertEqual(aligned.shapes, {"signal": (1000, 2), "commanded_voltage_series": (1000, 1)})
+        np.testing.assert_allclose(aligned[:]["signal"], self.signal.data, atol=1e-12)
+
+    def test_upsample_regular_series(self):
+        aligned = align_series([self.signal, self.voltage])
+        data = aligned[:]["commanded_voltage_series"][:, 0]
+        inside = self.time_100 <= 299 / 30.0
+        # Away from the edges the ramp is reproduced by the windowed-sinc filter
+        np.testing.assert_allclose(data[inside][100:-100], 2.0 * self.time_100[inside][100:-100], atol=1e-3)
+        self.assertTrue(np.isnan(data[~inside]).all())
+
+    def test_sinc_keeps_unity_gain_at_the_edges(self):
+        constant = CommandedVoltageSeries(
+            name="constant", description="constant voltage", data=np.ones(300), unit="volts", rate=30.0
+        )
+        data = align_series([constant], rate=100.0)[:]["constant"][:, 0]
+        # the filter is renormalized where it is truncated by the edges of the series only
+        np.testing.assert_allclose(data[:20], 1.0, rtol=1e-12)
+        np.testing.assert_allclose(data[-20:], 1.0, rtol=1e-12)
+        np.testing.assert_allclose(data, 1.0, atol=1e-3)
+
+    def test_downsample_is_anti_aliased(self):
+        fast = FiberPhotometryResponseSeries(
+            name="fast",
+            description="tone above the target Nyquist frequency",
+            data=np.sin(2 * np.pi * 40.0 * self.time_100),
+            unit="n.a.",
+            rate=100.0,
+        )
+        aligned = align_series([fast], rate=20.0)
+        self.assertLess(np.abs(aligned[:]["fast"][20:-20]).max(), 0.05)
+
+    def test_irregular_series_is_interpolated(self):
+        aligned = align_series([self.isosbestic], rate=50.0, starting_time=1.0, stop_time=9.0)
+        self.assertEqual(len(aligned), 401)
+        np.testing.assert_allclose(aligned[:]["isosbestic"][:, 0], 3.0 * aligned.timestamps(), rtol=1e-6)
+
+    def test_multidimensional_data_is_flattened(self):
+        grid = FiberPhotometryResponseSeries(
+            name="grid",
+            description="2 x 2 fibers per sample",
+            data=np.arange(400.0).reshape(100, 2, 2),
+            unit="n.a.",
+            rate=100.0,
+        )
+        aligned = align_series([grid])
+        self.assertEqual(aligned.shapes, {"grid": (100, 4)})
+        np.testing.assert_allclose(aligned[:]["grid"], np.arange(400.0).reshape(100, 4), atol=1e-9)
+
+    def test_iter_chunks_matches_full_read(self):
+        aligned = align_series([self.signal, self.voltage, self.isosbestic], rate=60.0, chunk_size=77)
+        full = aligned[:]
+        chunks = list(aligned.iter_chunks())
+        np.testing.assert_array_equal(np.concatenate([t for t, _ in chunks]), aligned.timestamps())
+        for name in aligned.names:
+            np.testing.assert_allclose(np.concatenate([d[name] for _, d in chunks]), full[name])
+
+    def test_explicit_timestamps(self):
+        target = np.array([1.0, 2.5, 7.25])
+        aligned = align_series([self.isosbestic], timestamps=target)
+        np.testing.assert_allclose(aligned[:]["isosbestic"][:, 0], 3.0 * target, rtol=1e-6)
+
+    def test_invalid_arguments(self):
+        with self.assertRaises(ValueError):
+            align_series([])
+        with self.assertRaises(ValueError):
+            align_series([self.signal, self.signal])
+        with self.assertRaises(ValueError):
+            align_series([self.signal], rate=10.0, timestamps=[0.0, 1.0])
+        with self.assertRaises(ValueError):
+            align_series([self.isosbestic], rate=10.0, method="sinc")
+
+
+class TestAlignSeriesFromFile(TestCase):
+
+    def setUp(self):
+        self.path = "test_alignment.nwb"
+
+    def tearDown(self):
+        remove_test_file(self.path)
+
+    def test_align_series_read_from_file(self):
+        nwbfile = mock_NWBFile()
+        timestamps = np.cumsum(np.full(20_000, 0.01))
+        nwbfile.add_acquisition(
+            FiberPhotometryResponseSeries(
+                name="signal", description="signal", data=timestamps * 2.0, unit="n.a.", timestamps=timestamps
+            )
+        )
+        with NWBHDF5IO(self.path, mode="w") as io:
+            io.write(nwbfile)
+
+        with NWBHDF5IO(self.path, mode="r") as io:
+            signal = io.read().acquisition["signal"]
+            aligned = align_series([signal], rate=25.0, chunk_size=1000)
+            for times, data in aligned.iter_chunks():
+                np.testing.assert_allclose(data["signal"][:, 0], times * 2.0, rtol=1e-9)
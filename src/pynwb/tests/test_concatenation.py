@@ -0,0 +1,170 @@
+import os
+from datetime import datetime, timedelta, timezone
+
+import h5py
+import numpy as np
+
+from pynwb import NWBHDF5IO
+from pynwb.testing import TestCase, remove_test_file
+
+from ndx_fiber_photometry import (
+    ConcatenatedSeries,
+    FiberPhotometryResponseSeries,
+    clear_rig_cache,
+    concatenate_series,
+    load_rig,
+)
+from ndx_fiber_photometry.rig import _rig_cache
+
+from .mock import mock_fiber_photometry_nwbfile
+
+START = datetime(2024, 1, 1, 9, 0, tzinfo=timezone.utc)
+RATE = 10.0
+
+
+def fiber_values(samples, num_fibers=2):
+    """Data whose value identifies the sample of the concatenation and the fiber (0 at the VTA, 1 at the NAc)."""
+    return samples[:, np.newaxis] + 1000 * np.arange(num_fibers)
+
+
+def mock_session(session_start_time, samples, columns=(0, 1), timestamps=None, conversion=1.0):
+    """A session recording the fibers of table rows ``columns``, at the VTA (even rows) and the NAc (odd rows)."""
+    nwbfile = mock_fiber_photometry_nwbfile(num_fibers=2, session_start_time=session_start_time)
+    nwbfile.acquisition.pop("signal")
+    table = nwbfile.lab_meta_data["fiber_photometry"].get_fiber_photometry_table()
+    timing = {"rate": RATE} if timestamps is None else {"timestamps": timestamps}
+    nwbfile.add_acquisition(
+        FiberPhotometryResponseSeries(
+            name="signal",
+            description="fluorescence",
+            data=(fiber_values(samples)[:, list(columns)] / conversion).astype("int32"),
+            unit="n.a.",
+            conversion=conversion,
+            fiber_photometry_table_region=table.create_fiber_photometry_table_region(
+                region=list(columns), description="fibers"
+            ),
+            **timing,
+        )
+    )
+    return nwbfile
+
+
+class TestConcatenateSeries(TestCase):
+
+    def setUp(self):
+        self.paths = ["test_concatenation_%d.nwb" % index for index in range(3)]
+        self.export_path = "test_concatenation_export.nwb"
+        sessions = [
+            mock_session(START, np.arange(0, 100)),
+            # fibers in the other order
+            mock_session(START + timedelta(seconds=60), np.arange(100, 150), columns=(1, 0)),
+            # irregular timestamps
+            mock_session(START + timedelta(seconds=120), np.arange(150, 180), timestamps=np.arange(30) * 0.25 + 1.0),
+        ]
+        for nwbfile, path in zip(sessions, self.paths):
+            with NWBHDF5IO(path, mode="w") as io:
+                io.write(nwbfile)
+        self.ios = [NWBHDF5IO(path, mode="r") for path in self.paths]
+        self.series = [io.read().acquisition["signal"] for io in self.ios]
+        self.expected_timestamps = np.concatenate(
+            [np.arange(100) / RATE, 60.0 + np.arange(50) / RATE, 121.0 + np.arange(30) * 0.25]
+        )
+
+    def tearDown(self):
+        for io in self.ios:
+            io.close()
+        clear_rig_cache()
+        for path in self.paths + [self.export_path]:
+            remove_test_file(path)
+
+    def test_concatenate(self):
+        concatenated = concatenate_series(self.series)
+        self.assertIsInstance(concatenated, ConcatenatedSeries)
+        self.assertEqual(concatenated.shape, (180, 2))
+        self.assertEqual(list(concatenated.fibers["location"]), ["VTA", "NAc"])
+        self.assertEqual([list(columns) for columns in concatenated.columns], [[0, 1], [1, 0], [0, 1]])
+        np.testing.assert_array_equal(concatenated[:], fiber_values(np.arange(180)))
+        np.testing.assert_allclose(concatenated.timestamps(), self.expected_timestamps)
+        np.testing.assert_allclose(concatenated.time_offsets, [0.0, 60.0, 120.0])
+
+    def test_partial_reads(self):
+        concatenated = concatenate_series(self.series)
+        np.testing.assert_array_equal(concatenated[95:160], fiber_values(np.arange(95, 160)))
+        np.testing.assert_allclose(concatenated.timestamps(95, 160), self.expected_timestamps[95:160])
+        chunks = list(concatenated.iter_chunks(chunk_size=33))
+        np.testing.assert_allclose(np.concatenate([timestamps for timestamps, _ in chunks]), self.expected_timestamps)
+        np.testing.assert_array_equal(np.concatenate([data for _, data in chunks]), fiber_values(np.arange(180)))
+
+    def test_time_range(self):
+        concatenated = concatenate_series(self.series)
+        self.assertEqual(concatenated.time_range(), (0, 180))
+        self.assertEqual(concatenated.time_range(5.0, 60.2), (50, 102))
+        # times between sessions select the next session
+        self.assertEqual(concatenated.time_range(30.0, 121.3), (100, 152))
+
+    def test_export(self):
+        concatenate_series(self.series).export(self.export_path, start_time=5.0, stop_time=121.3, buffer_size=40)
+        with h5py.File(self.export_path, "r") as f:
+            self.assertIsInstance(f["/general/devices"].get("optical_fiber_0", getlink=True), h5py.ExternalLink)
+        with NWBHDF5IO(self.export_path, mode="r") as io:
+            nwbfile = io.read()
+            self.assertEqual(nwbfile.session_start_time, START)
+            series = nwbfile.acquisition["signal"]
+            self.assertEqual(series.data.dtype, np.dtype("int32"))
+            np.testing.assert_array_equal(series.data[:], fiber_values(np.arange(50, 152)))
+            np.testing.assert_allclose(series.timestamps[:], self.expected_timestamps[50:152])
+            region = series.fiber_photometry_table_region
+            self.assertEqual(list(region.table["location"][list(region.data[:])]), ["VTA", "NAc"])
+
+    def test_export_closes_first_file(self):
+        concatenate_series(self.series).export(self.export_path)
+        self.assertNotIn(os.path.abspath(self.paths[0]), _rig_cache)
+        # a rig loaded before the export stays loaded
+        rig = load_rig(self.paths[0])
+        concatenate_series(self.series).export(self.export_path)
+        self.assertIs(load_rig(self.paths[0]), rig)
+
+    def test_export_within_one_session(self):
+        concatenate_series(self.series).export(self.export_path, start_time=61.0, stop_time=62.0)
+        with NWBHDF5IO(self.export_path, mode="r") as io:
+            series = io.read().acquisition["signal"]
+            self.assertEqual(series.rate, RATE)
+            self.assertAlmostEqual(series.starting_time, 61.0)
+            np.testing.assert_array_equal(series.data[:], fiber_values(np.arange(110, 120)))
+
+    def test_export_different_conversions(self):
+        path = "test_concatenation_3.nwb"
+        self.paths.append(path)
+        with NWBHDF5IO(path, mode="w") as io:
+            io.write(mock_session(START + timedelta(hours=1), np.arange(180, 200) * 2, conversion=2.0))
+        self.ios.append(NWBHDF5IO(path, mode="r"))
+        self.series.append(self.ios[-1].read().acquisition["signal"])
+
+        concatenated = concatenate_series(self.series)
+        np.testing.assert_array_equal(concatenated[175:185], fiber_values(np.r_[175:180, 360:370:2]))
+        concatenated.export(self.export_path)
+        with NWBHDF5IO(self.export_path, mode="r") as io:
+            series = io.read().acquisition["signal"]
+            self.assertEqual(series.data.dtype, np.dtype("float64"))
+            self.assertEqual(series.conversion, 1.0)
+            np.testing.assert_array_equal(series.data[175:185], fiber_values(np.r_[175:180, 360:370:2]))
+
+    def test_incompatible_series(self):
+        with self.assertRaises(ValueError):
+            concatenate_series(self.series[::-1])
+        with self.assertRaises(ValueError):
+            concatenate_series(self.series, time_offsets=[0.0, 0.0, 0.0])
+        with self.assertRaises(ValueError):
+            concatenate_series(self.series, key_columns=("location", "not_a_column"))
+
+    def test_fibers_at_the_same_location(self):
+        # two fibers at the VTA and two at the NAc, with the same indicator and wavelengths
+        coordinates = np.arange(12.0).reshape(4, 3)
+        series = mock_fiber_photometry_nwbfile(num_fibers=4, coordinates=coordinates).acquisition["signal"]
+        concatenated = concatenate_series([series])
+        self.assertEqual(list(concatenated.fibers["optical_fiber"]), ["optical_fiber_%d" % i for i in range(4)])
+        np.testing.assert_allclose(concatenated[:], series.data[:])
+        concatenated = concatenate_series([series], key_columns=("location", "coordinates"))
+        self.assertEqual(list(concatenated.fibers["coordinates"]), [tuple(row) for row in coordinates.tolist()])
+        with self.assertRaises(ValueError):
+            concatenate_series([series], key_columns=("location", "indicator"))
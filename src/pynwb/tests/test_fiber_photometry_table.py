@@ -0,0 +1,281 @@
+import os
+
+import h5py
+import numpy as np
+
+from hdmf.common import EnumData
+from pynwb import NWBHDF5IO
+from pynwb.testing import TestCase, remove_test_file
+from pynwb.validation import validate
+
+from ndx_fiber_photometry import (
+    FiberPhotometry,
+    FiberPhotometryIndicators,
+    FiberPhotometryTable,
+    EncodedFiberPhotometryTable,
+    FiberPhotometryResponseSeries,
+    create_encoded_fiber_photometry_table,
+)
+
+from .mock import mock_fiber_photometry_nwbfile
+
+# Written with ndx-fiber-photometry 0.2.3, whose FiberPhotometryTable is named "MyTable"
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), "data", "fiber_photometry_v0.2.3.nwb")
+
+
+class TestEncodedFiberPhotometryTable(TestCase):
+
+    def setUp(self):
+        self.path = "test_encoded_fiber_photometry_table.nwb"
+
+    def tearDown(self):
+        remove_test_file(self.path)
+
+    def test_create_encoded_table(self):
+        table = create_encoded_fiber_photometry_table(description="fiber photometry table")
+        self.assertIsInstance(table, EncodedFiberPhotometryTable)
+        self.assertEqual(table.name, "fiber_photometry_table")
+        for column_name in ("indicator", "optical_fiber", "excitation_source", "photodetector", "dichroic_mirror"):
+            self.assertIsInstance(table[column_name], EnumData)
+        self.assertNotIn("commanded_voltage_series", table.colnames)
+
+    def test_invalid_encoded_columns(self):
+        with self.assertRaises(ValueError):
+            create_encoded_fiber_photometry_table(description="fiber photometry table", encoded_columns=["location"])
+
+    def test_optional_encoded_columns(self):
+        table = create_encoded_fiber_photometry_table(
+            description="fiber photometry table", encoded_columns=["emission_filter"]
+        )
+        self.assertIsInstance(table["emission_filter"], EnumData)
+        self.assertIsInstance(table["optical_fiber"], EnumData)
+
+    def test_encoded_rows(self):
+        nwbfile = mock_fiber_photometry_nwbfile(num_fibers=6, encoded=True)
+        table = nwbfile.lab_meta_data["fiber_photometry"].get_fiber_photometry_table()
+        self.assertEqual(len(table["photodetector"].elements), 1)
+        self.assertEqual(len(table["optical_fiber"].elements), 6)
+        self.assertEqual(table["photodetector"][5], nwbfile.devices["photodetector"])
+        self.assertEqual(table["optical_fiber"][5], nwbfile.devices["optical_fiber_5"])
+
+    def test_roundtrip(self):
+        nwbfile = mock_fiber_photometry_nwbfile(num_fibers=6, encoded=True)
+        with NWBHDF5IO(self.path, mode="w") as io:
+            io.write(nwbfile)
+
+        with NWBHDF5IO(self.path, mode="r") as io:
+            read_nwbfile = io.read()
+            table = read_nwbfile.lab_meta_data["fiber_photometry"].get_fiber_photometry_table()
+            self.assertIsInstance(table["photodetector"], EnumData)
+            np.testing.assert_array_equal(table["photodetector"].data[:], np.zeros(6))
+            self.assertIs(table["photodetector"][3], read_nwbfile.devices["photodetector"])
+            self.assertEqual(
+                [fiber.name for fiber in table["optical_fiber"][:]], ["optical_fiber_%d" % i for i in range(6)]
+            )
+            dataframe = table.to_dataframe()
+            self.assertEqual(list(dataframe["location"]), ["VTA", "NAc"] * 3)
+            self.assertIs(dataframe["dichroic_mirror"].iloc[4], read_nwbfile.devices["dichroic_mirror"])
+
+            region = read_nwbfile.acquisition["signal"].fiber_photometry_table_region
+            self.assertIs(region.table, table)
+
+    def test_validate(self):
+        with NWBHDF5IO(self.path, mode="w") as io:
+            io.write(mock_fiber_photometry_nwbfile(num_fibers=6, encoded=True))
+        self.assertEqual(validate(path=self.path), [])
+
+
+class TestFiberPhotometryTableRegion(TestCase):
+
+    def setUp(self):
+        self.nwbfile = mock_fiber_photometry_nwbfile(num_fibers=6)
+        self.table = self.nwbfile.lab_meta_data["fiber_photometry"].get_fiber_photometry_table()
+        self.path = "test_fiber_photometry_table_region.nwb"
+
+    def tearDown(self):
+        remove_test_file(self.path)
+
+    def test_region_types(self):
+        expected = [1, 3, 5]
+        regions = [
+            [1, 3, 5],
+            (1, 3, 5),
+            range(1, 6, 2),
+            slice(1, 6, 2),
+            np.array([1, 3, 5], dtype=np.int32),
+            np.array([False, True, False, True, False, True]),
+        ]
+        for region in regions:
+            table_region = self.table.create_fiber_photometry_table_region(region=region, description="odd fibers")
+            self.assertEqual(table_region.name, "fiber_photometry_table_region")
+            self.assertEqual(table_region.data, expected)
+            self.assertIs(table_region.table, self.table)
+
+    def test_invalid_regions(self):
+        with self.assertRaises(IndexError):
+            self.table.create_fiber_photometry_table_region(region=[0, 6], description="out of range")
+        with self.assertRaises(IndexError):
+            self.table.create_fiber_photometry_table_region(region=np.ones(5, dtype=bool), description="bad mask")
+        with self.assertRaises(IndexError):
+            self.table.create_fiber_photometry_table_region(region=slice(0, 7), description="out of range")
+        with self.assertRaises(TypeError):
+            self.table.create_fiber_photometry_table_region(region=[0.5, 1.5], description="not indices")
+
+    def test_shared_region_is_written_once(self):
+        region = self.table.get_fiber_photometry_table_region(region=np.arange(6), description="all fibers")
+        self.assertIs(
+            self.table.get_fiber_photometry_table_region(region=slice(None), description="all fibers"), region
+        )
+        # another description is another region
+        other = self.table.get_fiber_photometry_table_region(region=slice(None), description="all channels")
+        self.assertIsNot(other, region)
+        self.assertEqual(other.description, "all channels")
+        self.assertIsNot(self.table.get_fiber_photometry_table_region(region=[0], description="first"), region)
+
+        for name in ("dff", "isosbestic"):
+            self.nwbfile.add_acquisition(
+                FiberPhotometryResponseSeries(
+                    name=name,
+                    description=name,
+                    data=np.zeros((10, 6)),
+                    unit="n.a.",
+                    rate=30.0,
+                    fiber_photometry_table_region=region,
+                )
+            )
+        with NWBHDF5IO(self.path, mode="w") as io:
+            io.write(self.nwbfile)
+
+        with h5py.File(self.path, "r") as f:
+            links = [
+                f["acquisition"][name].get("fiber_photometry_table_region", getlink=True)
+                for name in ("dff", "isosbestic")
+            ]
+            self.assertEqual(sum(isinstance(link, h5py.SoftLink) for link in links), 1)
+
+        with NWBHDF5IO(self.path, mode="r") as io:
+            read_nwbfile = io.read()
+            self.assertIs(
+                read_nwbfile.acquisition["dff"].fiber_photometry_table_region,
+                read_nwbfile.acquisition["isosbestic"].fiber_photometry_table_region,
+            )
+
+
+class TestGetDataColumnIndices(TestCase):
+
+    def setUp(self):
+        self.path = "test_get_data_column_indices.nwb"
+
+    def tearDown(self):
+        remove_test_file(self.path)
+
+    def check_column_indices(self, nwbfile):
+        series = nwbfile.acquisition["signal"]
+        np.testing.assert_array_equal(series.get_data_column_indices(location="VTA"), [0, 2, 4])
+        np.testing.assert_array_equal(
+            series.get_data_column_indices(location="NAc", optical_fiber=["optical_fiber_1", "optical_fiber_5"]), [1, 5]
+        )
+        np.testing.assert_array_equal(
+            series.get_data_column_indices(optical_fiber=nwbfile.devices["optical_fiber_3"]), [3]
+        )
+        np.testing.assert_array_equal(series.get_data_column_indices(excitation_wavelength_in_nm=405.0), [])
+        np.testing.assert_array_equal(series.get_data_column_indices(), np.arange(6))
+        with self.assertRaises(ValueError):
+            series.get_data_column_indices(not_a_column=1)
+
+    def test_in_memory(self):
+        self.check_column_indices(mock_fiber_photometry_nwbfile(num_fibers=6))
+
+    def test_read_from_file(self):
+        for encoded in (False, True):
+            with NWBHDF5IO(self.path, mode="w") as io:
+                io.write(mock_fiber_photometry_nwbfile(num_fibers=6, encoded=encoded))
+            with NWBHDF5IO(self.path, mode="r") as io:
+                self.check_column_indices(io.read())
+
+    def check_array_column_indices(self, nwbfile):
+        series = nwbfile.acquisition["signal"]
+        np.testing.assert_array_equal(series.get_data_column_indices(coordinates=[3.0, 4.0, 5.0]), [1])
+        np.testing.assert_array_equal(series.get_data_column_indices(coordinates=np.array([6.0, 7.0, 8.0])), [2])
+        np.testing.assert_array_equal(
+            series.get_data_column_indices(coordinates=[[0.0, 1.0, 2.0], np.array([9.0, 10.0, 11.0])]), [0, 3]
+        )
+        np.testing.assert_array_equal(series.get_data_column_indices(coordinates=[0.0, 1.0, 3.0]), [])
+        np.testing.assert_array_equal(series.get_data_column_indices(gain=[1.0, 2.0]), [0, 2])
+        np.testing.assert_array_equal(series.get_data_column_indices(gain=[[1.0, 2.0], [5.0, 6.0]]), [0, 2, 3])
+        np.testing.assert_array_equal(series.get_data_column_indices(channels=[1, 2]), [1])
+        np.testing.assert_array_equal(series.get_data_column_indices(channels=[[0], [3]]), [0, 3])
+        np.testing.assert_array_equal(series.get_data_column_indices(channels=[1]), [])
+        np.testing.assert_array_equal(series.get_data_column_indices(location="VTA", gain=[1.0, 2.0]), [0, 2])
+
+    def test_array_columns(self):
+        nwbfile = mock_fiber_photometry_nwbfile(num_fibers=4, coordinates=np.arange(12.0).reshape(4, 3))
+        table = nwbfile.lab_meta_data["fiber_photometry"].get_fiber_photometry_table()
+        table.add_column(name="gain", description="gains", data=[[1.0, 2.0], [3.0, 4.0], [1.0, 2.0], [5.0, 6.0]])
+        table.add_column(name="channels", description="channels", data=[[0], [1, 2], [0, 1], [3]], index=True)
+        self.check_array_column_indices(nwbfile)
+
+        with NWBHDF5IO(self.path, mode="w") as io:
+            io.write(nwbfile)
+        with NWBHDF5IO(self.path, mode="r") as io:
+            self.check_array_column_indices(io.read())
+
+
+class TestFiberPhotometry(TestCase):
+
+    def setUp(self):
+        self.path = "test_fiber_photometry.nwb"
+
+    def tearDown(self):
+        remove_test_file(self.path)
+
+    def test_table_slots(self):
+        indicators = FiberPhotometryIndicators(indicators=[])
+        table = FiberPhotometryTable(name="MyTable", description="fiber photometry table")
+        encoded_table = create_encoded_fiber_photometry_table(description="fiber photometry table")
+        fiber_photometry = FiberPhotometry(
+            name="fiber_photometry", fiber_photometry_table=table, fiber_photometry_indicators=indicators
+        )
+        self.assertIs(fiber_photometry.get_fiber_photometry_table(), table)
+        fiber_photometry = FiberPhotometry(
+            name="fiber_photometry",
+            encoded_fiber_photometry_table=encoded_table,
+            fiber_photometry_indicators=indicators,
+        )
+        self.assertIs(fiber_photometry.get_fiber_photometry_table(), encoded_table)
+        self.assertIsNone(fiber_photometry.fiber_photometry_table)
+        with self.assertRaises(ValueError):
+            FiberPhotometry(name="fiber_photometry", fiber_photometry_indicators=indicators)
+        with self.assertRaises(ValueError):
+            FiberPhotometry(
+                name="fiber_photometry",
+                fiber_photometry_table=table,
+                encoded_fiber_photometry_table=encoded_table,
+                fiber_photometry_indicators=indicators,
+            )
+        with self.assertRaises(ValueError):
+            FiberPhotometry(
+                name="fiber_photometry", fiber_photometry_table=encoded_table, fiber_photometry_indicators=indicators
+            )
+
+    def test_read_baseline_file(self):
+        with NWBHDF5IO(BASELINE_PATH, mode="r") as io:
+            nwbfile = io.read()
+            table = nwbfile.lab_meta_data["fiber_photometry"].fiber_photometry_table
+            self.assertIsInstance(table, FiberPhotometryTable)
+            self.assertNotIsInstance(table, EncodedFiberPhotometryTable)
+            self.assertEqual(table.name, "MyTable")
+            self.assertIsNone(nwbfile.lab_meta_data["fiber_photometry"].encoded_fiber_photometry_table)
+            self.assertIs(table["optical_fiber"][1], nwbfile.devices["optical_fiber_1"])
+            series = nwbfile.acquisition["signal"]
+            self.assertIs(series.fiber_photometry_table_region.table, table)
+            np.testing.assert_array_equal(series.get_data_column_indices(location="NAc"), [1])
+
+            with NWBHDF5IO(self.path, mode="w") as export_io:
+                export_io.export(src_io=io, nwbfile=nwbfile)
+
+        self.assertEqual(validate(path=self.path), [])
+        with NWBHDF5IO(self.path, mode="r") as io:
+            table = io.read().lab_meta_data["fiber_photometry"].fiber_photometry_table
+            self.assertEqual(table.name, "MyTable")
+            self.assertEqual(list(table["location"][:]), ["VTA", "NAc"])
@@ -0,0 +1,66 @@
+import json
+
+from hdmf.backends.hdf5 import HDF5IO
+from hdmf.build import ObjectMapper
+from pynwb import NWBHDF5IO
+from pynwb.testing import TestCase, remove_test_file
+
+from ndx_fiber_photometry import FiberPhotometryTable, profile
+
+from .mock import mock_fiber_photometry_nwbfile
+
+
+class TestProfile(TestCase):
+
+    def setUp(self):
+        self.path = "test_profiling.nwb"
+
+    def tearDown(self):
+        remove_test_file(self.path)
+
+    def test_profile_write_and_read(self):
+        with profile() as profiler:
+            nwbfile = mock_fiber_photometry_nwbfile(num_fibers=3)
+            with NWBHDF5IO(self.path, mode="w") as io:
+                io.write(nwbfile)
+            with NWBHDF5IO(self.path, mode="r") as io:
+                read_nwbfile = io.read()
+                read_nwbfile.acquisition["signal"].data[:10]
+
+        summary = profiler.summary()
+        self.assertEqual(summary["table/add_row"]["count"], 3)
+        self.assertIn("build/build", summary)
+        self.assertIn("write/resolve_references", summary)
+        self.assertIn("read/construct", summary)
+        self.assertGreaterEqual(profiler.counters["references_resolved"], 3 * 5)
+
+        written = {event.args["path"]: event for event in profiler.events if event.name == "write_dataset"}
+        self.assertEqual(written["/acquisition/signal/data"].nbytes, 100 * 3 * 8)
+        self.assertIn("/general/fiber_photometry/fiber_photometry_table/optical_fiber", written)
+
+        reads = [event for event in profiler.events if event.name == "read_dataset"]
+        self.assertIn("/acquisition/signal/data", [event.args["path"] for event in reads])
+        self.assertEqual(
+            sum(event.nbytes for event in reads if event.args["path"] == "/acquisition/signal/data"), 10 * 3 * 8
+        )
+
+    def test_export(self):
+        with profile() as profiler:
+            mock_fiber_photometry_nwbfile(num_fibers=2)
+        self.assertEqual(json.loads(profiler.to_json())["summary"]["table/add_row"]["count"], 2)
+        trace = profiler.to_chrome_trace()
+        self.assertEqual({event["ph"] for event in trace["traceEvents"]}, {"X"})
+
+    def test_hooks_are_removed_on_exit(self):
+        originals = (FiberPhotometryTable.__dict__.get("add_row"), ObjectMapper.build, HDF5IO.write_dataset)
+        with profile():
+            self.assertIsNot(ObjectMapper.build, originals[1])
+        self.assertEqual(
+            (FiberPhotometryTable.__dict__.get("add_row"), ObjectMapper.build, HDF5IO.write_dataset), originals
+        )
+
+    def test_nested_profile_raises(self):
+        with profile():
+            with self.assertRaises(RuntimeError):
+                with profile():
+                    pass
@@ -0,0 +1,130 @@
+import os
+
+import numpy as np
+
+from pynwb import NWBHDF5IO
+from pynwb.testing import TestCase, remove_test_file
+
+from ndx_fiber_photometry import FiberPhotometryResponseSeries, QCMetricsAccumulator, compute_qc_metrics
+
+from .mock import mock_fiber_photometry_nwbfile
+
+
+class TestQCMetricsAccumulator(TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.num_samples = 10_000
+        self.timestamps = np.arange(self.num_samples) / 100.0
+        bleaching = 2.0 * np.exp(-self.timestamps / 500.0)
+        self.noise = rng.normal(0.0, 0.01, (self.num_samples, 3))
+        self.data = bleaching[:, np.newaxis] + self.noise
+        self.data[:500, 1] = 2.05  # clipped at the top of the range for the first 5 s
+
+    def accumulate(self, chunk_size, **kwargs):
+        accumulator = QCMetricsAccumulator(3, **kwargs)
+        for start in range(0, self.num_samples, chunk_size):
+            stop = start + chunk_size
+            accumulator.update(self.data[start:stop], self.timestamps[start:stop], self.data[start:stop] + 1.0)
+        return accumulator.result()
+
+    def test_independent_of_chunk_size(self):
+        expected = self.accumulate(self.num_samples)
+        for chunk_size in (1, 7, 1000):
+            result = self.accumulate(chunk_size)
+            for name, values in expected.items():
+                np.testing.assert_allclose(result[name], values, rtol=1e-9, err_msg=name)
+
+    def test_metrics(self):
+        result = self.accumulate(1000)
+        # the 500 clipped samples and the single sample at the minimum
+        self.assertEqual(result["saturation_fraction"][1], 501 / self.num_samples)
+        self.assertLess(result["saturation_fraction"][0], 0.001)
+        noise_std = np.std(np.diff(self.data[:, 0]), ddof=1) / np.sqrt(2)
+        np.testing.assert_allclose(result["snr"][0], self.data[:, 0].mean() / noise_std, rtol=1e-6)
+        # 2 * exp(-t / 500) decays by about 1 / 500 of its mean per second over the first 100 s
+        np.testing.assert_allclose(result["bleaching_rate_per_s"][[0, 2]], 1 / 500.0, rtol=0.1)
+        np.testing.assert_allclose(result["isosbestic_correlation"], 1.0)
+        np.testing.assert_array_equal(result["num_gaps"], 0)
+
+    def test_saturation_range(self):
+        result = self.accumulate(1000, saturation_range=(0.0, 2.05))
+        self.assertAlmostEqual(result["saturation_fraction"][1], 0.05)
+
+    def test_gaps(self):
+        timestamps = np.delete(self.timestamps, np.r_[100:103, 5000])
+        accumulator = QCMetricsAccumulator(3)
+        for start in range(0, len(timestamps), 999):
+            chunk = timestamps[start : start + 999]
+            accumulator.update(self.data[: len(chunk)], chunk)
+        result = accumulator.result()
+        np.testing.assert_array_equal(result["num_gaps"], 2)
+        np.testing.assert_array_equal(result["num_dropped_samples"], 4)
+
+
+class TestComputeQCMetrics(TestCase):
+
+    def setUp(self):
+        self.path = "test_qc.nwb"
+        nwbfile = mock_fiber_photometry_nwbfile(num_fibers=4, num_samples=5000)
+        table = nwbfile.lab_meta_data["fiber_photometry"].get_fiber_photometry_table()
+        signal = nwbfile.acquisition["signal"].data
+        # isosbestic control of rows 3 and 1, in that order
+        nwbfile.add_acquisition(
+            FiberPhotometryResponseSeries(
+                name="isosbestic",
+                description="isosbestic control",
+                data=signal[:, [3, 1]] * 2.0,
+                unit="n.a.",
+                rate=30.0,
+                fiber_photometry_table_region=table.create_fiber_photometry_table_region(
+                    region=[3, 1], description="fibers with an isosbestic control"
+                ),
+            )
+        )
+        with NWBHDF5IO(self.path, mode="w") as io:
+            io.write(nwbfile)
+
+    def tearDown(self):
+        remove_test_file(self.path)
+        remove_test_file(self.path + ".qc.json")
+
+    def test_keyed_by_table_rows(self):
+        with NWBHDF5IO(self.path, mode="r") as io:
+            acquisition = io.read().acquisition
+            metrics = compute_qc_metrics(acquisition["signal"], isosbestic=acquisition["isosbestic"], chunk_size=700)
+        self.assertEqual(metrics.index.name, "fiber_photometry_table_row")
+        self.assertEqual(list(metrics.index), [0, 1, 2, 3])
+        np.testing.assert_allclose(metrics.loc[[1, 3], "isosbestic_correlation"], 1.0)
+        self.assertTrue(np.isnan(metrics.loc[[0, 2], "isosbestic_correlation"]).all())
+
+    def test_sidecar_cache(self):
+        with NWBHDF5IO(self.path, mode="r") as io:
+            signal = io.read().acquisition["signal"]
+            metrics = compute_qc_metrics(signal, cache=True)
+            self.assertTrue(os.path.exists(self.path + ".qc.json"))
+
+            # a rerun reads the sidecar instead of the data
+            data = signal.fields["data"]
+            signal.fields["data"] = _UnreadableData(data)
+            try:
+                cached_metrics = compute_qc_metrics(signal, cache=True)
+            finally:
+                signal.fields["data"] = data
+        self.assertTrue(cached_metrics.equals(metrics))
+
+
+class _UnreadableData:
+    """Dataset stand-in that exposes the identity of an h5py dataset but fails when its samples are read."""
+
+    def __init__(self, dataset):
+        self.file, self.name, self.shape, self.dtype = dataset.file, dataset.name, dataset.shape, dataset.dtype
+        self._dataset = dataset
+
+    def __len__(self):
+        return len(self._dataset)
+
+    def __getitem__(self, key):
+        if key == slice(None, 1):
+            return self._dataset[key]
+        raise AssertionError("data should not be read when QC metrics are cached")
@@ -0,0 +1,92 @@
+import numpy as np
+
+from pynwb import NWBHDF5IO
+from pynwb.testing import TestCase, remove_test_file
+from pynwb.testing.mock.file import mock_NWBFile
+
+from ndx_fiber_photometry import FiberPhotometryResponseSeries, quantize_data
+from ndx_fiber_photometry.quantization import estimate_quantization_step, select_integer_dtype
+
+
+def adc_trace(bits, num_samples=5000, num_fibers=2, full_scale_in_volts=10.0, seed=0):
+    """Return a slow fluorescence-like trace digitized by a ``bits``-bit ADC spanning +/- ``full_scale_in_volts``."""
+    rng = np.random.default_rng(seed)
+    step = 2 * full_scale_in_volts / 2**bits
+    analog = 2.0 + np.cumsum(rng.normal(0.0, 0.01, (num_samples, num_fibers)), axis=0)
+    codes = np.clip(np.round(analog / step), -(2 ** (bits - 1)), 2 ** (bits - 1) - 1)
+    return codes * step, step
+
+
+class TestQuantizeData(TestCase):
+
+    def test_int16_for_16_bit_adc(self):
+        data, step = adc_trace(bits=16)
+        quantized = quantize_data(data)
+        self.assertEqual(quantized.data.dtype, np.int16)
+        self.assertAlmostEqual(quantized.conversion, step)
+        np.testing.assert_allclose(quantized.data * quantized.conversion + quantized.offset, data, rtol=0, atol=1e-12)
+
+    def test_int32_for_wide_range(self):
+        data, _ = adc_trace(bits=24)
+        quantized = quantize_data(data)
+        self.assertEqual(quantized.data.dtype, np.int32)
+        np.testing.assert_allclose(quantized.data * quantized.conversion + quantized.offset, data, rtol=0, atol=1e-12)
+
+    def test_integer_input(self):
+        quantized = quantize_data(np.array([0, 3, 7, 1000], dtype=np.int64))
+        self.assertEqual(quantized.conversion, 1.0)
+        np.testing.assert_array_equal(quantized.data * quantized.conversion + quantized.offset, [0, 3, 7, 1000])
+
+    def test_explicit_scaling(self):
+        quantized = quantize_data(np.array([0.5, 1.0, 1.5]), conversion=0.5, offset=0.0, dtype=np.int32)
+        self.assertEqual(quantized.data.dtype, np.int32)
+        np.testing.assert_array_equal(quantized.data, [1, 2, 3])
+
+    def test_non_adc_data_is_rejected(self):
+        data = np.random.default_rng(0).standard_normal(1000)
+        with self.assertRaises(ValueError):
+            quantize_data(data, conversion=1e-3)
+        with self.assertRaises(ValueError):
+            quantize_data(np.array([0.0, np.nan]))
+        with self.assertRaises(ValueError):
+            quantize_data(np.array([0.0, 1000.0]), conversion=1.0, offset=0.0, dtype=np.int8)
+
+    def test_helpers(self):
+        self.assertEqual(estimate_quantization_step(np.array([0.0, 0.25, 1.0])), 0.25)
+        self.assertEqual(estimate_quantization_step(np.ones(5)), 1.0)
+        self.assertEqual(select_integer_dtype(2**16), np.int16)
+        self.assertEqual(select_integer_dtype(2**16 + 1), np.int32)
+        with self.assertRaises(ValueError):
+            select_integer_dtype(2**33)
+
+
+class TestQuantizedRoundtrip(TestCase):
+
+    def setUp(self):
+        self.path = "test_quantization.nwb"
+
+    def tearDown(self):
+        remove_test_file(self.path)
+
+    def test_roundtrip(self):
+        data, _ = adc_trace(bits=16)
+        quantized = quantize_data(data)
+        nwbfile = mock_NWBFile()
+        nwbfile.add_acquisition(
+            FiberPhotometryResponseSeries(
+                name="raw",
+                description="raw photodetector output",
+                data=quantized.data,
+                unit="volts",
+                rate=1000.0,
+                conversion=quantized.conversion,
+                offset=quantized.offset,
+            )
+        )
+        with NWBHDF5IO(self.path, mode="w") as io:
+            io.write(nwbfile)
+
+        with NWBHDF5IO(self.path, mode="r") as io:
+            series = io.read().acquisition["raw"]
+            self.assertEqual(series.data.dtype, np.int16)
+            np.testing.assert_allclose(series.get_data_in_units(), data, rtol=0, atol=1e-12)
@@ -0,0 +1,197 @@
+import os
+import threading
+import unittest
+import urllib.request
+from functools import partial
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+from pynwb import NWBHDF5IO
+from pynwb.testing import TestCase, remove_test_file
+
+from ndx_fiber_photometry import CachedRangeFile, FsspecRangeFetcher, open_remote_nwbfile
+
+from .mock import mock_fiber_photometry_nwbfile
+
+try:
+    import fsspec  # noqa: F401
+
+    HAVE_FSSPEC = True
+except ImportError:
+    HAVE_FSSPEC = False
+
+
+class RangeRequestHandler(SimpleHTTPRequestHandler):
+    """Serve files with support for single 'Range: bytes=start-stop' requests, counting them on the server."""
+
+    def do_GET(self):
+        self.server.num_requests += 1
+        range_header = self.headers.get("Range")
+        if range_header is None:
+            return super().do_GET()
+        path = self.translate_path(self.path)
+        start, stop = (int(value) for value in range_header.split("=")[1].split("-"))
+        with open(path, "rb") as f:
+            f.seek(start)
+            body = f.read(stop - start + 1)
+        self.send_response(206)
+        self.send_header("Content-Range", "bytes %d-%d/%d" % (start, start + len(body) - 1, os.path.getsize(path)))
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class HTTPRangeFetcher:
+    """Minimal HTTP range fetcher standing in for fsspec's HTTP file system."""
+
+    def __init__(self, url):
+        self.url = url
+        with urllib.request.urlopen(urllib.request.Request(url, method="HEAD")) as response:
+            self.size = int(response.headers["Content-Length"])
+
+    def fetch(self, start, stop):
+        request = urllib.request.Request(self.url, headers={"Range": "bytes=%d-%d" % (start, stop - 1)})
+        with urllib.request.urlopen(request) as response:
+            return response.read()
+
+
+class LocalRangeFetcher:
+
+    def __init__(self, path):
+        self.path = path
+        self.size = os.path.getsize(path)
+
+    def fetch(self, start, stop):
+        with open(self.path, "rb") as f:
+            f.seek(start)
+            return f.read(stop - start)
+
+
+class TestCachedRangeFile(TestCase):
+
+    def setUp(self):
+        self.path = "test_cached_range_file.bin"
+        self.content = np.random.default_rng(0).integers(0, 256, 10_000, dtype=np.uint8).tobytes()
+        with open(self.path, "wb") as f:
+            f.write(self.content)
+
+    def tearDown(self):
+        remove_test_file(self.path)
+
+    def test_read_and_seek(self):
+        cached_file = CachedRangeFile(LocalRangeFetcher(self.path), block_size=1000, max_blocks=4)
+        cached_file.seek(2500)
+        self.assertEqual(cached_file.read(1000), self.content[2500:3500])
+        self.assertEqual(cached_file.num_requests, 1)
+        self.assertEqual(cached_file.bytes_fetched, 2000)
+        self.assertEqual(cached_file.tell(), 3500)
+        cached_file.seek(2600)
+        self.assertEqual(cached_file.read(100), self.content[2600:2700])
+        self.assertEqual(cached_file.num_requests, 1)
+        cached_file.seek(-10, 2)
+        self.assertEqual(cached_file.read(), self.content[-10:])
+        self.assertEqual(cached_file.read(10), b"")
+
+    def test_eviction(self):
+        cached_file = CachedRangeFile(LocalRangeFetcher(self.path), block_size=1000, max_blocks=2)
+        for start in (0, 5000, 9000, 0):
+            cached_file.seek(start)
+            self.assertEqual(cached_file.read(10), self.content[start : start + 10])
+        self.assertEqual(cached_file.num_requests, 4)
+
+    def test_read_larger_than_cache(self):
+        cached_file = CachedRangeFile(LocalRangeFetcher(self.path), block_size=100, max_blocks=4)
+        self.assertEqual(cached_file.read(1000), self.content[:1000])
+        self.assertEqual(cached_file.num_requests, 1)
+        self.assertEqual(len(cached_file._blocks), 4)
+
+    def test_read_partly_cached_range_with_full_cache(self):
+        cached_file = CachedRangeFile(LocalRangeFetcher(self.path), block_size=1000, max_blocks=4)
+        # blocks 2 and 3 are the least recently used blocks of the full cache
+        for start in (2000, 0):
+            cached_file.seek(start)
+            cached_file.read(2000)
+        cached_file.seek(2500)
+        self.assertEqual(cached_file.read(2000), self.content[2500:4500])
+        self.assertEqual(cached_file.num_requests, 3)
+        self.assertEqual(len(cached_file._blocks), 4)
+
+    def test_prefetch_coalesces_ranges(self):
+        cached_file = CachedRangeFile(LocalRangeFetcher(self.path), block_size=1000)
+        self.assertEqual(cached_file.prefetch([(100, 200), (2100, 2200), (4100, 4200)], max_gap_blocks=1), 1)
+        self.assertEqual(cached_file.prefetch([(9100, 9200)], max_gap_blocks=1), 1)
+        self.assertEqual(cached_file.num_requests, 2)
+        cached_file.seek(3000)
+        self.assertEqual(cached_file.read(1000), self.content[3000:4000])
+        self.assertEqual(cached_file.num_requests, 2)
+
+
+class TestOpenRemoteNWBFile(TestCase):
+
+    def setUp(self):
+        self.path = "test_remote.nwb"
+        with NWBHDF5IO(self.path, mode="w") as io:
+            io.write(mock_fiber_photometry_nwbfile(num_fibers=8, num_samples=50_000))
+        handler = partial(RangeRequestHandler, directory=os.getcwd())
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+        self.server.num_requests = 0
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = "http://127.0.0.1:%d/%s" % (self.server.server_address[1], self.path)
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        remove_test_file(self.path)
+
+    def read_fiber_photometry(self, io):
+        nwbfile = io.read()
+        table = nwbfile.lab_meta_data["fiber_photometry"].get_fiber_photometry_table()
+        dataframe = table.to_dataframe()
+        signal = nwbfile.acquisition["signal"].data[:300, 2]
+        return dataframe, signal
+
+    def test_read_over_http(self):
+        io, cached_file = open_remote_nwbfile(HTTPRangeFetcher(self.url))
+        with io:
+            dataframe, signal = self.read_fiber_photometry(io)
+        with NWBHDF5IO(self.path, mode="r") as local_io:
+            expected_dataframe, expected_signal = self.read_fiber_photometry(local_io)
+            np.testing.assert_array_equal(signal, expected_signal)
+            self.assertEqual(list(dataframe["location"]), list(expected_dataframe["location"]))
+        self.assertEqual(cached_file.num_requests, self.server.num_requests)
+        self.assertLess(cached_file.num_requests, 10)
+
+    def test_reopen_prefetches_metadata(self):
+        io, cached_file = open_remote_nwbfile(HTTPRangeFetcher(self.url), block_size=4096, head_size=4096)
+        with io:
+            expected_dataframe, _ = self.read_fiber_photometry(io)
+        requests_first_open = cached_file.num_requests
+
+        # the metadata ranges found on the first open are fetched with the head of the file
+        io, cached_file = open_remote_nwbfile(HTTPRangeFetcher(self.url), block_size=4096, head_size=4096)
+        with io:
+            dataframe, _ = self.read_fiber_photometry(io)
+        self.assertLess(cached_file.num_requests, requests_first_open)
+        self.assertEqual(list(dataframe["location"]), list(expected_dataframe["location"]))
+
+    @unittest.skipIf(not HAVE_FSSPEC, "fsspec is not installed")
+    def test_fsspec_fetcher(self):
+        fetcher = FsspecRangeFetcher(os.path.abspath(self.path))
+        self.assertEqual(fetcher.size, os.path.getsize(self.path))
+        io, _ = open_remote_nwbfile(fetcher)
+        with io:
+            self.read_fiber_photometry(io)
+
+    @unittest.skipIf(not HAVE_FSSPEC, "fsspec is not installed")
+    def test_fsspec_fetcher_over_http(self):
+        fetcher = FsspecRangeFetcher(self.url)
+        self.assertEqual(fetcher.size, os.path.getsize(self.path))
+        io, cached_file = open_remote_nwbfile(fetcher)
+        with io:
+            dataframe, _ = self.read_fiber_photometry(io)
+        self.assertEqual(list(dataframe["location"]), ["VTA", "NAc"] * 4)
+        self.assertGreater(cached_file.num_requests, 0)
@@ -0,0 +1,179 @@
+import os
+
+import h5py
+import numpy as np
+
+from pynwb import NWBHDF5IO
+from pynwb.testing import TestCase, remove_test_file
+from pynwb.testing.mock.file import mock_NWBFile
+
+from ndx_fiber_photometry import (
+    CommandedVoltageSeries,
+    FiberPhotometryResponseSeries,
+    add_rig_to_nwbfile,
+    clear_rig_cache,
+    load_rig,
+    open_session_file,
+    write_rig_file,
+    write_session_file,
+)
+
+from .mock import mock_fiber_photometry_nwbfile
+
+TABLE_PATH = "/general/fiber_photometry/fiber_photometry_table"
+
+
+def mock_rig_nwbfile(num_fibers=3, encoded=False):
+    nwbfile = mock_fiber_photometry_nwbfile(num_fibers=num_fibers, encoded=encoded)
+    nwbfile.acquisition.pop("signal")
+    return nwbfile
+
+
+class TestRigFile(TestCase):
+
+    def setUp(self):
+        self.rig_path = "test_rig.nwb"
+        self.session_paths = ["test_rig_session_%d.nwb" % index for index in range(2)]
+        write_rig_file(mock_rig_nwbfile(), self.rig_path)
+
+    def tearDown(self):
+        clear_rig_cache()
+        for path in [self.rig_path] + self.session_paths:
+            remove_test_file(path)
+
+    def write_session(self, path, value):
+        nwbfile = mock_NWBFile()
+        table = add_rig_to_nwbfile(nwbfile, self.rig_path)
+        nwbfile.add_acquisition(
+            FiberPhotometryResponseSeries(
+                name="signal",
+                description="fluorescence of the fibers",
+                data=np.full((10, 3), value),
+                unit="n.a.",
+                rate=10.0,
+                fiber_photometry_table_region=table.create_fiber_photometry_table_region(
+                    region=[0, 1, 2], description="all fibers"
+                ),
+            )
+        )
+        write_session_file(nwbfile, path, self.rig_path)
+
+    def test_session_links_to_rig(self):
+        self.write_session(self.session_paths[0], 1.0)
+        with h5py.File(self.session_paths[0], "r") as f:
+            for name in f["/general/devices"]:
+                if name != "models":
+                    link = f["/general/devices"].get(name, getlink=True)
+                    self.assertIsInstance(link, h5py.ExternalLink)
+                    self.assertEqual(link.filename, self.rig_path)
+            link = f["/general/fiber_photometry"].get("fiber_photometry_indicators", getlink=True)
+            self.assertIsInstance(link, h5py.ExternalLink)
+            # the table is a group of the session, its id and columns are links to the rig table
+            self.assertIsInstance(
+                f["/general/fiber_photometry"].get("fiber_photometry_table", getlink=True), h5py.HardLink
+            )
+            for name in f[TABLE_PATH]:
+                self.assertIsInstance(f[TABLE_PATH].get(name, getlink=True), h5py.ExternalLink)
+
+    def test_read_with_nwbhdf5io(self):
+        self.write_session(self.session_paths[0], 1.0)
+        with NWBHDF5IO(self.rig_path, mode="r") as io:
+            expected = io.read().lab_meta_data["fiber_photometry"].get_fiber_photometry_table().to_dataframe()
+        with NWBHDF5IO(self.session_paths[0], mode="r") as io:
+            nwbfile = io.read()
+            table = nwbfile.lab_meta_data["fiber_photometry"].get_fiber_photometry_table()
+            self.assertIs(nwbfile.acquisition["signal"].fiber_photometry_table_region.table, table)
+            dataframe = table.to_dataframe()
+            self.assertEqual(list(dataframe.columns), list(expected.columns))
+            self.assertEqual(list(dataframe["location"]), list(expected["location"]))
+            self.assertEqual(
+                [fiber.name for fiber in dataframe["optical_fiber"]],
+                [fiber.name for fiber in expected["optical_fiber"]],
+            )
+            self.assertIs(table["optical_fiber"][1], nwbfile.devices["optical_fiber_1"])
+
+    def test_open_session_file_shares_rig_objects(self):
+        for value, path in enumerate(self.session_paths):
+            self.write_session(path, value)
+        clear_rig_cache()
+        ios = [open_session_file(path) for path in self.session_paths]
+        try:
+            first, second = [io.read() for io in ios]
+            rig = load_rig(self.rig_path)
+            self.assertIs(first.devices["optical_fiber_0"], rig.devices["optical_fiber_0"])
+            self.assertIs(second.devices["optical_fiber_0"], rig.devices["optical_fiber_0"])
+            first_table = first.lab_meta_data["fiber_photometry"].get_fiber_photometry_table()
+            second_table = second.lab_meta_data["fiber_photometry"].get_fiber_photometry_table()
+            self.assertIs(first_table["optical_fiber"], second_table["optical_fiber"])
+            self.assertIs(
+                second_table["indicator"][0],
+                rig.lab_meta_data["fiber_photometry"].fiber_photometry_indicators.indicators["indicator"],
+            )
+            np.testing.assert_array_equal(second.acquisition["signal"].data[:], np.ones((10, 3)))
+        finally:
+            for io in ios:
+                io.close()
+
+    def test_session_columns(self):
+        nwbfile = mock_NWBFile()
+        table = add_rig_to_nwbfile(nwbfile, self.rig_path)
+        commanded_voltage_series = CommandedVoltageSeries(
+            name="commanded_voltage", description="LED voltage", data=np.ones(10), unit="volts", rate=10.0
+        )
+        nwbfile.add_acquisition(commanded_voltage_series)
+        table.add_column(
+            name="commanded_voltage_series",
+            description="commanded voltage of the excitation source",
+            data=[commanded_voltage_series] * 3,
+        )
+        write_session_file(nwbfile, self.session_paths[0], self.rig_path)
+
+        with h5py.File(self.session_paths[0], "r") as f:
+            link = f[TABLE_PATH].get("commanded_voltage_series", getlink=True)
+            self.assertIsInstance(link, h5py.HardLink)
+        with h5py.File(self.rig_path, "r") as f:
+            self.assertNotIn("commanded_voltage_series", f[TABLE_PATH])
+        with NWBHDF5IO(self.session_paths[0], mode="r") as io:
+            read_nwbfile = io.read()
+            table = read_nwbfile.lab_meta_data["fiber_photometry"].get_fiber_photometry_table()
+            self.assertIs(table["commanded_voltage_series"][2], read_nwbfile.acquisition["commanded_voltage"])
+            self.assertEqual(list(table["location"][:]), ["VTA", "NAc", "VTA"])
+
+    def test_encoded_rig(self):
+        write_rig_file(mock_rig_nwbfile(encoded=True), self.rig_path)
+        self.write_session(self.session_paths[0], 1.0)
+        with NWBHDF5IO(self.session_paths[0], mode="r") as io:
+            table = io.read().lab_meta_data["fiber_photometry"].get_fiber_photometry_table()
+            self.assertEqual(
+                [fiber.name for fiber in table["optical_fiber"][:]], ["optical_fiber_%d" % i for i in range(3)]
+            )
+
+    def test_load_rig_cache(self):
+        rig = load_rig(self.rig_path)
+        self.assertIs(load_rig(os.path.abspath(self.rig_path)), rig)
+        # a rig written again is read again
+        write_rig_file(mock_rig_nwbfile(num_fibers=4), self.rig_path)
+        reloaded = load_rig(self.rig_path)
+        self.assertIsNot(reloaded, rig)
+        self.assertEqual(len(reloaded.lab_meta_data["fiber_photometry"].get_fiber_photometry_table()), 4)
+
+    def test_clear_rig_cache_closes_replaced_rigs(self):
+        rig = load_rig(self.rig_path)
+        # a rig replaced on disk by another process is read again, and its previous read stays open until cleared
+        replacement_path = "test_rig_replacement.nwb"
+        self.session_paths.append(replacement_path)
+        with NWBHDF5IO(replacement_path, mode="w") as io:
+            io.write(mock_rig_nwbfile(num_fibers=4))
+        os.replace(replacement_path, self.rig_path)
+        reloaded = load_rig(self.rig_path)
+        self.assertIsNot(reloaded, rig)
+        self.assertEqual(len(rig.lab_meta_data["fiber_photometry"].get_fiber_photometry_table()["location"][:]), 3)
+        clear_rig_cache()
+        for nwbfile in (rig, reloaded):
+            self.assertFalse(nwbfile.read_io._file.id.valid)
+
+    def test_rig_file_holds_metadata_only(self):
+        with self.assertRaises(ValueError):
+            write_rig_file(mock_fiber_photometry_nwbfile(), self.rig_path)
+        with self.assertRaises(ValueError):
+            write_rig_file(mock_NWBFile(), self.rig_path)
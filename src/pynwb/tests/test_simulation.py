@@ -0,0 +1,92 @@
+import numpy as np
+
+from pynwb import NWBHDF5IO
+from pynwb.testing import TestCase, remove_test_file
+from pynwb.testing.mock.file import mock_NWBFile
+
+from ndx_fiber_photometry import FiberPhotometrySimulation, SimulatedDataIterator, detect_transients
+
+
+class TestFiberPhotometrySimulation(TestCase):
+
+    def setUp(self):
+        self.simulation = FiberPhotometrySimulation(num_fibers=3, duration_in_s=1200.0, rate=100.0, seed=7)
+
+    def test_independent_of_chunking(self):
+        num_samples = self.simulation.num_samples
+        for channel in self.simulation.channels:
+            expected = self.simulation.generate(channel, 0, num_samples)
+            chunks = [self.simulation.generate(channel, start, start + 9_999) for start in range(0, num_samples, 9_999)]
+            np.testing.assert_allclose(np.concatenate(chunks), expected, rtol=1e-12, atol=1e-12, err_msg=channel)
+
+    def test_seed(self):
+        same = FiberPhotometrySimulation(num_fibers=3, duration_in_s=1200.0, rate=100.0, seed=7)
+        other = FiberPhotometrySimulation(num_fibers=3, duration_in_s=1200.0, rate=100.0, seed=8)
+        data = self.simulation.generate("signal", 5000, 6000)
+        np.testing.assert_array_equal(same.generate("signal", 5000, 6000), data)
+        self.assertFalse(np.allclose(other.generate("signal", 5000, 6000), data))
+
+    def test_signal_features(self):
+        signal = self.simulation.generate("signal", 0, self.simulation.num_samples)
+        isosbestic = self.simulation.generate("isosbestic", 0, self.simulation.num_samples)
+        # photobleaching
+        self.assertTrue((np.median(signal[:6000], axis=0) > np.median(signal[-6000:], axis=0)).all())
+        self.assertTrue((np.median(isosbestic[:6000], axis=0) > np.median(isosbestic[-6000:], axis=0)).all())
+        # transients, in the 470 nm channel only
+        self.assertGreater(np.percentile(signal / np.median(signal, axis=0), 99.9), 1.05)
+
+    def test_modulation(self):
+        simulation = FiberPhotometrySimulation(
+            num_fibers=2, duration_in_s=10.0, rate=2000.0, modulation_frequencies_in_hz=(211.0, 531.0)
+        )
+        self.assertEqual(simulation.channels, ("raw", "commanded_voltage_470", "commanded_voltage_405"))
+        raw = simulation.generate("raw", 0, simulation.num_samples)
+        spectrum = np.abs(np.fft.rfft(raw - raw.mean(axis=0), axis=0))
+        frequencies = np.fft.rfftfreq(simulation.num_samples, 1 / simulation.rate)
+        strongest = np.sort(frequencies[np.argsort(spectrum[:, 0])[-2:]])
+        np.testing.assert_allclose(strongest, [211.0, 531.0], atol=0.5)
+        with self.assertRaises(ValueError):
+            FiberPhotometrySimulation(rate=1000.0, modulation_frequencies_in_hz=(211.0, 531.0))
+
+    def test_iterator(self):
+        iterator = self.simulation.iterator("isosbestic", buffer_size=25_000)
+        self.assertIsInstance(iterator, SimulatedDataIterator)
+        self.assertEqual(iterator.maxshape, (120_000, 3))
+        self.assertEqual(iterator.buffer_shape, (30_000, 3))
+        chunks = [chunk.data for chunk in iterator]
+        np.testing.assert_allclose(
+            np.concatenate(chunks), self.simulation.generate("isosbestic", 0, 120_000), rtol=1e-12, atol=1e-12
+        )
+
+
+class TestSimulatedNWBFile(TestCase):
+
+    def setUp(self):
+        self.path = "test_simulation.nwb"
+        self.simulation = FiberPhotometrySimulation(num_fibers=4, duration_in_s=300.0, rate=50.0, seed=3)
+
+    def tearDown(self):
+        remove_test_file(self.path)
+
+    def test_roundtrip(self):
+        nwbfile = self.simulation.add_to_nwbfile(mock_NWBFile(), buffer_size=4000)
+        with NWBHDF5IO(self.path, mode="w") as io:
+            io.write(nwbfile)
+
+        with NWBHDF5IO(self.path, mode="r") as io:
+            read_nwbfile = io.read()
+            fiber_photometry = read_nwbfile.lab_meta_data["fiber_photometry"]
+            table = fiber_photometry.get_fiber_photometry_table()
+            self.assertEqual(len(table), 8)
+            np.testing.assert_array_equal(table["excitation_wavelength_in_nm"][:], [470.0] * 4 + [405.0] * 4)
+            np.testing.assert_allclose(table["coordinates"][:4, 0], [0.0, 0.25, 0.5, 0.75])
+            self.assertEqual(len(fiber_photometry.fiber_photometry_viruses.viral_vectors), 1)
+            self.assertIs(table["commanded_voltage_series"][0], read_nwbfile.acquisition["commanded_voltage_470"])
+
+            for name, rows in (("signal", [0, 1, 2, 3]), ("isosbestic", [4, 5, 6, 7])):
+                series = read_nwbfile.acquisition[name]
+                self.assertEqual(list(series.fiber_photometry_table_region.data[:]), rows)
+                np.testing.assert_allclose(
+                    series.data[:], self.simulation.generate(name, 0, self.simulation.num_samples), rtol=1e-12
+                )
+            self.assertGreater(len(detect_transients(read_nwbfile.acquisition["signal"], threshold=5.0)), 0)
@@ -0,0 +1,97 @@
+import numpy as np
+
+from pynwb import NWBHDF5IO
+from pynwb.testing import TestCase, remove_test_file
+
+from ndx_fiber_photometry import FiberPhotometryResponseSeries, compute_cross_spectra
+
+from .mock import mock_fiber_photometry_nwbfile
+
+RATE = 100.0
+NUM_SAMPLES = 10_000
+
+
+def reference_cross_spectra(data, segment_length, step):
+    """Welch cross-spectral density computed segment by segment over the whole array."""
+    window = np.hanning(segment_length + 1)[:-1]
+    csd = 0
+    starts = range(0, len(data) - segment_length + 1, step)
+    for start in starts:
+        segment = data[start : start + segment_length]
+        spectrum = np.fft.rfft((segment - segment.mean(axis=0)) * window[:, np.newaxis], axis=0)
+        csd = csd + spectrum.conj()[:, :, np.newaxis] * spectrum[:, np.newaxis, :]
+    csd = csd / (RATE * (window**2).sum() * len(starts))
+    csd[1:-1] *= 2
+    return csd
+
+
+class TestComputeCrossSpectra(TestCase):
+
+    def setUp(self):
+        self.path = "test_spectral.nwb"
+        rng = np.random.default_rng(0)
+        # fibers 0-2 share a 10 Hz oscillation whose weight decreases with distance along x; fiber 3 is noise
+        time_in_s = np.arange(NUM_SAMPLES) / RATE
+        common = np.sin(2 * np.pi * 10.0 * time_in_s + rng.uniform(0, 0.5, NUM_SAMPLES).cumsum() * 0.01)
+        self.data = rng.normal(0.0, 1.0, (NUM_SAMPLES, 4))
+        self.data[:, :3] += common[:, np.newaxis] * np.array([4.0, 4.0, 1.0])
+        self.coordinates = np.array([[0.0, 0.0, 0.0], [0.1, 0.0, 0.0], [1.0, 0.0, 0.0], [1.05, 0.0, 0.0]])
+        nwbfile = mock_fiber_photometry_nwbfile(num_fibers=4, rate=RATE, data=self.data, coordinates=self.coordinates)
+        with NWBHDF5IO(self.path, mode="w") as io:
+            io.write(nwbfile)
+
+    def tearDown(self):
+        remove_test_file(self.path)
+
+    def test_matches_reference(self):
+        with NWBHDF5IO(self.path, mode="r") as io:
+            spectra = compute_cross_spectra(io.read().acquisition["signal"], segment_length=128, chunk_size=1000)
+        expected = reference_cross_spectra(self.data, 128, 64)
+        np.testing.assert_allclose(spectra.cross_spectral_density, expected, rtol=1e-10, atol=1e-14)
+        self.assertEqual(spectra.num_segments, (NUM_SAMPLES - 128) // 64 + 1)
+        np.testing.assert_array_equal(spectra.frequencies, np.fft.rfftfreq(128, 1 / RATE))
+        # white noise of unit variance has a one-sided density of 2 / RATE
+        self.assertAlmostEqual(np.median(spectra.power_spectral_density[:, 3]), 2 / RATE, delta=0.2 / RATE)
+
+    def test_phase_convention(self):
+        # fiber 1 lags fiber 0 by a quarter period of a 10 Hz oscillation
+        time_in_s = np.arange(NUM_SAMPLES) / RATE
+        data = np.column_stack([np.sin(2 * np.pi * 10.0 * time_in_s), np.sin(2 * np.pi * 10.0 * time_in_s - np.pi / 2)])
+        series = FiberPhotometryResponseSeries(name="signal", description="signal", data=data, unit="n.a.", rate=RATE)
+        spectra = compute_cross_spectra(series, segment_length=100)
+        peak = np.argmin(np.abs(spectra.frequencies - 10.0))
+        # as scipy.signal.csd(x_0, x_1), whose phase is negative when x_1 lags x_0
+        self.assertAlmostEqual(np.angle(spectra.cross_spectral_density[peak, 0, 1]), -np.pi / 2, places=6)
+        self.assertAlmostEqual(np.angle(spectra.cross_spectral_density[peak, 1, 0]), np.pi / 2, places=6)
+
+    def test_independent_of_chunk_size(self):
+        with NWBHDF5IO(self.path, mode="r") as io:
+            signal = io.read().acquisition["signal"]
+            expected = compute_cross_spectra(signal, chunk_size=NUM_SAMPLES).cross_spectral_density
+            for chunk_size in (100, 777):
+                np.testing.assert_allclose(
+                    compute_cross_spectra(signal, chunk_size=chunk_size).cross_spectral_density, expected, rtol=1e-10
+                )
+
+    def test_coherence_by_distance(self):
+        with NWBHDF5IO(self.path, mode="r") as io:
+            spectra = compute_cross_spectra(io.read().acquisition["signal"], chunk_size=1000)
+            self.assertEqual(list(spectra.fiber_photometry_table_rows), [0, 1, 2, 3])
+            coherence = spectra.coherence
+            np.testing.assert_allclose(np.einsum("fii->fi", coherence), 1.0)
+            binned = spectra.coherence_by_distance(bins=[0.0, 0.5, 1.5], frequency_range=(9.0, 11.0))
+        self.assertEqual(list(binned["num_pairs"]), [2, 4])
+        # pairs closer than 0.5 mm: (0, 1), which share the oscillation, and (2, 3), which do not
+        peak = (spectra.frequencies >= 9.0) & (spectra.frequencies <= 11.0)
+        expected = (coherence[peak, 0, 1].mean() + coherence[peak, 2, 3].mean()) / 2
+        self.assertAlmostEqual(binned["mean_coherence"][0], expected)
+        self.assertGreater(coherence[peak, 0, 1].mean(), 0.5)
+        self.assertLess(coherence[peak, 2, 3].mean(), 0.1)
+
+    def test_explicit_coordinates(self):
+        series = mock_fiber_photometry_nwbfile(num_fibers=4, rate=RATE, data=self.data).acquisition["signal"]
+        spectra = compute_cross_spectra(series)
+        with self.assertRaises(ValueError):
+            spectra.coherence_by_distance()
+        binned = spectra.coherence_by_distance(bins=2, coordinates=self.coordinates)
+        self.assertEqual(binned["num_pairs"].sum(), 6)
@@ -0,0 +1,78 @@
+import h5py
+import numpy as np
+
+from pynwb import NWBHDF5IO
+from pynwb.testing import TestCase, remove_test_file
+from pynwb.testing.mock.file import mock_NWBFile
+
+from ndx_fiber_photometry import FiberPhotometryResponseSeries, CommandedVoltageSeries, load_timestamps
+
+
+class TestSharedTimestamps(TestCase):
+
+    def setUp(self):
+        self.path = "test_timestamps.nwb"
+        self.timestamps = np.cumsum(np.random.default_rng(0).uniform(0.009, 0.011, 1000))
+
+    def tearDown(self):
+        remove_test_file(self.path)
+
+    def write(self):
+        other_timestamps = self.timestamps.copy()
+        other_timestamps[500] += 1e-6
+        nwbfile = mock_NWBFile()
+        for name, timestamps in (
+            ("signal", self.timestamps),
+            ("isosbestic", self.timestamps.copy()),
+            ("other_clock", other_timestamps),
+        ):
+            nwbfile.add_acquisition(
+                FiberPhotometryResponseSeries(
+                    name=name, description=name, data=np.zeros((1000, 2)), unit="n.a.", timestamps=timestamps
+                )
+            )
+        nwbfile.add_acquisition(
+            CommandedVoltageSeries(
+                name="commanded_voltage_series",
+                description="commanded voltage",
+                data=np.zeros(1000),
+                unit="volts",
+                timestamps=list(self.timestamps),
+            )
+        )
+        with NWBHDF5IO(self.path, mode="w") as io:
+            io.write(nwbfile)
+
+    def test_identical_timestamps_are_written_once(self):
+        self.write()
+        with h5py.File(self.path, "r") as f:
+            acquisition = f["acquisition"]
+            self.assertIsInstance(acquisition["signal"].get("timestamps", getlink=True), h5py.HardLink)
+            self.assertIsInstance(acquisition["other_clock"].get("timestamps", getlink=True), h5py.HardLink)
+            for name in ("isosbestic", "commanded_voltage_series"):
+                link = acquisition[name].get("timestamps", getlink=True)
+                self.assertIsInstance(link, h5py.SoftLink)
+                self.assertEqual(link.path, "/acquisition/signal/timestamps")
+
+    def test_read_shared_timestamps(self):
+        self.write()
+        with NWBHDF5IO(self.path, mode="r") as io:
+            acquisition = io.read().acquisition
+            np.testing.assert_array_equal(acquisition["isosbestic"].timestamps[:], self.timestamps)
+            self.assertIs(acquisition["isosbestic"].timestamps, acquisition["signal"].timestamps)
+
+            shared = load_timestamps(acquisition["signal"])
+            self.assertIs(load_timestamps(acquisition["isosbestic"]), shared)
+            self.assertIs(load_timestamps(acquisition["commanded_voltage_series"]), shared)
+            self.assertIsNot(load_timestamps(acquisition["other_clock"]), shared)
+            np.testing.assert_array_equal(shared, self.timestamps)
+
+    def test_load_timestamps_in_memory(self):
+        series = FiberPhotometryResponseSeries(
+            name="signal", description="signal", data=np.zeros(3), unit="n.a.", timestamps=[0.0, 1.0, 2.0]
+        )
+        np.testing.assert_array_equal(load_timestamps(series), [0.0, 1.0, 2.0])
+        series = FiberPhotometryResponseSeries(
+            name="signal", description="signal", data=np.zeros(3), unit="n.a.", rate=1.0
+        )
+        self.assertIsNone(load_timestamps(series))
@@ -0,0 +1,109 @@
+import numpy as np
+from pandas.testing import assert_frame_equal
+
+from pynwb import NWBHDF5IO
+from pynwb.testing import TestCase, remove_test_file
+
+from ndx_fiber_photometry import FiberPhotometryResponseSeries, detect_transients
+
+from .mock import mock_fiber_photometry_nwbfile
+
+RATE = 20.0
+NUM_SAMPLES = 20_000
+# (sample, fiber) of each transient; the one at sample 4999 crosses the boundary of 5000-sample chunks
+ONSETS = [(1000, 0), (1000, 2), (4999, 1), (9000, 3), (15_000, 0)]
+
+
+def make_fluorescence(seed=0):
+    rng = np.random.default_rng(seed)
+    time_in_s = np.arange(NUM_SAMPLES) / RATE
+    data = 1.0 + 0.5 * np.exp(-time_in_s / 600.0)[:, np.newaxis] + rng.normal(0.0, 0.002, (NUM_SAMPLES, 4))
+    kernel = 0.2 * np.exp(-np.arange(int(2 * RATE)) / (0.2 * RATE))
+    for onset, fiber in ONSETS:
+        data[onset : onset + len(kernel), fiber] += kernel
+    return data
+
+
+class TestDetectTransients(TestCase):
+
+    def setUp(self):
+        self.path = "test_transients.nwb"
+        self.nwbfile = mock_fiber_photometry_nwbfile(num_fibers=5)
+        table = self.nwbfile.lab_meta_data["fiber_photometry"].get_fiber_photometry_table()
+        self.series = FiberPhotometryResponseSeries(
+            name="fluorescence",
+            description="fluorescence of fibers 1 to 4",
+            data=make_fluorescence(),
+            unit="n.a.",
+            rate=RATE,
+            starting_time=10.0,
+            fiber_photometry_table_region=table.create_fiber_photometry_table_region(
+                region=[1, 2, 3, 4], description="fibers 1 to 4"
+            ),
+        )
+        self.nwbfile.add_acquisition(self.series)
+
+    def tearDown(self):
+        remove_test_file(self.path)
+
+    def test_detects_all_transients(self):
+        transients = detect_transients(self.series, threshold=6.0)
+        dataframe = transients.to_dataframe(index=True)
+        np.testing.assert_allclose(dataframe["onset_time"], [10.0 + onset / RATE for onset, _ in ONSETS], atol=0.11)
+        self.assertEqual(list(dataframe["fiber_photometry_table_region"]), [1 + fiber for _, fiber in ONSETS])
+        self.assertTrue((dataframe["peak_time"] >= dataframe["onset_time"]).all())
+        self.assertTrue((dataframe["offset_time"] > dataframe["peak_time"]).all())
+        self.assertTrue((dataframe["peak_dff"] > 0.1).all())
+
+    def test_chunk_boundaries(self):
+        expected = detect_transients(self.series, threshold=6.0).to_dataframe(index=True)
+        for chunk_size in (5000, 3333):
+            dataframe = detect_transients(self.series, threshold=6.0, chunk_size=chunk_size).to_dataframe(index=True)
+            assert_frame_equal(dataframe, expected, check_exact=False, rtol=1e-9)
+
+    def test_noise_change_between_chunks(self):
+        rng = np.random.default_rng(1)
+        noise = np.where(np.arange(NUM_SAMPLES) < 5000, 0.002, 0.01)[:, np.newaxis]
+        data = 1.0 + noise * rng.normal(0.0, 1.0, (NUM_SAMPLES, 4))
+        # a slow ramp whose first samples cross the threshold earlier where the noise is lower
+        data[4900:5100, 1] += np.concatenate([np.linspace(0.0, 0.1, 100), np.linspace(0.1, 0.0, 100)])
+        series = FiberPhotometryResponseSeries(
+            name="noise_change",
+            description="noise five times larger from sample 5000",
+            data=data,
+            unit="n.a.",
+            rate=RATE,
+            fiber_photometry_table_region=self.series.fiber_photometry_table_region,
+        )
+        expected = detect_transients(series, threshold=4.0).to_dataframe(index=True)
+        self.assertIn(2, list(expected["fiber_photometry_table_region"]))
+        dataframe = detect_transients(series, threshold=4.0, chunk_size=5000).to_dataframe(index=True)
+        assert_frame_equal(dataframe, expected, check_exact=False, rtol=1e-9)
+
+    def test_max_duration(self):
+        transients = detect_transients(self.series, threshold=6.0, max_duration_in_s=0.1)
+        self.assertEqual(len(transients), 0)
+
+    def test_requires_region(self):
+        series = FiberPhotometryResponseSeries(
+            name="no_region", description="no region", data=make_fluorescence(), unit="n.a.", rate=RATE
+        )
+        with self.assertRaises(ValueError):
+            detect_transients(series)
+
+    def test_roundtrip(self):
+        expected = detect_transients(self.series, threshold=6.0, chunk_size=4096).to_dataframe(index=True)
+        module = self.nwbfile.create_processing_module(name="ophys", description="fiber photometry analysis")
+        module.add(detect_transients(self.series, threshold=6.0, chunk_size=4096))
+        with NWBHDF5IO(self.path, mode="w") as io:
+            io.write(self.nwbfile)
+
+        with NWBHDF5IO(self.path, mode="r") as io:
+            nwbfile = io.read()
+            transients = nwbfile.processing["ophys"]["transients"]
+            table = nwbfile.lab_meta_data["fiber_photometry"].get_fiber_photometry_table()
+            self.assertIs(transients["fiber_photometry_table_region"].table, table)
+            self.assertTrue(transients.to_dataframe(index=True).equals(expected))
+            # with the same chunking, reading the series from the file gives the same transients
+            read_transients = detect_transients(nwbfile.acquisition["fluorescence"], threshold=6.0, chunk_size=4096)
+            self.assertTrue(read_transients.to_dataframe(index=True).equals(expected))
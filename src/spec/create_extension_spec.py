@@ -7,7 +7,7 @@ def main():
     # these arguments were auto-generated from your cookiecutter inputs
     ns_builder = NWBNamespaceBuilder(
         name="""ndx-fiber-photometry""",
-        version="""0.2.3""",
+        version="""0.3.0""",
         doc="""This is an NWB extension for storing fiber photometry recordings and associated metadata.""",
         author=[
             "Alessandra Trapani",
@@ -32,6 +32,9 @@ def main():
     ns_builder.include_type("DynamicTableRegion", namespace="hdmf-common")
     ns_builder.include_type("VectorData", namespace="hdmf-common")
 
+    ns_builder.include_namespace("hdmf-experimental")
+    ns_builder.include_type("EnumData", namespace="hdmf-experimental")
+
     ns_builder.include_namespace("ndx-ophys-devices")
     ns_builder.include_type("Indicator", namespace="ndx-ophys-devices")
     ns_builder.include_type("ViralVector", namespace="ndx-ophys-devices")
@@ -152,6 +155,57 @@ def main():
         ],
     )
 
+    # The reference columns of FiberPhotometryTable, stored dictionary-encoded by EncodedFiberPhotometryTable
+    encoded_columns = [
+        ("indicator", "indicator", "Indicator", None),
+        ("optical_fiber", "optical fiber device", "OpticalFiber", None),
+        ("excitation_source", "excitation source device", "ExcitationSource", None),
+        ("commanded_voltage_series", "commanded voltage series", "CommandedVoltageSeries", "?"),
+        ("photodetector", "photodetector device", "Photodetector", None),
+        ("dichroic_mirror", "dichroic mirror device", "DichroicMirror", None),
+        ("emission_filter", "emission filter device", "OpticalFilter", "?"),
+        ("excitation_filter", "excitation filter device", "OpticalFilter", "?"),
+    ]
+    reference_columns = [name for name, _, _, _ in encoded_columns]
+    # The other columns are those of FiberPhotometryTable
+    encoded_datasets = [
+        NWBDatasetSpec.build_spec(dict(dataset))
+        for dataset in fiber_photometry_table.datasets
+        if dataset.name not in reference_columns
+    ]
+    for name, doc, target_type, quantity in encoded_columns:
+        optional = {} if quantity is None else {"quantity": quantity}
+        encoded_datasets.append(
+            NWBDatasetSpec(
+                name=name,
+                doc="Index of the %s of each row in %s_elements." % (doc, name),
+                dtype="uint8",
+                shape=(None,),
+                neurodata_type_inc="EnumData",
+                **optional,
+            )
+        )
+        encoded_datasets.append(
+            NWBDatasetSpec(
+                name="%s_elements" % name,
+                doc="Link to each unique %s referenced by %s." % (doc, name),
+                dtype=NWBRefSpec(target_type=target_type, reftype="object"),
+                shape=(None,),
+                neurodata_type_inc="VectorData",
+                **optional,
+            )
+        )
+    encoded_fiber_photometry_table = NWBGroupSpec(
+        neurodata_type_def="EncodedFiberPhotometryTable",
+        neurodata_type_inc="DynamicTable",
+        doc=(
+            "Alternative to FiberPhotometryTable with the same columns, whose reference columns are "
+            "dictionary-encoded. Each of these columns stores one index per row into a lookup dataset with one "
+            "reference per unique object."
+        ),
+        datasets=encoded_datasets,
+    )
+
     fiber_photometry_indicators = NWBGroupSpec(
         name="fiber_photometry_indicators",  # use fixed name, for use in FiberPhotometry
         neurodata_type_def="FiberPhotometryIndicators",
@@ -199,7 +253,20 @@ def main():
         groups=[
             NWBGroupSpec(
                 neurodata_type_inc="FiberPhotometryTable",
-                doc="The table containing the metadata on the Fiber Photometry system.",
+                doc=(
+                    "The table containing the metadata on the Fiber Photometry system. Exactly one of "
+                    "FiberPhotometryTable and EncodedFiberPhotometryTable must be present."
+                ),
+                quantity="?",
+            ),
+            NWBGroupSpec(
+                neurodata_type_inc="EncodedFiberPhotometryTable",
+                doc=(
+                    "The table containing the metadata on the Fiber Photometry system, with dictionary-encoded "
+                    "reference columns. Exactly one of FiberPhotometryTable and EncodedFiberPhotometryTable must be "
+                    "present."
+                ),
+                quantity="?",
             ),
             NWBGroupSpec(
                 neurodata_type_inc="FiberPhotometryIndicators",
@@ -264,6 +331,7 @@ def main():
         fiber_photometry_virus_injections,
         fiber_photometry_indicators,
         fiber_photometry_table,
+        encoded_fiber_photometry_table,
         fiber_photometry_lab_meta_data,
         fiberphotometryresponse_series,
         commandedvoltage_series,